@@ -120,6 +120,43 @@ else:
     }
     print("[*] Usando SQLite (desarrollo local)")
 
+# ============================================
+# CACHE
+# ============================================
+# El snapshot del dashboard (core.kpis) se invalida desde señales: la caché debe ser
+# compartida por todos los workers de gunicorn, o un worker seguiría sirviendo un
+# snapshot ya invalidado en otro. Se usa Redis (REDIS_URL) o Memcached (MEMCACHED_LOCATION)
+# si están configurados; si no, con PostgreSQL una tabla de la base (la crea la migración
+# core 0020_tabla_cache, cada lectura es una consulta); la caché en memoria solo sirve con
+# un proceso.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.getenv('MEMCACHED_LOCATION'),
+        }
+    }
+elif DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_siprosa',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # ============================================
 # PASSWORD VALIDATION
 # ============================================
@@ -315,6 +352,9 @@ REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": (
         "rest_framework.renderers.JSONRenderer",
     ),
+    
+    # Conflictos de versión (bloqueo optimista) → 412 / 409
+    "EXCEPTION_HANDLER": "core.concurrencia.manejador_excepciones",
 }
 
 # ============================================
@@ -339,4 +379,11 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# ============================================
+# KPIs
+# ============================================
+# Antigüedad máxima (segundos) del snapshot del dashboard en caché.
+# Se invalida antes ante cambios de Lote, Parada, Incidente u OrdenTrabajo.
+KPI_DASHBOARD_MAX_STALENESS = int(os.getenv("KPI_DASHBOARD_MAX_STALENESS", "60"))
+
 print("[OK] Configuracion cargada correctamente")
@@ -5,6 +5,7 @@ Configuración del Django Admin para SIPROSA MES
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from .concurrencia import ControlVersionAdminMixin
 from .models import (
     # Usuarios
     UserProfile, Rol, UsuarioRol,
@@ -12,14 +13,14 @@ from .models import (
     Ubicacion, Maquina, Producto, Formula, FormulaInsumo,
     EtapaProduccion, Turno, TipoDocumento,
     # Producción
-    Lote, LoteEtapa, Parada, ControlCalidad, LoteDocumento,
+    Lote, LoteEtapa, Parada, ControlCalidad, LoteDocumento, ResumenProduccionDiario,
     # Inventario
-    CategoriaInsumo, Insumo, LoteInsumo, LoteInsumoConsumo,
-    Repuesto, MovimientoInventario, ProductoTerminado,
-    AlertaInventario, ConteoFisico,
+    CategoriaInsumo, Insumo, LoteInsumo, LoteInsumoConsumo, GenealogiaLote, SaldoInsumo,
+    Repuesto, MovimientoInventario, CierreInventario, PronosticoInventario, ProductoTerminado,
+    AlertaInventario, ConteoFisico, ConteoFisicoLinea,
     # Mantenimiento
     TipoMantenimiento, PlanMantenimiento, OrdenTrabajo,
-    OrdenTrabajoRepuesto, HistorialMantenimiento, IndicadorMantenimiento,
+    OrdenTrabajoRepuesto, HistorialMantenimiento, IndicadorMantenimiento, UsoMaquina,
     # Incidentes
     TipoIncidente, Incidente, InvestigacionIncidente, AccionCorrectiva,
     # Auditoría
@@ -140,7 +141,7 @@ class LoteEtapaInline(admin.TabularInline):
 
 
 @admin.register(Lote)
-class LoteAdmin(admin.ModelAdmin):
+class LoteAdmin(ControlVersionAdminMixin, admin.ModelAdmin):
     list_display = ['codigo_lote', 'producto', 'estado', 'cantidad_producida', 'fecha_real_inicio', 'supervisor']
     list_filter = ['estado', 'prioridad', 'fecha_creacion', 'turno']
     search_fields = ['codigo_lote', 'producto__nombre']
@@ -155,7 +156,7 @@ class LoteAdmin(admin.ModelAdmin):
 
 
 @admin.register(LoteEtapa)
-class LoteEtapaAdmin(admin.ModelAdmin):
+class LoteEtapaAdmin(ControlVersionAdminMixin, admin.ModelAdmin):
     list_display = ['lote', 'etapa', 'orden', 'maquina', 'estado', 'operario', 'duracion_minutos']
     list_filter = ['estado', 'etapa', 'maquina']
     search_fields = ['lote__codigo_lote']
@@ -169,6 +170,14 @@ class ParadaAdmin(admin.ModelAdmin):
     readonly_fields = ['duracion_minutos']
 
 
+@admin.register(ResumenProduccionDiario)
+class ResumenProduccionDiarioAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'turno', 'maquina', 'producto', 'lotes', 'cantidad_producida', 'minutos_parada']
+    list_filter = ['turno', 'maquina', 'fecha']
+    date_hierarchy = 'fecha'
+    readonly_fields = ['fecha_actualizacion']
+
+
 @admin.register(ControlCalidad)
 class ControlCalidadAdmin(admin.ModelAdmin):
     list_display = ['lote_etapa', 'tipo_control', 'valor_medido', 'conforme', 'fecha_control', 'controlado_por']
@@ -210,6 +219,14 @@ class LoteInsumoAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_vencimiento'
 
 
+@admin.register(SaldoInsumo)
+class SaldoInsumoAdmin(admin.ModelAdmin):
+    list_display = ['insumo', 'ubicacion', 'estado', 'cantidad', 'lotes', 'fecha_actualizacion']
+    list_filter = ['estado', 'ubicacion']
+    search_fields = ['insumo__codigo', 'insumo__nombre']
+    readonly_fields = ['fecha_actualizacion']
+
+
 @admin.register(LoteInsumoConsumo)
 class LoteInsumoConsumoAdmin(admin.ModelAdmin):
     list_display = ['lote_produccion', 'insumo', 'cantidad_real', 'fecha_consumo', 'registrado_por']
@@ -218,6 +235,13 @@ class LoteInsumoConsumoAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_consumo'
 
 
+@admin.register(GenealogiaLote)
+class GenealogiaLoteAdmin(admin.ModelAdmin):
+    list_display = ['codigo_lote_proveedor', 'insumo', 'lote', 'cantidad', 'unidad', 'consumos', 'fecha_ultimo_consumo']
+    search_fields = ['codigo_lote_proveedor', 'insumo__codigo', 'lote__codigo_lote']
+    readonly_fields = ['fecha_primer_consumo', 'fecha_ultimo_consumo']
+
+
 @admin.register(Repuesto)
 class RepuestoAdmin(admin.ModelAdmin):
     list_display = ['codigo', 'nombre', 'categoria', 'stock_actual', 'stock_minimo', 'critico', 'activo']
@@ -233,6 +257,20 @@ class MovimientoInventarioAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha_movimiento']
 
 
+@admin.register(CierreInventario)
+class CierreInventarioAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'tipo_item', 'item_id', 'ubicacion', 'saldo']
+    list_filter = ['tipo_item', 'ubicacion', 'fecha']
+    date_hierarchy = 'fecha'
+
+
+@admin.register(PronosticoInventario)
+class PronosticoInventarioAdmin(admin.ModelAdmin):
+    list_display = ['tipo_item', 'item_id', 'consumo_diario_pronosticado', 'stock_actual', 'dias_cobertura', 'punto_reorden_sugerido', 'fecha_calculo']
+    list_filter = ['tipo_item', 'fecha_calculo']
+    search_fields = ['item_id']
+
+
 @admin.register(ProductoTerminado)
 class ProductoTerminadoAdmin(admin.ModelAdmin):
     list_display = ['lote', 'cantidad', 'fecha_vencimiento', 'estado', 'ubicacion']
@@ -243,7 +281,7 @@ class ProductoTerminadoAdmin(admin.ModelAdmin):
 
 @admin.register(AlertaInventario)
 class AlertaInventarioAdmin(admin.ModelAdmin):
-    list_display = ['tipo_item', 'tipo_alerta', 'nivel_urgencia', 'estado', 'fecha_generacion']
+    list_display = ['tipo_item', 'item_id', 'lote_item_id', 'tipo_alerta', 'nivel_urgencia', 'estado', 'fecha_generacion']
     list_filter = ['tipo_item', 'tipo_alerta', 'nivel_urgencia', 'estado']
     date_hierarchy = 'fecha_generacion'
 
@@ -256,6 +294,14 @@ class ConteoFisicoAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_planificada'
 
 
+@admin.register(ConteoFisicoLinea)
+class ConteoFisicoLineaAdmin(admin.ModelAdmin):
+    list_display = ['conteo', 'tipo_item', 'item_id', 'lote_item_id', 'posicion', 'cantidad_contada']
+    list_filter = ['tipo_item']
+    search_fields = ['conteo__codigo', 'posicion']
+    raw_id_fields = ['conteo']
+
+
 # ============================================
 # MANTENIMIENTO
 # ============================================
@@ -280,7 +326,7 @@ class OrdenTrabajoRepuestoInline(admin.TabularInline):
 
 
 @admin.register(OrdenTrabajo)
-class OrdenTrabajoAdmin(admin.ModelAdmin):
+class OrdenTrabajoAdmin(ControlVersionAdminMixin, admin.ModelAdmin):
     list_display = ['codigo', 'maquina', 'tipo', 'prioridad', 'estado', 'fecha_creacion', 'asignada_a']
     list_filter = ['tipo', 'prioridad', 'estado', 'fecha_creacion']
     search_fields = ['codigo', 'titulo']
@@ -303,6 +349,12 @@ class IndicadorMantenimientoAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_inicio'
 
 
+@admin.register(UsoMaquina)
+class UsoMaquinaAdmin(admin.ModelAdmin):
+    list_display = ['maquina', 'minutos_operacion', 'ciclos', 'fecha_actualizacion']
+    readonly_fields = ['fecha_actualizacion']
+
+
 # ============================================
 # INCIDENTES
 # ============================================
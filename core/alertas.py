@@ -0,0 +1,167 @@
+"""
+Generación de alertas de inventario para SIPROSA MES
+Escanea stock (Insumo vía SaldoInsumo, Repuesto) contra stock_minimo / punto_reorden
+y lotes (LoteInsumo, ProductoTerminado) próximos a vencer o vencidos.
+
+Cada chequeo es una única consulta por conjuntos; las alertas se deduplican contra
+las ACTIVAS existentes y se insertan con bulk_create, por lo que re-ejecutar el
+escaneo no genera duplicados.
+"""
+
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Insumo, LoteInsumo, Repuesto, ProductoTerminado, AlertaInventario
+from .inventario import stock_aprobado_subquery
+
+
+# Días de anticipación para alertar vencimientos
+DIAS_AVISO_VENCIMIENTO = 30
+
+
+def _nivel_stock(stock, minimo, critico=False):
+    if stock <= 0 or (critico and stock <= minimo):
+        return 'CRITICA'
+    return 'ALTA' if stock <= minimo else 'MEDIA'
+
+
+def _nivel_vencimiento(dias):
+    if dias < 0:
+        return 'CRITICA'
+    if dias <= 7:
+        return 'ALTA'
+    return 'MEDIA' if dias <= 15 else 'BAJA'
+
+
+def _alerta_stock(tipo_item, item, stock, unidad, critico=False):
+    """Alerta STOCK_MINIMO (si está bajo el mínimo) o PUNTO_REORDEN"""
+    bajo_minimo = stock <= item['stock_minimo']
+    tipo_alerta = 'STOCK_MINIMO' if bajo_minimo else 'PUNTO_REORDEN'
+    limite = item['stock_minimo'] if bajo_minimo else item['punto_reorden']
+    return AlertaInventario(
+        tipo_item=tipo_item,
+        item_id=item['id'],
+        tipo_alerta=tipo_alerta,
+        nivel_urgencia=_nivel_stock(stock, item['stock_minimo'], critico),
+        mensaje=(
+            f"{item['codigo']} - {item['nombre']}: stock {stock} {unidad} "
+            f"{'bajo el mínimo' if bajo_minimo else 'en punto de reorden'} ({limite} {unidad})"
+        ),
+        stock_actual=stock,
+        stock_minimo=item['stock_minimo'],
+    )
+
+
+def _alerta_vencimiento(tipo_item, item_id, lote_item_id, descripcion, fecha_vencimiento, cantidad, unidad, hoy):
+    """Alerta VENCIDO o VENCIMIENTO_PROXIMO de un lote"""
+    dias = (fecha_vencimiento - hoy).days
+    vencido = dias < 0
+    return AlertaInventario(
+        tipo_item=tipo_item,
+        item_id=item_id,
+        lote_item_id=lote_item_id,
+        tipo_alerta='VENCIDO' if vencido else 'VENCIMIENTO_PROXIMO',
+        nivel_urgencia=_nivel_vencimiento(dias),
+        mensaje=(
+            f"{descripcion}: {'vencido el' if vencido else 'vence el'} {fecha_vencimiento:%d/%m/%Y}"
+            f"{'' if vencido else f' ({dias} días)'} - cantidad {cantidad} {unidad}"
+        ),
+        fecha_vencimiento_item=fecha_vencimiento,
+        dias_para_vencimiento=dias,
+        stock_actual=cantidad,
+    )
+
+
+def alertas_stock_insumos():
+    """Insumos activos con stock aprobado ≤ punto de reorden (una consulta)"""
+    insumos = Insumo.objects.filter(activo=True).annotate(
+        stock=stock_aprobado_subquery()
+    ).filter(
+        Q(stock__lte=F('punto_reorden')) | Q(stock__lte=F('stock_minimo'))
+    ).values('id', 'codigo', 'nombre', 'unidad_medida', 'stock', 'stock_minimo', 'punto_reorden')
+    for insumo in insumos.iterator(chunk_size=2000):
+        yield _alerta_stock('INSUMO', insumo, insumo['stock'], insumo['unidad_medida'])
+
+
+def alertas_stock_repuestos():
+    """Repuestos activos con stock ≤ punto de reorden (una consulta)"""
+    repuestos = Repuesto.objects.filter(activo=True).filter(
+        Q(stock_actual__lte=F('punto_reorden')) | Q(stock_actual__lte=F('stock_minimo'))
+    ).values('id', 'codigo', 'nombre', 'stock_actual', 'stock_minimo', 'punto_reorden', 'critico')
+    for repuesto in repuestos.iterator(chunk_size=2000):
+        yield _alerta_stock('REPUESTO', repuesto, repuesto['stock_actual'], 'u', repuesto['critico'])
+
+
+def alertas_vencimiento_insumos(hoy, dias_aviso):
+    """Lotes de insumo con stock que vencen dentro de `dias_aviso` o ya vencidos (una consulta)"""
+    lotes = LoteInsumo.objects.filter(
+        estado__in=['CUARENTENA', 'APROBADO'],
+        cantidad_actual__gt=0,
+        fecha_vencimiento__lte=hoy + timedelta(days=dias_aviso),
+    ).values(
+        'id', 'insumo_id', 'insumo__codigo', 'codigo_lote_proveedor', 'fecha_vencimiento', 'cantidad_actual', 'unidad'
+    )
+    for lote in lotes.iterator(chunk_size=2000):
+        yield _alerta_vencimiento(
+            'INSUMO', lote['insumo_id'], lote['id'],
+            f"{lote['insumo__codigo']} lote {lote['codigo_lote_proveedor']}",
+            lote['fecha_vencimiento'], lote['cantidad_actual'], lote['unidad'], hoy,
+        )
+
+
+def alertas_vencimiento_productos(hoy, dias_aviso):
+    """Productos terminados en stock que vencen dentro de `dias_aviso` o ya vencidos (una consulta)"""
+    productos = ProductoTerminado.objects.exclude(estado='VENCIDO').filter(
+        fecha_vencimiento__lte=hoy + timedelta(days=dias_aviso),
+    ).values(
+        'id', 'lote__producto_id', 'lote__producto__codigo', 'lote__codigo_lote', 'fecha_vencimiento', 'cantidad', 'unidad'
+    )
+    for producto in productos.iterator(chunk_size=2000):
+        yield _alerta_vencimiento(
+            'PRODUCTO_TERMINADO', producto['lote__producto_id'], producto['id'],
+            f"{producto['lote__producto__codigo']} lote {producto['lote__codigo_lote']}",
+            producto['fecha_vencimiento'], producto['cantidad'], producto['unidad'], hoy,
+        )
+
+
+def _clave(alerta):
+    return (alerta.tipo_item, alerta.item_id, alerta.lote_item_id, alerta.tipo_alerta)
+
+
+def generar_alertas_inventario(dias_aviso=DIAS_AVISO_VENCIMIENTO, hoy=None, dry_run=False):
+    """
+    Ejecuta todos los chequeos y crea las alertas que no tengan ya una ACTIVA con la
+    misma clave (tipo_item, item_id, lote_item_id, tipo_alerta).
+    Retorna la cantidad de alertas nuevas por tipo de alerta.
+    """
+    hoy = hoy or timezone.localdate()
+
+    activas = set(
+        AlertaInventario.objects.filter(estado='ACTIVA').values_list(
+            'tipo_item', 'item_id', 'lote_item_id', 'tipo_alerta'
+        )
+    )
+
+    nuevas = []
+    chequeos = (
+        alertas_stock_insumos(),
+        alertas_stock_repuestos(),
+        alertas_vencimiento_insumos(hoy, dias_aviso),
+        alertas_vencimiento_productos(hoy, dias_aviso),
+    )
+    for chequeo in chequeos:
+        for alerta in chequeo:
+            clave = _clave(alerta)
+            if clave not in activas:
+                activas.add(clave)
+                nuevas.append(alerta)
+
+    if not dry_run:
+        AlertaInventario.objects.bulk_create(nuevas, batch_size=1000)
+
+    resumen = {codigo: 0 for codigo, _ in AlertaInventario.TIPO_ALERTA_CHOICES}
+    for alerta in nuevas:
+        resumen[alerta.tipo_alerta] += 1
+    return resumen
@@ -0,0 +1,164 @@
+"""
+Control de concurrencia optimista para SIPROSA MES
+Lote, LoteEtapa y OrdenTrabajo llevan una columna `version` que aumenta en cada
+escritura. El save() de VersionadoMixin incluye la versión en el mismo UPDATE:
+
+    UPDATE ... SET ..., version = v + 1 WHERE id = %s AND version = v
+
+Si otro usuario guardó antes, el UPDATE no afecta filas y se lanza ConflictoVersion
+(sin consulta adicional en el caso normal). La API expone la versión como ETag y
+rechaza con 412 los PUT/PATCH cuyo If-Match no coincide con la versión vigente.
+Un ConflictoVersion que escape de cualquier vista de la API se responde con 412 (si el
+request traía If-Match) o 409 desde manejador_excepciones; en el admin, con un mensaje.
+"""
+
+from django.contrib import messages
+from django.db import DatabaseError
+from django.http import HttpResponseRedirect
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+
+class ConflictoVersion(DatabaseError):
+    """
+    La fila cambió (otra versión) desde que se leyó la instancia. Lleva la versión
+    vigente, leída antes de lanzarse: dentro de un atomic() la transacción queda
+    marcada para rollback y ya no admite consultas.
+    """
+
+    def __init__(self, mensaje, version_actual=None):
+        super().__init__(mensaje)
+        self.version_actual = version_actual
+
+
+class VersionadoMixin:
+    """
+    Mixin de modelo con bloqueo optimista sobre el campo `version`: cada save() de una
+    fila existente exige que la base tenga la versión de la instancia y la incrementa.
+    Los UPDATE masivos (queryset.update) deben incrementarla explícitamente, junto con
+    la fecha de modificación (auto_now no se aplica fuera de save()).
+    """
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        campo = self._meta.get_field('version')
+        esperada = self.version
+        values = [valor for valor in values if valor[0] is not campo] + [(campo, None, esperada + 1)]
+        if base_qs.filter(pk=pk_val, version=esperada)._update(values) > 0:
+            self.version = esperada + 1
+            return True
+        # Solo si el UPDATE no afectó filas: ¿otra versión o fila eliminada?
+        actual = base_qs.filter(pk=pk_val).values_list('version', flat=True).first()
+        if actual is not None:
+            raise ConflictoVersion(
+                f'{self._meta.verbose_name} {pk_val} fue modificado por otro usuario (versión {esperada} desactualizada)',
+                version_actual=actual,
+            )
+        return False
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Un guardado parcial también es una modificación: versión y fechas auto_now
+            agregar = ['version'] + [
+                campo.name for campo in self._meta.concrete_fields if getattr(campo, 'auto_now', False)
+            ]
+            kwargs['update_fields'] = list(update_fields) + [c for c in agregar if c not in update_fields]
+        super().save(*args, **kwargs)
+
+
+# ============================================
+# ETag / If-Match EN LA API
+# ============================================
+
+def etag(instancia):
+    return f'"{instancia.version}"'
+
+
+def if_match_coincide(encabezado, version):
+    """
+    If-Match (lista de ETags o *) incluye la versión vigente. Comparación fuerte
+    (RFC 7232 §3.1): un ETag débil (W/"...") nunca coincide.
+    """
+    for valor in encabezado.split(','):
+        valor = valor.strip()
+        if valor == '*':
+            return True
+        if valor == f'"{version}"':
+            return True
+    return False
+
+
+def _conflicto(version, codigo=status.HTTP_412_PRECONDITION_FAILED):
+    return Response(
+        {
+            'error': 'El registro fue modificado por otro usuario. Recargue los datos antes de guardar.',
+            'version_actual': version,
+        },
+        status=codigo,
+        headers={'ETag': f'"{version}"'} if version is not None else None,
+    )
+
+
+def manejador_excepciones(exc, context):
+    """
+    EXCEPTION_HANDLER de DRF: ConflictoVersion → 412 si el request traía If-Match
+    (su precondición no se cumplió) o 409 si no; el resto, como DRF.
+    """
+    if isinstance(exc, ConflictoVersion):
+        request = context.get('request')
+        con_precondicion = request is not None and 'If-Match' in request.headers
+        return _conflicto(
+            exc.version_actual,
+            status.HTTP_412_PRECONDITION_FAILED if con_precondicion else status.HTTP_409_CONFLICT,
+        )
+    return exception_handler(exc, context)
+
+
+class ControlVersionMixin:
+    """
+    Mixin de ViewSet: ETag con la versión en el detalle y en las respuestas de
+    PUT/PATCH; con If-Match desactualizado responde 412. La verificación de la versión
+    leída viaja en el mismo UPDATE del save(), así que no agrega consultas.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        instancia = self.get_object()
+        serializer = self.get_serializer(instancia)
+        return Response(serializer.data, headers={'ETag': etag(instancia)})
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instancia = self.get_object()
+        if_match = request.headers.get('If-Match')
+        if if_match and not if_match_coincide(if_match, instancia.version):
+            return _conflicto(instancia.version)
+
+        serializer = self.get_serializer(instancia, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        # Si otro usuario guarda entre la lectura y el UPDATE, el save() lanza
+        # ConflictoVersion y manejador_excepciones responde 412 / 409
+        self.perform_update(serializer)
+
+        if getattr(instancia, '_prefetched_objects_cache', None):
+            instancia._prefetched_objects_cache = {}
+        return Response(serializer.data, headers={'ETag': etag(instancia)})
+
+
+class ControlVersionAdminMixin:
+    """
+    Mixin de ModelAdmin: si el registro (o una etapa en línea) fue modificado por otro
+    usuario mientras se guardaba, se revierte el guardado y se vuelve al formulario
+    con un mensaje en lugar de un error 500.
+    """
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConflictoVersion:
+            self.message_user(
+                request,
+                'El registro fue modificado por otro usuario mientras se guardaba. Revise los datos y vuelva a guardar.',
+                messages.ERROR,
+            )
+            return HttpResponseRedirect(request.get_full_path())
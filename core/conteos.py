@@ -0,0 +1,327 @@
+"""
+Conteos físicos de inventario para SIPROSA MES
+Carga masiva de líneas de conteo (CSV/JSON en tandas), conciliación contra el stock
+en libros por LoteInsumo / Repuesto y aprobación con ajustes en una sola transacción.
+
+Todo opera por conjuntos: una consulta por tanda al cargar, tres consultas para
+conciliar y escrituras masivas (bulk_create / bulk_update) al aprobar.
+"""
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import ConteoFisico, ConteoFisicoLinea, LoteInsumo, Repuesto, MovimientoInventario
+from .inventario import ajustar_saldo
+
+
+# Líneas procesadas por tanda durante la carga
+TANDA_LINEAS = 2000
+
+# Máximo de errores informados por carga
+MAX_ERRORES = 100
+
+ESTADOS_CON_CARGA = ['PLANIFICADO', 'EN_PROCESO']
+
+# Lotes que cuentan como stock físico en libros (se incluyen en conteos TOTAL aunque no se contaron)
+ESTADOS_LOTE_CONTABLES = ['CUARENTENA', 'APROBADO']
+
+_CERO = Decimal('0')
+
+# ConteoFisicoLinea.cantidad_contada: DecimalField(max_digits=12, decimal_places=2)
+_CANTIDAD_MAXIMA = Decimal('9999999999.99')
+
+
+# ============================================
+# CARGA DE LÍNEAS
+# ============================================
+
+def _leer_linea(fila):
+    """Normaliza una fila (dict de CSV o JSON); lanza ValueError si es inválida"""
+    if not isinstance(fila, dict):
+        raise ValueError('la línea debe ser un objeto con tipo_item, cantidad, item_id / lote_item_id')
+    tipo_item = str(fila.get('tipo_item') or '').strip().upper()
+    if tipo_item not in ('INSUMO', 'REPUESTO'):
+        raise ValueError('tipo_item debe ser INSUMO o REPUESTO')
+
+    try:
+        cantidad = Decimal(str(fila.get('cantidad', '')).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError('cantidad inválida')
+    # Decimal() acepta NaN, Infinity y exponentes enormes: se rechazan antes de comparar
+    if not cantidad.is_finite() or abs(cantidad) > _CANTIDAD_MAXIMA:
+        raise ValueError('cantidad inválida')
+    try:
+        redondeada = cantidad.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('cantidad inválida')
+    if cantidad < 0 or cantidad != redondeada:
+        raise ValueError('cantidad debe ser ≥ 0 con hasta 2 decimales')
+
+    def entero(campo):
+        valor = str(fila.get(campo) or '').strip()
+        if not valor:
+            return None
+        if not valor.isdigit():
+            raise ValueError(f'{campo} inválido')
+        return int(valor)
+
+    lote_item_id = entero('lote_item_id')
+    item_id = entero('item_id')
+    if tipo_item == 'INSUMO' and lote_item_id is None:
+        raise ValueError('lote_item_id es obligatorio para insumos')
+    if tipo_item == 'REPUESTO':
+        if item_id is None:
+            raise ValueError('item_id es obligatorio para repuestos')
+        if cantidad != cantidad.to_integral_value():
+            raise ValueError('la cantidad de repuestos debe ser entera')
+
+    return {
+        'tipo_item': tipo_item,
+        'item_id': item_id,
+        'lote_item_id': lote_item_id if tipo_item == 'INSUMO' else None,
+        'posicion': str(fila.get('posicion') or '').strip()[:100],
+        'cantidad_contada': cantidad,
+    }
+
+
+def _resolver_tanda(conteo, tanda, usuario, errores):
+    """Valida una tanda contra la base (dos consultas) y construye las líneas"""
+    lotes = dict(
+        LoteInsumo.objects.filter(
+            id__in=[linea['lote_item_id'] for _, linea in tanda if linea['tipo_item'] == 'INSUMO']
+        ).values_list('id', 'insumo_id')
+    )
+    repuestos = set(
+        Repuesto.objects.filter(
+            id__in=[linea['item_id'] for _, linea in tanda if linea['tipo_item'] == 'REPUESTO']
+        ).values_list('id', flat=True)
+    )
+
+    lineas = []
+    for numero, linea in tanda:
+        if linea['tipo_item'] == 'INSUMO':
+            insumo_id = lotes.get(linea['lote_item_id'])
+            if insumo_id is None:
+                errores.append({'linea': numero, 'error': f"LoteInsumo {linea['lote_item_id']} no existe"})
+                continue
+            if linea['item_id'] not in (None, insumo_id):
+                errores.append({'linea': numero, 'error': 'El lote no corresponde al insumo indicado'})
+                continue
+            linea['item_id'] = insumo_id
+        elif linea['item_id'] not in repuestos:
+            errores.append({'linea': numero, 'error': f"Repuesto {linea['item_id']} no existe"})
+            continue
+        lineas.append(ConteoFisicoLinea(conteo=conteo, registrado_por=usuario, **linea))
+    return lineas
+
+
+def cargar_lineas(conteo, filas, usuario):
+    """
+    Carga líneas de conteo desde un iterable de filas (csv.DictReader o lista JSON)
+    procesándolas en tandas de TANDA_LINEAS. La carga es todo o nada: si alguna
+    línea es inválida no se guarda ninguna y se informan los errores.
+
+    Retorna (cantidad_cargada, errores).
+    """
+    if conteo.estado not in ESTADOS_CON_CARGA:
+        raise ValueError(f'No se pueden cargar líneas en un conteo {conteo.get_estado_display().lower()}')
+
+    errores = []
+    cargadas = 0
+    filas = enumerate(filas, start=1)
+
+    with transaction.atomic():
+        while len(errores) < MAX_ERRORES:
+            bloque = list(islice(filas, TANDA_LINEAS))
+            if not bloque:
+                break
+            tanda = []
+            for numero, fila in bloque:
+                try:
+                    tanda.append((numero, _leer_linea(fila)))
+                except ValueError as e:
+                    errores.append({'linea': numero, 'error': str(e)})
+            lineas = _resolver_tanda(conteo, tanda, usuario, errores)
+            # Con errores se sigue validando (para informarlos) pero ya no se inserta
+            if not errores:
+                ConteoFisicoLinea.objects.bulk_create(lineas, batch_size=TANDA_LINEAS)
+                cargadas += len(lineas)
+
+        if errores:
+            transaction.set_rollback(True)
+            return 0, sorted(errores, key=lambda e: e['linea'])[:MAX_ERRORES]
+
+        if conteo.estado == 'PLANIFICADO':
+            conteo.estado = 'EN_PROCESO'
+            conteo.fecha_inicio = conteo.fecha_inicio or timezone.now()
+            conteo.save(update_fields=['estado', 'fecha_inicio'])
+
+    return cargadas, []
+
+
+# ============================================
+# CONCILIACIÓN Y APROBACIÓN
+# ============================================
+
+def _contado(conteo):
+    """Cantidad contada por (tipo_item, item_id, lote_item_id), sumando posiciones (una consulta)"""
+    return {
+        (fila['tipo_item'], fila['item_id'], fila['lote_item_id']): fila
+        for fila in conteo.lineas.order_by().values('tipo_item', 'item_id', 'lote_item_id').annotate(
+            contado=Sum('cantidad_contada'), posiciones=Count('id')
+        )
+    }
+
+
+def _libros(conteo, bloquear=False):
+    """
+    Stock en libros de los lotes de insumo y repuestos contados; en conteos TOTAL
+    también los que tienen stock en la ubicación y no se contaron (dos consultas).
+    """
+    lineas = ConteoFisicoLinea.objects.filter(conteo=conteo).order_by()
+
+    lotes = LoteInsumo.objects.filter(
+        id__in=lineas.filter(tipo_item='INSUMO').values('lote_item_id')
+    )
+    repuestos = Repuesto.objects.filter(
+        id__in=lineas.filter(tipo_item='REPUESTO').values('item_id')
+    )
+    if conteo.tipo == 'TOTAL':
+        no_contados_lotes = Q(estado__in=ESTADOS_LOTE_CONTABLES, cantidad_actual__gt=0)
+        no_contados_repuestos = Q(activo=True, stock_actual__gt=0)
+        if conteo.ubicacion_id:
+            no_contados_lotes &= Q(ubicacion_id=conteo.ubicacion_id)
+            no_contados_repuestos &= Q(ubicacion_id=conteo.ubicacion_id)
+        lotes = LoteInsumo.objects.filter(Q(pk__in=lotes.values('pk')) | no_contados_lotes)
+        repuestos = Repuesto.objects.filter(Q(pk__in=repuestos.values('pk')) | no_contados_repuestos)
+
+    if bloquear:
+        lotes = lotes.select_for_update(of=('self',))
+        repuestos = repuestos.select_for_update(of=('self',))
+
+    libros = {}
+    for lote in lotes.values(
+        'id', 'insumo_id', 'insumo__codigo', 'codigo_lote_proveedor', 'cantidad_actual', 'unidad', 'ubicacion_id', 'estado'
+    ):
+        libros[('INSUMO', lote['insumo_id'], lote['id'])] = {
+            'codigo': lote['insumo__codigo'],
+            'lote': lote['codigo_lote_proveedor'],
+            'sistema': lote['cantidad_actual'],
+            'unidad': lote['unidad'],
+            'ubicacion_id': lote['ubicacion_id'],
+            'estado': lote['estado'],
+        }
+    for repuesto in repuestos.values('id', 'codigo', 'stock_actual', 'ubicacion_id'):
+        libros[('REPUESTO', repuesto['id'], None)] = {
+            'codigo': repuesto['codigo'],
+            'lote': None,
+            'sistema': Decimal(repuesto['stock_actual']),
+            'unidad': 'u',
+            'ubicacion_id': repuesto['ubicacion_id'],
+            'estado': None,
+        }
+    return libros
+
+
+def _diferencias(conteo, bloquear=False):
+    contado = _contado(conteo)
+    libros = _libros(conteo, bloquear)
+    filas = []
+    for clave in sorted(set(contado) | set(libros), key=lambda c: (c[0], c[1], c[2] or 0)):
+        tipo_item, item_id, lote_item_id = clave
+        libro = libros.get(clave)
+        if libro is None:
+            # Lote eliminado después de contarse: no hay stock en libros que ajustar
+            continue
+        cantidad_contada = contado[clave]['contado'] if clave in contado else _CERO
+        filas.append({
+            'tipo_item': tipo_item,
+            'item_id': item_id,
+            'lote_item_id': lote_item_id,
+            'codigo': libro['codigo'],
+            'lote': libro['lote'],
+            'unidad': libro['unidad'],
+            'ubicacion_id': libro['ubicacion_id'],
+            'estado_lote': libro['estado'],
+            'cantidad_sistema': libro['sistema'],
+            'cantidad_contada': cantidad_contada,
+            'diferencia': cantidad_contada - libro['sistema'],
+            'posiciones': contado[clave]['posiciones'] if clave in contado else 0,
+        })
+    return filas
+
+
+def conciliar_conteo(conteo, solo_diferencias=False):
+    """
+    Reporte de diferencias del conteo contra el stock en libros, por lote de insumo
+    y por repuesto (las posiciones de un mismo lote se suman).
+    """
+    filas = _diferencias(conteo)
+    con_diferencia = [fila for fila in filas if fila['diferencia']]
+    return {
+        'conteo': conteo.codigo,
+        'estado': conteo.estado,
+        'items': len(filas),
+        'items_con_diferencia': len(con_diferencia),
+        'items_no_contados': sum(1 for fila in filas if not fila['posiciones']),
+        'sobrante_total': sum((fila['diferencia'] for fila in con_diferencia if fila['diferencia'] > 0), _CERO),
+        'faltante_total': sum((-fila['diferencia'] for fila in con_diferencia if fila['diferencia'] < 0), _CERO),
+        'diferencias': con_diferencia if solo_diferencias else filas,
+    }
+
+
+def aprobar_conteo(conteo, usuario):
+    """
+    Aprueba un conteo EN_PROCESO: registra un MovimientoInventario AJUSTE por cada
+    diferencia, lleva el stock en libros a lo contado y completa el conteo, todo en
+    una transacción (lotes y repuestos bloqueados mientras se ajustan).
+    Retorna la cantidad de ajustes registrados.
+    """
+    with transaction.atomic():
+        conteo = ConteoFisico.objects.select_for_update().get(pk=conteo.pk)
+        if conteo.estado != 'EN_PROCESO':
+            raise ValueError('Solo se pueden aprobar conteos en proceso')
+
+        ajustes = [fila for fila in _diferencias(conteo, bloquear=True) if fila['diferencia']]
+
+        movimientos = []
+        lotes = []
+        repuestos = []
+        saldos = defaultdict(lambda: _CERO)
+        for fila in ajustes:
+            movimientos.append(MovimientoInventario(
+                tipo_item=fila['tipo_item'],
+                item_id=fila['item_id'],
+                lote_item_id=fila['lote_item_id'],
+                tipo_movimiento='AJUSTE',
+                motivo='AJUSTE_INVENTARIO',
+                cantidad=fila['diferencia'],
+                unidad=fila['unidad'],
+                ubicacion_destino_id=fila['ubicacion_id'],
+                referencia_documento=conteo.codigo,
+                registrado_por=usuario,
+                observaciones=f"Conteo físico {conteo.codigo}: sistema {fila['cantidad_sistema']}, contado {fila['cantidad_contada']}",
+            ))
+            if fila['tipo_item'] == 'INSUMO':
+                lotes.append(LoteInsumo(pk=fila['lote_item_id'], cantidad_actual=fila['cantidad_contada']))
+                saldos[(fila['item_id'], fila['ubicacion_id'], fila['estado_lote'])] += fila['diferencia']
+            else:
+                repuestos.append(Repuesto(pk=fila['item_id'], stock_actual=int(fila['cantidad_contada'])))
+
+        MovimientoInventario.objects.bulk_create(movimientos, batch_size=1000)
+        LoteInsumo.objects.bulk_update(lotes, ['cantidad_actual'], batch_size=1000)
+        Repuesto.objects.bulk_update(repuestos, ['stock_actual'], batch_size=1000)
+        # bulk_update no dispara señales: el saldo materializado se ajusta por clave
+        for clave, diferencia in saldos.items():
+            ajustar_saldo(clave, diferencia, 0)
+
+        conteo.estado = 'COMPLETADO'
+        conteo.fecha_fin = timezone.now()
+        conteo.save(update_fields=['estado', 'fecha_fin'])
+
+    return len(ajustes)
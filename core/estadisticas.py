@@ -0,0 +1,152 @@
+"""
+Motor de estadísticas de producción para SIPROSA MES
+Distribuciones (percentiles, desviación estándar y atípicos) de rendimientos,
+tiempos de ciclo y mermas, agrupadas por producto, etapa o máquina.
+
+Los datos se leen en una sola pasada (values_list) a arrays contiguos de NumPy
+y las estadísticas por grupo se calculan de forma vectorizada, sin bucles por fila.
+"""
+
+import numpy as np
+
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from .models import Lote, LoteEtapa, Producto, EtapaProduccion, Maquina
+from .kpis import rango_dias
+
+
+# Métrica -> (modelo, expresión del valor, campo de fecha para el rango)
+METRICAS = {
+    'rendimiento_lote': (
+        Lote,
+        Cast(F('cantidad_producida'), FloatField()) * 100.0 / Cast(F('cantidad_planificada'), FloatField()),
+        'fecha_real_inicio',
+    ),
+    'rendimiento_etapa': (LoteEtapa, Cast(F('porcentaje_rendimiento'), FloatField()), 'fecha_inicio'),
+    'duracion_minutos': (LoteEtapa, Cast(F('duracion_minutos'), FloatField()), 'fecha_inicio'),
+    'cantidad_merma': (LoteEtapa, Cast(F('cantidad_merma'), FloatField()), 'fecha_inicio'),
+}
+
+# Agrupación -> (modelo del grupo, campo FK del grupo según el modelo de la métrica)
+# Se agrupa por id entero (np.unique sobre int64) y luego se resuelven los códigos.
+AGRUPACIONES = {
+    'producto': (Producto, {Lote: 'producto_id', LoteEtapa: 'lote__producto_id'}),
+    'etapa': (EtapaProduccion, {LoteEtapa: 'etapa_id'}),
+    'maquina': (Maquina, {LoteEtapa: 'maquina_id'}),
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Máximo de ids atípicos informados por grupo
+MAX_ATIPICOS = 20
+
+
+def _leer_columnas(metrica, agrupar, desde, hasta):
+    """Lee (id, grupo, valor) en una sola consulta y los devuelve como arrays NumPy"""
+    modelo, expresion, campo_fecha = METRICAS[metrica]
+    campo_grupo = AGRUPACIONES[agrupar][1][modelo]
+
+    inicio, fin = rango_dias(desde, hasta)
+    queryset = modelo.objects.filter(**{
+        f'{campo_fecha}__gte': inicio,
+        f'{campo_fecha}__lt': fin,
+        f'{campo_grupo}__isnull': False,
+    })
+    if modelo is Lote:
+        queryset = queryset.filter(cantidad_planificada__gt=0)
+
+    filas = list(
+        queryset.annotate(valor=expresion)
+        .filter(valor__isnull=False)
+        .order_by()
+        .values_list('id', campo_grupo, 'valor')
+    )
+    if not filas:
+        return None
+
+    ids, grupos, valores = zip(*filas)
+    return (
+        np.fromiter(ids, dtype=np.int64, count=len(ids)),
+        np.fromiter(grupos, dtype=np.int64, count=len(grupos)),
+        np.fromiter(valores, dtype=np.float64, count=len(valores)),
+    )
+
+
+def _percentil_agrupado(ordenados, inicios, cantidades, q):
+    """
+    Percentil q (interpolación lineal, igual que np.percentile) de cada grupo,
+    sobre valores ya ordenados dentro de cada grupo contiguo.
+    """
+    posicion = inicios + (cantidades - 1) * (q / 100.0)
+    abajo = np.floor(posicion).astype(np.int64)
+    arriba = np.minimum(abajo + 1, inicios + cantidades - 1)
+    fraccion = posicion - abajo
+    return ordenados[abajo] + (ordenados[arriba] - ordenados[abajo]) * fraccion
+
+
+def estadisticas_agrupadas(metrica, agrupar, desde, hasta):
+    """
+    Estadísticas de distribución de una métrica por grupo.
+
+    Para cada grupo: n, media, desviación estándar, mínimo, máximo, p50/p90/p99
+    y atípicos según las vallas de Tukey (Q1 - 1.5·IQR, Q3 + 1.5·IQR).
+    """
+    if metrica not in METRICAS:
+        raise ValueError(f'metrica debe ser una de: {", ".join(METRICAS)}')
+    if agrupar not in AGRUPACIONES:
+        raise ValueError(f'group_by debe ser uno de: {", ".join(AGRUPACIONES)}')
+    if METRICAS[metrica][0] not in AGRUPACIONES[agrupar][1]:
+        raise ValueError(f'La métrica {metrica} no admite group_by={agrupar}')
+
+    columnas = _leer_columnas(metrica, agrupar, desde, hasta)
+    if columnas is None:
+        return []
+    ids, grupos, valores = columnas
+
+    # Códigos de grupo y orden (grupo, valor) en una sola pasada
+    grupos_ids, codigos = np.unique(grupos, return_inverse=True)
+    nombres = dict(
+        AGRUPACIONES[agrupar][0].objects.filter(id__in=grupos_ids.tolist()).values_list('id', 'codigo')
+    )
+    orden = np.lexsort((valores, codigos))
+    ordenados = valores[orden]
+
+    cantidades = np.bincount(codigos, minlength=len(grupos_ids))
+    inicios = np.concatenate(([0], np.cumsum(cantidades)[:-1]))
+
+    sumas = np.bincount(codigos, weights=valores, minlength=len(grupos_ids))
+    medias = sumas / cantidades
+    desvios = np.sqrt(np.bincount(codigos, weights=(valores - medias[codigos]) ** 2, minlength=len(grupos_ids)) / cantidades)
+
+    percentiles = {q: _percentil_agrupado(ordenados, inicios, cantidades, q) for q in PERCENTILES}
+    q1 = _percentil_agrupado(ordenados, inicios, cantidades, 25)
+    q3 = _percentil_agrupado(ordenados, inicios, cantidades, 75)
+    limite_inferior = q1 - 1.5 * (q3 - q1)
+    limite_superior = q3 + 1.5 * (q3 - q1)
+
+    # Marcado vectorizado de atípicos
+    atipico = (valores < limite_inferior[codigos]) | (valores > limite_superior[codigos])
+    cantidad_atipicos = np.bincount(codigos, weights=atipico, minlength=len(grupos_ids)).astype(np.int64)
+    ids_atipicos = {}
+    for codigo, id_ in zip(codigos[atipico], ids[atipico]):
+        lista = ids_atipicos.setdefault(int(codigo), [])
+        if len(lista) < MAX_ATIPICOS:
+            lista.append(int(id_))
+
+    resultados = []
+    for i, grupo_id in enumerate(grupos_ids.tolist()):
+        resultados.append({
+            agrupar: nombres.get(grupo_id),
+            'n': int(cantidades[i]),
+            'media': round(float(medias[i]), 2),
+            'desviacion': round(float(desvios[i]), 2),
+            'min': round(float(ordenados[inicios[i]]), 2),
+            'max': round(float(ordenados[inicios[i] + cantidades[i] - 1]), 2),
+            **{f'p{q}': round(float(percentiles[q][i]), 2) for q in PERCENTILES},
+            'limite_inferior': round(float(limite_inferior[i]), 2),
+            'limite_superior': round(float(limite_superior[i]), 2),
+            'atipicos': int(cantidad_atipicos[i]),
+            'atipicos_ids': ids_atipicos.get(i, []),
+        })
+    return resultados
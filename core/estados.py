@@ -0,0 +1,130 @@
+"""
+Máquinas de estado de SIPROSA MES
+Cada modelo declara sus transiciones (origen → destino) con MaquinaEstados. Una
+transición se aplica con un único UPDATE condicional:
+
+    UPDATE ... SET estado = <destino>, ... WHERE id = %s AND estado IN (<origen>)
+
+Si otro operador cambió el estado antes, el UPDATE no afecta filas y la transición no
+se aplica: dos clics concurrentes no pueden tener éxito los dos. Como el UPDATE no pasa
+por save(), los efectos (auditoría, rollups, notificaciones) se conectan a la señal
+transicion_realizada, que solo se envía si la transición se aplicó.
+"""
+
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .rastreo import CamposRastreadosMixin
+from .concurrencia import VersionadoMixin
+
+
+# Enviada tras una transición aplicada: sender=modelo, instance, transicion, cambios
+# (cambios = {campo: (antes, despues)}, FK por id, como CamposRastreadosMixin.campos_modificados)
+transicion_realizada = Signal()
+
+
+class Transicion:
+    """Transición permitida desde cualquiera de los estados `origen` hacia `destino`"""
+
+    def __init__(self, origen, destino):
+        self.origen = tuple(origen)
+        self.destino = destino
+
+
+class MaquinaEstados:
+    """
+    Transiciones de un modelo, declaradas como atributo de clase:
+
+        maquina_estados = MaquinaEstados(liberar=Transicion(['FINALIZADO'], 'LIBERADO'))
+
+    `campo` es el campo de estado. Si el modelo define `campos_derivados` y
+    `calcular_campos_derivados()` (lo que calcula en save()), los derivados que cambian
+    se incluyen en el mismo UPDATE.
+    """
+
+    def __init__(self, campo='estado', **transiciones):
+        self.campo = campo
+        self.transiciones = transiciones
+
+    def contribute_to_class(self, modelo, nombre):
+        self.modelo = modelo
+        setattr(modelo, nombre, self)
+
+    def permitida(self, instancia, nombre):
+        """La transición es válida desde el estado cargado en la instancia"""
+        return getattr(instancia, self.campo) in self.transiciones[nombre].origen
+
+    def aplicar(self, instancia, nombre, **valores):
+        """
+        Aplica la transición `nombre` con los `valores` adicionales (campo=valor) en un
+        UPDATE condicional. Retorna True si se aplicó; en ese caso la instancia queda
+        actualizada y se envía transicion_realizada. Si el estado ya no era un origen
+        válido retorna False y la instancia queda como estaba.
+        """
+        transicion = self.transiciones[nombre]
+        meta = self.modelo._meta
+        valores[self.campo] = transicion.destino
+        campos = [meta.get_field(campo) for campo in valores]
+        derivados = [meta.get_field(campo) for campo in getattr(self.modelo, 'campos_derivados', ())]
+        anteriores = {campo.attname: instancia.__dict__.get(campo.attname) for campo in campos + derivados}
+
+        for campo, valor in valores.items():
+            setattr(instancia, campo, valor)
+        if derivados:
+            instancia.calcular_campos_derivados()
+
+        cambios = {}
+        actualizar = {}
+        for campo in campos + derivados:
+            nuevo = instancia.__dict__.get(campo.attname)
+            if campo in campos or nuevo != anteriores[campo.attname]:
+                actualizar[campo.attname] = nuevo
+            if nuevo != anteriores[campo.attname]:
+                cambios[campo.name] = (anteriores[campo.attname], nuevo)
+
+        # update() no aplica auto_now: la fecha de modificación se escribe explícitamente
+        # (fuera de `cambios`, que es lo que se audita)
+        sellos = [campo.attname for campo in meta.concrete_fields if getattr(campo, 'auto_now', False)]
+        ahora = timezone.now()
+        for sello in sellos:
+            actualizar[sello] = ahora
+
+        versionado = isinstance(instancia, VersionadoMixin)
+        if versionado:
+            # La transición también es una escritura: invalida los ETag emitidos
+            actualizar['version'] = F('version') + 1
+
+        aplicadas = self.modelo._base_manager.filter(
+            pk=instancia.pk, **{f'{self.campo}__in': transicion.origen}
+        ).update(**actualizar)
+        if not aplicadas:
+            for campo in campos + derivados:
+                setattr(instancia, campo.attname, anteriores[campo.attname])
+            return False
+
+        if versionado:
+            instancia.version += 1
+            del actualizar['version']
+        for sello in sellos:
+            setattr(instancia, sello, ahora)
+        if isinstance(instancia, CamposRastreadosMixin):
+            instancia._tomar_originales(list(actualizar))
+        transicion_realizada.send(sender=self.modelo, instance=instancia, transicion=nombre, cambios=cambios)
+        return True
+
+
+def transicion_permitida(instancia, nombre):
+    """La transición `nombre` del modelo de la instancia es válida desde su estado actual"""
+    return type(instancia).maquina_estados.permitida(instancia, nombre)
+
+
+def transicionar(instancia, nombre, **valores):
+    """Aplica la transición `nombre` a la instancia (ver MaquinaEstados.aplicar)"""
+    return type(instancia).maquina_estados.aplicar(instancia, nombre, **valores)
+
+
+def estado_actual(instancia):
+    """Estado vigente en la base (para informar por qué una transición no se aplicó)"""
+    maquina = type(instancia).maquina_estados
+    return type(instancia)._base_manager.filter(pk=instancia.pk).values_list(maquina.campo, flat=True).first()
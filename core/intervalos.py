@@ -0,0 +1,150 @@
+"""
+Motor de intervalos de tiempo por máquina para SIPROSA MES
+Construye la línea de tiempo de cada Maquina a partir de LoteEtapa (marcha) y
+Parada (detención), fusiona intervalos superpuestos con un barrido ordenado y
+calcula horas en marcha / ociosa / detenida sobre cualquier rango.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Maquina, LoteEtapa, Parada
+
+
+def fusionar_intervalos(intervalos):
+    """
+    Fusiona intervalos (inicio, fin) superpuestos o contiguos.
+    Ordena por inicio y recorre una sola vez (sort-and-sweep).
+    """
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio <= fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1][1] = fin
+        else:
+            fusionados.append([inicio, fin])
+    return [(inicio, fin) for inicio, fin in fusionados]
+
+
+def duracion_total(intervalos):
+    """Suma de duraciones (timedelta) de una lista de intervalos ya fusionados"""
+    return sum((fin - inicio for inicio, fin in intervalos), timedelta())
+
+
+def _recortar(inicio, fin, desde, hasta):
+    """Recorta un intervalo al rango [desde, hasta); None si queda vacío"""
+    inicio = max(inicio, desde)
+    fin = min(fin, hasta)
+    return (inicio, fin) if inicio < fin else None
+
+
+def rango_local(desde, hasta):
+    """
+    Convierte fechas desde/hasta (inclusive) a datetimes con zona horaria:
+    [desde 00:00, hasta+1 00:00)
+    """
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(desde, time.min), tz)
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min), tz)
+    return inicio, fin
+
+
+def intervalos_por_maquina(inicio, fin, maquinas=None):
+    """
+    Lee en dos consultas todos los intervalos de marcha (LoteEtapa) y de parada
+    que se solapan con [inicio, fin), recortados al rango y agrupados por máquina.
+    Los intervalos abiertos (sin fecha_fin) se cierran en min(fin, ahora).
+    """
+    corte = min(fin, timezone.now())
+    marcha = defaultdict(list)
+    paradas = defaultdict(list)
+
+    etapas = LoteEtapa.objects.filter(
+        maquina__isnull=False,
+        fecha_inicio__isnull=False,
+        fecha_inicio__lt=fin,
+    ).filter(Q(fecha_fin__isnull=True) | Q(fecha_fin__gt=inicio))
+    if maquinas is not None:
+        etapas = etapas.filter(maquina__in=maquinas)
+
+    for maquina_id, fecha_inicio, fecha_fin in etapas.values_list('maquina_id', 'fecha_inicio', 'fecha_fin'):
+        intervalo = _recortar(fecha_inicio, fecha_fin or corte, inicio, corte)
+        if intervalo:
+            marcha[maquina_id].append(intervalo)
+
+    detenciones = Parada.objects.filter(
+        lote_etapa__maquina__isnull=False,
+        fecha_inicio__lt=fin,
+    ).filter(Q(fecha_fin__isnull=True) | Q(fecha_fin__gt=inicio))
+    if maquinas is not None:
+        detenciones = detenciones.filter(lote_etapa__maquina__in=maquinas)
+
+    for maquina_id, fecha_inicio, fecha_fin in detenciones.values_list(
+        'lote_etapa__maquina_id', 'fecha_inicio', 'fecha_fin'
+    ):
+        intervalo = _recortar(fecha_inicio, fecha_fin or corte, inicio, corte)
+        if intervalo:
+            paradas[maquina_id].append(intervalo)
+
+    return marcha, paradas
+
+
+def tiempos_maquina(marcha, paradas, periodo):
+    """
+    Calcula horas en marcha / detenida / ociosa de una máquina.
+
+    - detenida: unión de paradas
+    - marcha: unión de (etapas ∪ paradas) menos lo detenido
+    - ociosa: resto del período
+    Así marcha + detenida + ociosa = período, sin contar dos veces los solapamientos.
+    """
+    ocupado = duracion_total(fusionar_intervalos(marcha + paradas))
+    detenida = duracion_total(fusionar_intervalos(paradas))
+    en_marcha = ocupado - detenida
+    ociosa = max(periodo - ocupado, timedelta())
+
+    horas_marcha = en_marcha.total_seconds() / 3600
+    horas_detenida = detenida.total_seconds() / 3600
+    horas_ociosa = ociosa.total_seconds() / 3600
+    horas_periodo = periodo.total_seconds() / 3600
+    horas_ocupada = horas_marcha + horas_detenida
+
+    return {
+        'horas_periodo': round(horas_periodo, 2),
+        'horas_marcha': round(horas_marcha, 2),
+        'horas_detenida': round(horas_detenida, 2),
+        'horas_ociosa': round(horas_ociosa, 2),
+        'disponibilidad': round(horas_marcha / horas_ocupada * 100, 2) if horas_ocupada > 0 else 0,
+        'utilizacion': round(horas_marcha / horas_periodo * 100, 2) if horas_periodo > 0 else 0,
+    }
+
+
+def disponibilidad_maquinas(desde, hasta, maquinas=None):
+    """
+    Disponibilidad por máquina en el rango de fechas (inclusive).
+    Usa tres consultas en total (máquinas, etapas, paradas) sin importar
+    cuántas máquinas o días abarque el rango.
+    """
+    inicio, fin = rango_local(desde, hasta)
+    periodo = max(min(fin, timezone.now()) - inicio, timedelta())
+
+    if maquinas is None:
+        maquinas = Maquina.objects.filter(activa=True)
+    maquinas = list(maquinas.values('id', 'codigo', 'nombre', 'tipo'))
+    ids = [m['id'] for m in maquinas]
+
+    marcha, paradas = intervalos_por_maquina(inicio, fin, ids)
+
+    resultados = []
+    for maquina in maquinas:
+        resultados.append({
+            'maquina_id': maquina['id'],
+            'maquina_codigo': maquina['codigo'],
+            'maquina_nombre': maquina['nombre'],
+            'tipo': maquina['tipo'],
+            **tiempos_maquina(marcha[maquina['id']], paradas[maquina['id']], periodo),
+        })
+    return resultados
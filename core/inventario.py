@@ -0,0 +1,801 @@
+"""
+Servicios de inventario para SIPROSA MES
+Saldos materializados de insumos (SaldoInsumo) y aplicación de movimientos a lotes
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import (
+    Count, Sum, F, Q, Max, Case, When, OuterRef, Subquery, DecimalField, Value, ExpressionWrapper
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (
+    Ubicacion, Insumo, LoteInsumo, LoteInsumoConsumo, SaldoInsumo, Repuesto, Producto,
+    MovimientoInventario, CierreInventario
+)
+from .trazabilidad import acumular_genealogia
+
+
+# ============================================
+# SALDOS DE INSUMOS (SaldoInsumo)
+# ============================================
+
+def aporte_lote(insumo_id, ubicacion_id, estado, cantidad_actual):
+    """Clave del saldo y aporte (cantidad, lotes) de un LoteInsumo"""
+    return (insumo_id, ubicacion_id, estado), Decimal(cantidad_actual or 0), 1
+
+
+def ajustar_saldo(clave, cantidad, lotes):
+    """
+    Suma (o resta) cantidad y lotes al saldo con un UPDATE atómico basado en F();
+    crea la fila del saldo si todavía no existe.
+    """
+    if not cantidad and not lotes:
+        return
+    insumo_id, ubicacion_id, estado = clave
+    saldos = SaldoInsumo.objects.filter(insumo_id=insumo_id, ubicacion_id=ubicacion_id, estado=estado)
+    actualizados = saldos.update(
+        cantidad=F('cantidad') + cantidad,
+        lotes=F('lotes') + lotes,
+        fecha_actualizacion=timezone.now(),
+    )
+    if not actualizados:
+        SaldoInsumo.objects.get_or_create(insumo_id=insumo_id, ubicacion_id=ubicacion_id, estado=estado)
+        ajustar_saldo(clave, cantidad, lotes)
+
+
+def ajustar_saldos(deltas):
+    """
+    Versión masiva de ajustar_saldo para escrituras bulk (que no disparan señales).
+    `deltas`: {clave: (cantidad, lotes)}. Crea las filas faltantes, las bloquea y
+    las actualiza con un bulk_update: un número fijo de consultas por operación.
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    SaldoInsumo.objects.bulk_create(
+        [SaldoInsumo(insumo_id=i, ubicacion_id=u, estado=e) for i, u, e in deltas],
+        ignore_conflicts=True,
+    )
+    filtro = Q()
+    for insumo_id, ubicacion_id, estado in deltas:
+        filtro |= Q(insumo_id=insumo_id, ubicacion_id=ubicacion_id, estado=estado)
+    saldos = list(SaldoInsumo.objects.select_for_update().filter(filtro))
+    ahora = timezone.now()
+    for saldo in saldos:
+        cantidad, lotes = deltas[(saldo.insumo_id, saldo.ubicacion_id, saldo.estado)]
+        saldo.cantidad += cantidad
+        saldo.lotes += lotes
+        saldo.fecha_actualizacion = ahora
+    SaldoInsumo.objects.bulk_update(saldos, ['cantidad', 'lotes', 'fecha_actualizacion'], batch_size=1000)
+
+
+def stock_aprobado_subquery(insumo_ref='pk'):
+    """
+    Expresión con el stock aprobado de un insumo leído de SaldoInsumo,
+    para anotar querysets de Insumo sin consultas por fila.
+    """
+    return Coalesce(
+        Subquery(
+            SaldoInsumo.objects.filter(
+                insumo=OuterRef(insumo_ref), estado='APROBADO'
+            ).order_by().values('insumo').annotate(total=Sum('cantidad')).values('total'),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _saldos_esperados():
+    """Saldos calculados desde los lotes (una consulta agrupada)"""
+    return {
+        (fila['insumo_id'], fila['ubicacion_id'], fila['estado']): (fila['cantidad'] or Decimal('0'), fila['lotes'])
+        for fila in LoteInsumo.objects.order_by().values('insumo_id', 'ubicacion_id', 'estado').annotate(
+            cantidad=Sum('cantidad_actual'), lotes=Count('id')
+        )
+    }
+
+
+def verificar_saldos(reparar=False):
+    """
+    Compara SaldoInsumo contra los lotes (fuente de verdad) y devuelve las
+    diferencias encontradas. Con reparar=True reconstruye todos los saldos
+    dentro de una transacción.
+    """
+    esperados = _saldos_esperados()
+    actuales = {
+        (fila['insumo_id'], fila['ubicacion_id'], fila['estado']): (fila['cantidad'], fila['lotes'])
+        for fila in SaldoInsumo.objects.values('insumo_id', 'ubicacion_id', 'estado', 'cantidad', 'lotes')
+    }
+
+    diferencias = []
+    for clave in esperados.keys() | actuales.keys():
+        esperado = esperados.get(clave, (Decimal('0'), 0))
+        actual = actuales.get(clave, (Decimal('0'), 0))
+        if esperado != actual:
+            diferencias.append({
+                'insumo_id': clave[0],
+                'ubicacion_id': clave[1],
+                'estado': clave[2],
+                'cantidad_esperada': esperado[0],
+                'cantidad_actual': actual[0],
+                'lotes_esperados': esperado[1],
+                'lotes_actuales': actual[1],
+            })
+
+    if reparar and diferencias:
+        with transaction.atomic():
+            SaldoInsumo.objects.all().delete()
+            SaldoInsumo.objects.bulk_create([
+                SaldoInsumo(
+                    insumo_id=insumo_id, ubicacion_id=ubicacion_id, estado=estado,
+                    cantidad=cantidad, lotes=lotes
+                )
+                for (insumo_id, ubicacion_id, estado), (cantidad, lotes) in esperados.items()
+            ], batch_size=1000)
+
+    return diferencias
+
+
+# ============================================
+# APLICACIÓN DE MOVIMIENTOS A LOTES DE INSUMO
+# ============================================
+
+def aplicar_movimiento(movimiento):
+    """
+    Aplica un MovimientoInventario de insumo con lote (lote_item_id) sobre el
+    LoteInsumo, bloqueando la fila del lote. El saldo se actualiza por las
+    señales de LoteInsumo en la misma transacción.
+
+    - ENTRADA: suma la cantidad al lote
+    - SALIDA: descuenta la cantidad (no puede dejar stock negativo)
+    - AJUSTE: suma la cantidad con signo (el resto de los tipos exige cantidad > 0)
+    - TRANSFERENCIA: mueve la cantidad a ubicacion_destino (divide el lote si es parcial)
+
+    Lanza ValueError si el movimiento no puede aplicarse.
+    Retorna el lote afectado, o None si el movimiento no corresponde a un lote de insumo.
+    """
+    if movimiento.tipo_item != 'INSUMO' or not movimiento.lote_item_id:
+        return None
+
+    with transaction.atomic():
+        lote = LoteInsumo.objects.select_for_update().filter(
+            pk=movimiento.lote_item_id,
+            insumo_id=movimiento.item_id
+        ).first()
+        if lote is None:
+            raise ValueError('El lote indicado no existe o no corresponde al insumo')
+
+        cantidad = Decimal(movimiento.cantidad)
+        tipo = movimiento.tipo_movimiento
+        # Un SALIDA negativo sumaría stock: solo el AJUSTE lleva signo
+        if tipo == 'AJUSTE' and cantidad == 0:
+            raise ValueError('Un ajuste no puede ser de cantidad cero')
+        if tipo != 'AJUSTE' and cantidad <= 0:
+            raise ValueError('La cantidad debe ser mayor que cero')
+
+        if tipo == 'ENTRADA':
+            lote.cantidad_actual += cantidad
+        elif tipo in ('SALIDA', 'AJUSTE'):
+            nueva = lote.cantidad_actual - cantidad if tipo == 'SALIDA' else lote.cantidad_actual + cantidad
+            if nueva < 0:
+                raise ValueError(f'Stock insuficiente en el lote (disponible: {lote.cantidad_actual})')
+            lote.cantidad_actual = nueva
+        elif tipo == 'TRANSFERENCIA':
+            if not movimiento.ubicacion_destino_id:
+                raise ValueError('La transferencia requiere ubicacion_destino')
+            if cantidad > lote.cantidad_actual:
+                raise ValueError(f'Stock insuficiente en el lote (disponible: {lote.cantidad_actual})')
+            if cantidad == lote.cantidad_actual:
+                lote.ubicacion_id = movimiento.ubicacion_destino_id
+            else:
+                lote.cantidad_actual -= cantidad
+                lote.save()
+                # Nuevo lote con la porción transferida (mismos datos de proveedor y vencimiento)
+                lote.pk = None
+                lote._state.adding = True
+                lote.cantidad_inicial = cantidad
+                lote.cantidad_actual = cantidad
+                lote.ubicacion_id = movimiento.ubicacion_destino_id
+
+        lote.save()
+        return lote
+
+
+# ============================================
+# RECEPCIÓN MASIVA DE LOTES (remito / ASN)
+# ============================================
+
+def _fecha_iso(valor, campo, obligatoria=True):
+    valor = str(valor or '').strip()
+    if not valor:
+        if obligatoria:
+            raise ValueError(f'{campo} es obligatoria')
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{campo} inválida (YYYY-MM-DD)')
+
+
+# LoteInsumo.cantidad_inicial / precio_unitario: DecimalField(max_digits=10, decimal_places=2)
+_DECIMAL_MAXIMO = Decimal('99999999.99')
+
+
+def _decimal(valor, campo, obligatorio=True):
+    valor = str(valor or '').strip().replace(',', '.')
+    if not valor:
+        if obligatorio:
+            raise ValueError(f'{campo} es obligatorio')
+        return None
+    try:
+        numero = Decimal(valor)
+    except InvalidOperation:
+        raise ValueError(f'Valor numérico inválido en {campo}')
+    # Decimal() acepta NaN, Infinity y exponentes enormes: se rechazan antes de comparar
+    if not numero.is_finite() or abs(numero) > _DECIMAL_MAXIMO:
+        raise ValueError(f'Valor numérico inválido en {campo}')
+    try:
+        redondeado = numero.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'Valor numérico inválido en {campo}')
+    if numero != redondeado:
+        raise ValueError(f'{campo} admite hasta 2 decimales')
+    return numero
+
+
+def _leer_linea_recepcion(fila, cabecera):
+    """Normaliza una línea de recepción; los datos del remito completan los faltantes"""
+    if not isinstance(fila, dict):
+        raise ValueError('la línea debe ser un objeto con insumo, codigo_lote_proveedor, fecha_vencimiento y cantidad')
+    linea = {
+        'insumo': str(fila.get('insumo') or '').strip(),
+        'ubicacion': str(fila.get('ubicacion') or cabecera.get('ubicacion') or '').strip(),
+        'codigo_lote_proveedor': str(fila.get('codigo_lote_proveedor') or '').strip(),
+        'proveedor': str(fila.get('proveedor') or cabecera.get('proveedor') or '').strip(),
+        'numero_factura': str(fila.get('numero_factura') or cabecera.get('numero_factura') or '').strip(),
+        'unidad': str(fila.get('unidad') or '').strip(),
+        'ubicacion_detalle': str(fila.get('ubicacion_detalle') or '').strip(),
+        'fecha_recepcion': _fecha_iso(fila.get('fecha_recepcion'), 'fecha_recepcion', obligatoria=False)
+        or cabecera['fecha_recepcion'],
+        'fecha_fabricacion': _fecha_iso(fila.get('fecha_fabricacion'), 'fecha_fabricacion', obligatoria=False),
+        'fecha_vencimiento': _fecha_iso(fila.get('fecha_vencimiento'), 'fecha_vencimiento'),
+        'cantidad': _decimal(fila.get('cantidad'), 'cantidad'),
+        'precio_unitario': _decimal(fila.get('precio_unitario'), 'precio_unitario', obligatorio=False),
+    }
+    for campo in ('insumo', 'ubicacion', 'codigo_lote_proveedor', 'proveedor'):
+        if not linea[campo]:
+            raise ValueError(f'{campo} es obligatorio')
+    if linea['cantidad'] <= 0:
+        raise ValueError('cantidad debe ser mayor a cero')
+    if linea['fecha_vencimiento'] <= linea['fecha_recepcion']:
+        raise ValueError('fecha_vencimiento debe ser posterior a la recepción')
+    return linea
+
+
+def recibir_lotes(filas, usuario, cabecera=None):
+    """
+    Recepción masiva de un remito/ASN: crea un LoteInsumo (en CUARENTENA) y su
+    MovimientoInventario ENTRADA por cada línea.
+
+    Valida todas las líneas en una pasada, resolviendo códigos de Insumo y Ubicacion
+    con una consulta cada uno y detectando lotes ya recibidos (misma combinación
+    insumo + lote del proveedor). Si hay errores no se crea nada.
+
+    Retorna (lotes_creados, errores) donde errores es [{linea, error}].
+    """
+    cabecera = dict(cabecera or {})
+    cabecera['fecha_recepcion'] = cabecera.get('fecha_recepcion') or timezone.localdate()
+    referencia = cabecera.get('referencia_documento') or cabecera.get('numero_factura') or ''
+
+    errores = []
+    lineas = []
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            lineas.append((numero, _leer_linea_recepcion(fila, cabecera)))
+        except ValueError as e:
+            errores.append({'linea': numero, 'error': str(e)})
+
+    insumos = {
+        insumo['codigo']: insumo
+        for insumo in Insumo.objects.filter(
+            codigo__in={linea['insumo'] for _, linea in lineas}
+        ).values('id', 'codigo', 'unidad_medida', 'activo')
+    }
+    ubicaciones = dict(
+        Ubicacion.objects.filter(
+            codigo__in={linea['ubicacion'] for _, linea in lineas}
+        ).values_list('codigo', 'id')
+    )
+    recibidos = set(
+        LoteInsumo.objects.filter(
+            insumo_id__in=[insumo['id'] for insumo in insumos.values()],
+            codigo_lote_proveedor__in={linea['codigo_lote_proveedor'] for _, linea in lineas},
+        ).values_list('insumo_id', 'codigo_lote_proveedor')
+    )
+
+    lotes = []
+    en_remito = set()
+    for numero, linea in lineas:
+        insumo = insumos.get(linea['insumo'])
+        if insumo is None or not insumo['activo']:
+            errores.append({'linea': numero, 'error': f"Insumo {linea['insumo']} inexistente o inactivo"})
+            continue
+        if linea['ubicacion'] not in ubicaciones:
+            errores.append({'linea': numero, 'error': f"Ubicación {linea['ubicacion']} inexistente"})
+            continue
+        clave = (insumo['id'], linea['codigo_lote_proveedor'])
+        if clave in recibidos:
+            errores.append({'linea': numero, 'error': f"El lote {linea['codigo_lote_proveedor']} de {insumo['codigo']} ya fue recibido"})
+            continue
+        if clave in en_remito:
+            errores.append({'linea': numero, 'error': f"Lote {linea['codigo_lote_proveedor']} de {insumo['codigo']} repetido en el remito"})
+            continue
+        en_remito.add(clave)
+
+        lotes.append(LoteInsumo(
+            insumo_id=insumo['id'],
+            codigo_lote_proveedor=linea['codigo_lote_proveedor'],
+            fecha_recepcion=linea['fecha_recepcion'],
+            fecha_fabricacion=linea['fecha_fabricacion'],
+            fecha_vencimiento=linea['fecha_vencimiento'],
+            cantidad_inicial=linea['cantidad'],
+            cantidad_actual=linea['cantidad'],
+            unidad=linea['unidad'] or insumo['unidad_medida'],
+            ubicacion_id=ubicaciones[linea['ubicacion']],
+            ubicacion_detalle=linea['ubicacion_detalle'],
+            proveedor=linea['proveedor'],
+            numero_factura=linea['numero_factura'],
+            precio_unitario=linea['precio_unitario'],
+            estado='CUARENTENA',
+        ))
+
+    if errores:
+        return [], sorted(errores, key=lambda e: e['linea'])
+
+    with transaction.atomic():
+        LoteInsumo.objects.bulk_create(lotes)
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                tipo_item='INSUMO',
+                item_id=lote.insumo_id,
+                lote_item_id=lote.pk,
+                tipo_movimiento='ENTRADA',
+                motivo='COMPRA',
+                cantidad=lote.cantidad_actual,
+                unidad=lote.unidad,
+                ubicacion_destino_id=lote.ubicacion_id,
+                referencia_documento=referencia,
+                registrado_por=usuario,
+                observaciones='Recepción masiva',
+            )
+            for lote in lotes
+        ])
+        # bulk_create no dispara señales: el saldo materializado se ajusta en bloque
+        saldos = {}
+        for lote in lotes:
+            clave, cantidad, cantidad_lotes = aporte_lote(lote.insumo_id, lote.ubicacion_id, lote.estado, lote.cantidad_actual)
+            anterior = saldos.get(clave, (Decimal('0'), 0))
+            saldos[clave] = (anterior[0] + cantidad, anterior[1] + cantidad_lotes)
+        ajustar_saldos(saldos)
+
+    return lotes, []
+
+
+# ============================================
+# ASIGNACIÓN FEFO DE LOTES (dispensado)
+# ============================================
+
+# Lotes bloqueados por tanda: evita bloquear todos los lotes del insumo
+TANDA_LOTES_FEFO = 10
+
+
+def asignar_fefo(insumo_id, cantidad, lote_produccion_id, usuario, lote_etapa_id=None, referencia_documento=''):
+    """
+    Asigna `cantidad` de un insumo a un lote de producción repartiéndola entre los
+    lotes APROBADOS vigentes en orden FEFO (vencimiento, recepción).
+
+    Los lotes se bloquean con select_for_update(skip_locked=True): las estaciones que
+    dispensan en paralelo toman lotes distintos sin esperarse entre sí. Cada lote se
+    descuenta con un UPDATE basado en F() y se registran el MovimientoInventario
+    (SALIDA) y el LoteInsumoConsumo de cada porción, todo en una transacción.
+
+    Lanza ValueError si el stock libre no alcanza (no se consume nada).
+    Retorna la lista de asignaciones {lote_insumo_id, codigo_lote_proveedor, ...}.
+    """
+    cantidad = Decimal(cantidad)
+    if cantidad <= 0:
+        raise ValueError('La cantidad debe ser mayor a cero')
+
+    with transaction.atomic():
+        insumo = Insumo.objects.get(pk=insumo_id)
+        candidatos = LoteInsumo.objects.select_for_update(skip_locked=True).filter(
+            insumo_id=insumo_id,
+            estado='APROBADO',
+            cantidad_actual__gt=0,
+            fecha_vencimiento__gte=timezone.localdate(),
+        ).order_by('fecha_vencimiento', 'fecha_recepcion', 'id')
+
+        pendiente = cantidad
+        asignaciones = []
+        vistos = []
+        while pendiente > 0:
+            tanda = list(
+                candidatos.exclude(id__in=vistos).values(
+                    'id', 'codigo_lote_proveedor', 'ubicacion_id', 'cantidad_actual', 'unidad', 'fecha_vencimiento'
+                )[:TANDA_LOTES_FEFO]
+            )
+            if not tanda:
+                break
+            for lote in tanda:
+                vistos.append(lote['id'])
+                tomado = min(pendiente, lote['cantidad_actual'])
+                agotado = tomado == lote['cantidad_actual']
+                actualizados = LoteInsumo.objects.filter(pk=lote['id'], cantidad_actual__gte=tomado).update(
+                    cantidad_actual=F('cantidad_actual') - tomado,
+                    estado='AGOTADO' if agotado else 'APROBADO',
+                )
+                if not actualizados:
+                    continue
+
+                # UPDATE directo: el saldo materializado se ajusta aquí (no hay señales)
+                clave = (insumo_id, lote['ubicacion_id'], 'APROBADO')
+                if agotado:
+                    ajustar_saldo(clave, -lote['cantidad_actual'], -1)
+                    ajustar_saldo((insumo_id, lote['ubicacion_id'], 'AGOTADO'), Decimal('0'), 1)
+                else:
+                    ajustar_saldo(clave, -tomado, 0)
+
+                asignaciones.append({**lote, 'cantidad': tomado, 'agotado': agotado})
+                pendiente -= tomado
+                if pendiente <= 0:
+                    break
+
+        if pendiente > 0:
+            # Revierte los descuentos ya hechos en esta transacción
+            raise ValueError(
+                f'Stock aprobado insuficiente para {insumo.codigo}: '
+                f'requerido {cantidad}, disponible {cantidad - pendiente} (sin contar lotes en uso por otra estación)'
+            )
+
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                tipo_item='INSUMO',
+                item_id=insumo_id,
+                lote_item_id=asignacion['id'],
+                tipo_movimiento='SALIDA',
+                motivo='PRODUCCION',
+                cantidad=asignacion['cantidad'],
+                unidad=asignacion['unidad'],
+                ubicacion_origen_id=asignacion['ubicacion_id'],
+                referencia_documento=referencia_documento,
+                registrado_por=usuario,
+                observaciones='Asignación FEFO',
+            )
+            for asignacion in asignaciones
+        ])
+        consumos = LoteInsumoConsumo.objects.bulk_create([
+            LoteInsumoConsumo(
+                lote_produccion_id=lote_produccion_id,
+                lote_etapa_id=lote_etapa_id,
+                insumo_id=insumo_id,
+                lote_insumo_id=asignacion['id'],
+                cantidad_planificada=asignacion['cantidad'],
+                cantidad_real=asignacion['cantidad'],
+                unidad=asignacion['unidad'],
+                registrado_por=usuario,
+            )
+            for asignacion in asignaciones
+        ])
+        # bulk_create no dispara señales: la genealogía se acumula aquí
+        acumular_genealogia({
+            (consumo.lote_insumo_id, lote_produccion_id): (consumo.cantidad_real, 1, consumo.fecha_consumo)
+            for consumo in consumos
+        })
+
+    return [
+        {
+            'lote_insumo_id': asignacion['id'],
+            'codigo_lote_proveedor': asignacion['codigo_lote_proveedor'],
+            'fecha_vencimiento': asignacion['fecha_vencimiento'],
+            'ubicacion_id': asignacion['ubicacion_id'],
+            'cantidad': asignacion['cantidad'],
+            'unidad': asignacion['unidad'],
+            'agotado': asignacion['agotado'],
+        }
+        for asignacion in asignaciones
+    ]
+
+
+# ============================================
+# RESUMEN DE MOVIMIENTOS Y CIERRES (CierreInventario)
+# ============================================
+
+TIPOS_ITEM = [codigo for codigo, _ in MovimientoInventario.TIPO_ITEM_CHOICES]
+MOTIVOS = [codigo for codigo, _ in MovimientoInventario.MOTIVO_CHOICES]
+
+# Catálogo de cada tipo de ítem: (modelo, campos para código y nombre)
+CATALOGO_ITEMS = {
+    'INSUMO': Insumo,
+    'REPUESTO': Repuesto,
+    'PRODUCTO_TERMINADO': Producto,
+}
+
+_DECIMAL = DecimalField(max_digits=14, decimal_places=2)
+_CERO = Value(Decimal('0.00'), output_field=_DECIMAL)
+
+
+def fin_del_dia(fecha):
+    """Instante (con zona horaria) en que termina el día local `fecha`"""
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def cantidad_con_signo():
+    """
+    Efecto de un movimiento sobre el saldo del ítem:
+    ENTRADA suma, SALIDA resta, AJUSTE suma con signo y TRANSFERENCIA no altera el total.
+    """
+    return Case(
+        When(tipo_movimiento='ENTRADA', then=F('cantidad')),
+        When(tipo_movimiento='SALIDA', then=-F('cantidad')),
+        When(tipo_movimiento='AJUSTE', then=F('cantidad')),
+        default=_CERO,
+        output_field=_DECIMAL,
+    )
+
+
+def _suma_si(condicion, valor=None):
+    """Sum(Case(When(condicion, then=valor))) con 0 por defecto"""
+    return Coalesce(
+        Sum(Case(When(condicion, then=valor if valor is not None else F('cantidad')), default=_CERO, output_field=_DECIMAL)),
+        _CERO,
+    )
+
+
+def ultimo_cierre(tipo_item, antes_de):
+    """Fecha del último cierre de `tipo_item` anterior a la fecha indicada (o None)"""
+    return CierreInventario.objects.filter(
+        tipo_item=tipo_item, fecha__lt=antes_de
+    ).aggregate(fecha=Max('fecha'))['fecha']
+
+
+def _saldos_cierre(tipo_item, fecha):
+    """Saldos por ítem (todas las ubicaciones) del cierre indicado"""
+    if fecha is None:
+        return {}
+    return dict(
+        CierreInventario.objects.filter(tipo_item=tipo_item, fecha=fecha).order_by()
+        .values('item_id').annotate(total=Sum('saldo')).values_list('item_id', 'total')
+    )
+
+
+def _movimientos_desde_cierre(tipo_item, cierre, hasta):
+    """Movimientos posteriores al cierre (o toda la historia) hasta el final de `hasta`"""
+    movimientos = MovimientoInventario.objects.filter(
+        tipo_item=tipo_item,
+        fecha_movimiento__lt=fin_del_dia(hasta)
+    )
+    if cierre:
+        movimientos = movimientos.filter(fecha_movimiento__gte=fin_del_dia(cierre))
+    return movimientos.order_by()
+
+
+def resumen_movimientos(tipo_item, desde, hasta):
+    """
+    Resumen de inventario por ítem para el rango [desde, hasta] (fechas locales).
+
+    El saldo inicial parte del último CierreInventario anterior a `desde` y solo se
+    recorren los movimientos posteriores a ese cierre, en una única consulta
+    agrupada por ítem con agregación condicional (saldo previo, entradas y salidas
+    por motivo, ajustes y neto del período).
+    """
+    if tipo_item not in TIPOS_ITEM:
+        raise ValueError(f'tipo_item debe ser uno de: {", ".join(TIPOS_ITEM)}')
+
+    cierre = ultimo_cierre(tipo_item, desde)
+    saldos_cierre = _saldos_cierre(tipo_item, cierre)
+    inicio = fin_del_dia(desde - timedelta(days=1))
+    en_periodo = Q(fecha_movimiento__gte=inicio)
+
+    agregados = {
+        'neto_previo': _suma_si(Q(fecha_movimiento__lt=inicio), cantidad_con_signo()),
+        'entradas': _suma_si(en_periodo & Q(tipo_movimiento='ENTRADA')),
+        'salidas': _suma_si(en_periodo & Q(tipo_movimiento='SALIDA')),
+        'ajustes': _suma_si(en_periodo & Q(tipo_movimiento='AJUSTE')),
+        'transferencias': _suma_si(en_periodo & Q(tipo_movimiento='TRANSFERENCIA')),
+        'movimientos': Count('id', filter=en_periodo),
+    }
+    for motivo in MOTIVOS:
+        agregados[f'entradas_{motivo}'] = _suma_si(en_periodo & Q(tipo_movimiento='ENTRADA', motivo=motivo))
+        agregados[f'salidas_{motivo}'] = _suma_si(en_periodo & Q(tipo_movimiento='SALIDA', motivo=motivo))
+
+    filas = {
+        fila['item_id']: fila
+        for fila in _movimientos_desde_cierre(tipo_item, cierre, hasta).values('item_id').annotate(**agregados)
+    }
+
+    item_ids = sorted(set(filas) | set(saldos_cierre))
+    catalogo = {
+        item['id']: item
+        for item in CATALOGO_ITEMS[tipo_item].objects.filter(id__in=item_ids).values('id', 'codigo', 'nombre')
+    }
+
+    items = []
+    totales = {'entradas': Decimal('0'), 'salidas': Decimal('0'), 'ajustes': Decimal('0'), 'neto': Decimal('0')}
+    for item_id in item_ids:
+        fila = filas.get(item_id)
+        saldo_inicial = saldos_cierre.get(item_id, Decimal('0')) + (fila['neto_previo'] if fila else 0)
+        entradas = fila['entradas'] if fila else Decimal('0')
+        salidas = fila['salidas'] if fila else Decimal('0')
+        ajustes = fila['ajustes'] if fila else Decimal('0')
+        neto = entradas - salidas + ajustes
+
+        por_motivo = {}
+        if fila:
+            for motivo in MOTIVOS:
+                if fila[f'entradas_{motivo}'] or fila[f'salidas_{motivo}']:
+                    por_motivo[motivo] = {
+                        'entradas': fila[f'entradas_{motivo}'],
+                        'salidas': fila[f'salidas_{motivo}'],
+                    }
+
+        item = catalogo.get(item_id, {})
+        items.append({
+            'item_id': item_id,
+            'codigo': item.get('codigo'),
+            'nombre': item.get('nombre'),
+            'saldo_inicial': saldo_inicial,
+            'entradas': entradas,
+            'salidas': salidas,
+            'ajustes': ajustes,
+            'transferencias': fila['transferencias'] if fila else Decimal('0'),
+            'neto': neto,
+            'saldo_final': saldo_inicial + neto,
+            'movimientos': fila['movimientos'] if fila else 0,
+            'por_motivo': por_motivo,
+        })
+        totales['entradas'] += entradas
+        totales['salidas'] += salidas
+        totales['ajustes'] += ajustes
+        totales['neto'] += neto
+
+    return {
+        'tipo_item': tipo_item,
+        'desde': desde,
+        'hasta': hasta,
+        'cierre_base': cierre,
+        'total_items': len(items),
+        'totales': totales,
+        'items': items,
+    }
+
+
+# ============================================
+# SALDOS POR UBICACIÓN Y CONSULTAS A FECHA (as_of)
+# ============================================
+# Cada movimiento se descompone en patas por ubicación:
+# - destino: ENTRADA y TRANSFERENCIA suman; AJUSTE con ubicacion_destino suma con signo
+# - origen: SALIDA y TRANSFERENCIA restan; AJUSTE sin ubicacion_destino suma con signo
+# La suma de las patas de un ítem coincide con cantidad_con_signo().
+
+_PATA_DESTINO = Q(tipo_movimiento__in=['ENTRADA', 'TRANSFERENCIA']) | Q(tipo_movimiento='AJUSTE', ubicacion_destino__isnull=False)
+_PATA_ORIGEN = Q(tipo_movimiento__in=['SALIDA', 'TRANSFERENCIA']) | Q(tipo_movimiento='AJUSTE', ubicacion_destino__isnull=True)
+
+
+def _efecto_origen():
+    return Case(
+        When(tipo_movimiento='AJUSTE', then=F('cantidad')),
+        default=-F('cantidad'),
+        output_field=_DECIMAL,
+    )
+
+
+def efecto_en_ubicacion(ubicacion_id):
+    """Efecto con signo de un movimiento sobre el saldo de una ubicación"""
+    return (
+        Case(When(_PATA_DESTINO & Q(ubicacion_destino_id=ubicacion_id), then=F('cantidad')), default=_CERO, output_field=_DECIMAL)
+        + Case(When(_PATA_ORIGEN & Q(ubicacion_origen_id=ubicacion_id), then=_efecto_origen()), default=_CERO, output_field=_DECIMAL)
+    )
+
+
+def netos_por_ubicacion(movimientos):
+    """Neto por (item_id, ubicacion_id) de un queryset de movimientos (dos consultas agrupadas)"""
+    netos = {}
+    patas = (
+        (movimientos.filter(_PATA_DESTINO), 'ubicacion_destino_id', F('cantidad')),
+        (movimientos.filter(_PATA_ORIGEN), 'ubicacion_origen_id', _efecto_origen()),
+    )
+    for queryset, campo_ubicacion, efecto in patas:
+        for item_id, ubicacion_id, neto in queryset.values('item_id', campo_ubicacion).annotate(
+            neto=Sum(efecto, output_field=_DECIMAL)
+        ).values_list('item_id', campo_ubicacion, 'neto'):
+            clave = (item_id, ubicacion_id)
+            netos[clave] = netos.get(clave, Decimal('0')) + neto
+    return netos
+
+
+def saldos_a_fecha(tipo_item, fecha, ubicacion_id=None):
+    """
+    Saldo por (item_id, ubicacion_id) al final del día `fecha`: parte del último
+    cierre hasta esa fecha inclusive y aplica solo los movimientos posteriores.
+    """
+    cierre = ultimo_cierre(tipo_item, fecha + timedelta(days=1))
+    saldos = {}
+    if cierre:
+        snapshot = CierreInventario.objects.filter(tipo_item=tipo_item, fecha=cierre)
+        if ubicacion_id is not None:
+            snapshot = snapshot.filter(ubicacion_id=ubicacion_id)
+        saldos = {
+            (item_id, ubicacion): saldo
+            for item_id, ubicacion, saldo in snapshot.values_list('item_id', 'ubicacion_id', 'saldo')
+        }
+
+    movimientos = _movimientos_desde_cierre(tipo_item, cierre, fecha)
+    if ubicacion_id is not None:
+        movimientos = movimientos.filter(Q(ubicacion_origen_id=ubicacion_id) | Q(ubicacion_destino_id=ubicacion_id))
+    for clave, neto in netos_por_ubicacion(movimientos).items():
+        if ubicacion_id is None or clave[1] == ubicacion_id:
+            saldos[clave] = saldos.get(clave, Decimal('0')) + neto
+    return saldos
+
+
+def stock_a_fecha_subquery(tipo_item, fecha, ubicacion_id=None, item_ref='pk'):
+    """
+    Expresión con el saldo de un ítem al final del día `fecha` (opcionalmente en una
+    ubicación), para anotar querysets de Insumo/Repuesto: saldo del último cierre
+    + movimientos posteriores, con dos subconsultas correlacionadas por fila.
+    """
+    cierre = ultimo_cierre(tipo_item, fecha + timedelta(days=1))
+
+    saldo_cierre = _CERO
+    if cierre:
+        snapshot = CierreInventario.objects.filter(tipo_item=tipo_item, fecha=cierre, item_id=OuterRef(item_ref))
+        if ubicacion_id is not None:
+            snapshot = snapshot.filter(ubicacion_id=ubicacion_id)
+        saldo_cierre = Coalesce(
+            Subquery(
+                snapshot.order_by().values('item_id').annotate(total=Sum('saldo')).values('total'),
+                output_field=_DECIMAL
+            ),
+            _CERO,
+        )
+
+    movimientos = _movimientos_desde_cierre(tipo_item, cierre, fecha).filter(item_id=OuterRef(item_ref))
+    if ubicacion_id is not None:
+        movimientos = movimientos.filter(Q(ubicacion_origen_id=ubicacion_id) | Q(ubicacion_destino_id=ubicacion_id))
+        efecto = efecto_en_ubicacion(ubicacion_id)
+    else:
+        efecto = cantidad_con_signo()
+    neto = Coalesce(
+        Subquery(
+            movimientos.values('item_id').annotate(total=Sum(efecto, output_field=_DECIMAL)).values('total'),
+            output_field=_DECIMAL
+        ),
+        _CERO,
+    )
+    return ExpressionWrapper(saldo_cierre + neto, output_field=_DECIMAL)
+
+
+def cerrar_inventario(fecha, tipos_item=None):
+    """
+    Genera (o regenera) el CierreInventario al final del día `fecha` para cada tipo
+    de ítem y ubicación: saldos del cierre anterior + neto de los movimientos
+    posteriores. Retorna la cantidad de saldos escritos.
+    """
+    total = 0
+    for tipo_item in tipos_item or TIPOS_ITEM:
+        cierres = [
+            CierreInventario(fecha=fecha, tipo_item=tipo_item, item_id=item_id, ubicacion_id=ubicacion_id, saldo=saldo)
+            for (item_id, ubicacion_id), saldo in saldos_a_fecha(tipo_item, fecha).items()
+        ]
+        # Reemplazo completo: la ubicación puede ser NULL, que no participa de la unicidad
+        with transaction.atomic():
+            CierreInventario.objects.filter(fecha=fecha, tipo_item=tipo_item).delete()
+            CierreInventario.objects.bulk_create(cierres, batch_size=1000)
+        total += len(cierres)
+    return total
@@ -0,0 +1,613 @@
+"""
+Motor de cálculo de KPIs de producción para SIPROSA MES
+OEE (Disponibilidad × Rendimiento × Calidad) calculado con consultas agregadas
+y rollup diario incremental (ResumenProduccionDiario)
+"""
+
+import hashlib
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (
+    Count, Sum, F, Q, OuterRef, Subquery, ExpressionWrapper, DurationField,
+    DateTimeField, CharField, IntegerField, Case, When, Value
+)
+from django.db.models.functions import TruncDate, TruncHour, TruncWeek, TruncMonth, TruncTime, Coalesce
+from django.utils import timezone
+
+from .models import Lote, LoteEtapa, Parada, Turno, ResumenProduccionDiario, Incidente, OrdenTrabajo
+
+
+# Estados de lote que cuentan para el cálculo de OEE
+ESTADOS_OEE = ['FINALIZADO', 'LIBERADO']
+
+
+def rango_dias(desde, hasta):
+    """
+    Instantes [inicio, fin) que cubren los días locales desde..hasta. Filtrar el campo
+    DateTime contra estos límites (en lugar de __date) permite usar sus índices.
+    """
+    return (
+        timezone.make_aware(datetime.combine(desde, time.min)),
+        timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)),
+    )
+
+
+def _horas(duracion):
+    """Convierte un timedelta (o None) a horas"""
+    if not duracion:
+        return 0
+    return duracion.total_seconds() / 3600
+
+
+def _duracion(inicio, fin):
+    """Expresión SQL con la duración entre dos campos DateTime"""
+    return ExpressionWrapper(F(fin) - F(inicio), output_field=DurationField())
+
+
+def lotes_oee(desde, hasta, turno=None):
+    """Queryset de lotes finalizados/liberados cuyo inicio real cae en el rango"""
+    inicio, fin = rango_dias(desde, hasta)
+    lotes = Lote.objects.filter(
+        estado__in=ESTADOS_OEE,
+        fecha_real_inicio__gte=inicio,
+        fecha_real_inicio__lt=fin,
+    )
+    if turno:
+        lotes = lotes.filter(turno__codigo=turno)
+    return lotes
+
+
+def _resultado_oee(desde, hasta, turno, totales, series):
+    """
+    Arma la respuesta de OEE a partir de los totales del período.
+    `totales` trae horas planificadas/reales/paradas y cantidades.
+    """
+    total_lotes = totales['total_lotes']
+    if total_lotes == 0:
+        return {
+            'desde': desde,
+            'hasta': hasta,
+            'turno': turno,
+            'total_lotes': 0,
+            'oee': 0,
+            'disponibilidad': 0,
+            'rendimiento': 0,
+            'calidad': 0,
+            'message': 'No hay lotes finalizados en el período seleccionado'
+        }
+
+    # DISPONIBILIDAD: Tiempo operativo / Tiempo planificado
+    tiempo_planificado_total = totales['tiempo_planificado_horas']
+    tiempo_real_total = totales['tiempo_real_horas']
+    tiempo_paradas_total = totales['tiempo_paradas_horas']
+    tiempo_operativo = tiempo_real_total - tiempo_paradas_total
+    disponibilidad = (tiempo_operativo / tiempo_planificado_total * 100) if tiempo_planificado_total > 0 else 0
+
+    # RENDIMIENTO: Cantidad producida / Cantidad planificada
+    cantidad_planificada_total = totales['cantidad_planificada'] or 0
+    cantidad_producida_total = totales['cantidad_producida'] or 0
+    rendimiento = (cantidad_producida_total / cantidad_planificada_total * 100) if cantidad_planificada_total > 0 else 0
+
+    # CALIDAD: Buenos / Total producido
+    cantidad_rechazada_total = totales['cantidad_rechazada'] or 0
+    cantidad_buena = cantidad_producida_total - cantidad_rechazada_total
+    calidad = (cantidad_buena / cantidad_producida_total * 100) if cantidad_producida_total > 0 else 0
+
+    # OEE = Disponibilidad × Rendimiento × Calidad
+    oee = (disponibilidad / 100) * (rendimiento / 100) * (calidad / 100) * 100
+
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'turno': turno,
+        'total_lotes': total_lotes,
+        'oee': round(oee, 2),
+        'disponibilidad': round(disponibilidad, 2),
+        'rendimiento': round(rendimiento, 2),
+        'calidad': round(calidad, 2),
+        'metricas': {
+            'tiempo_planificado_horas': round(tiempo_planificado_total, 2),
+            'tiempo_real_horas': round(tiempo_real_total, 2),
+            'tiempo_paradas_horas': round(tiempo_paradas_total, 2),
+            'tiempo_operativo_horas': round(tiempo_operativo, 2),
+            'cantidad_planificada': cantidad_planificada_total,
+            'cantidad_producida': cantidad_producida_total,
+            'cantidad_rechazada': cantidad_rechazada_total,
+            'cantidad_buena': cantidad_buena
+        },
+        'series': [
+            {
+                'fecha': fila['fecha'].isoformat(),
+                'lotes': fila['lotes'],
+                'cantidad_producida': fila['cantidad_producida'] or 0
+            }
+            for fila in series
+        ]
+    }
+
+
+# Columnas del export detallado por lote (orden de salida en CSV/NDJSON)
+COLUMNAS_EXPORT_LOTES = [
+    'codigo_lote', 'producto', 'turno', 'estado',
+    'fecha_real_inicio', 'fecha_real_fin',
+    'cantidad_planificada', 'cantidad_producida', 'cantidad_rechazada',
+    'etapas', 'minutos_etapas', 'minutos_parada',
+]
+
+
+def _hora_local(valor):
+    """DateTime en la zona horaria local (o None)"""
+    return timezone.localtime(valor).isoformat() if valor else None
+
+
+def filas_export_lotes(desde, hasta, turno=None, chunk_size=2000):
+    """
+    Iterador de filas (dict) por lote para el export detallado de KPIs.
+
+    Las métricas de etapas y paradas se calculan con subconsultas correlacionadas
+    en la misma consulta, y las filas se leen con un cursor del lado del servidor
+    (.iterator) de a `chunk_size`, sin cargar el resultado completo en memoria.
+    """
+    etapas = LoteEtapa.objects.filter(lote=OuterRef('pk')).values('lote')
+    paradas = Parada.objects.filter(
+        lote_etapa__lote=OuterRef('pk'),
+        fecha_fin__isnull=False
+    ).values('lote_etapa__lote')
+
+    lotes = lotes_oee(desde, hasta, turno).annotate(
+        producto_codigo=F('producto__codigo'),
+        turno_codigo=F('turno__codigo'),
+        etapas_total=Subquery(etapas.annotate(total=Count('id')).values('total')),
+        minutos_etapas=Subquery(etapas.annotate(total=Sum('duracion_minutos')).values('total')),
+        minutos_parada=Subquery(paradas.annotate(total=Sum('duracion_minutos')).values('total')),
+    ).order_by('fecha_real_inicio', 'codigo_lote')
+
+    for fila in lotes.values(
+        'codigo_lote', 'producto_codigo', 'turno_codigo', 'estado',
+        'fecha_real_inicio', 'fecha_real_fin',
+        'cantidad_planificada', 'cantidad_producida', 'cantidad_rechazada',
+        'etapas_total', 'minutos_etapas', 'minutos_parada',
+    ).iterator(chunk_size=chunk_size):
+        yield {
+            'codigo_lote': fila['codigo_lote'],
+            'producto': fila['producto_codigo'],
+            'turno': fila['turno_codigo'],
+            'estado': fila['estado'],
+            'fecha_real_inicio': _hora_local(fila['fecha_real_inicio']),
+            'fecha_real_fin': _hora_local(fila['fecha_real_fin']),
+            'cantidad_planificada': fila['cantidad_planificada'],
+            'cantidad_producida': fila['cantidad_producida'],
+            'cantidad_rechazada': fila['cantidad_rechazada'],
+            'etapas': fila['etapas_total'] or 0,
+            'minutos_etapas': fila['minutos_etapas'] or 0,
+            'minutos_parada': fila['minutos_parada'] or 0,
+        }
+
+
+# ============================================
+# SERIES DE KPIs POR GRANULARIDAD
+# ============================================
+
+GRANULARIDADES = ['hour', 'turno', 'day', 'week', 'month']
+AGRUPACIONES = {
+    'producto': 'producto__codigo',
+    'turno': 'turno__codigo',
+    'maquina': 'maquina_codigo',
+}
+
+
+def _expresion_turno():
+    """
+    Expresiones (turno, fecha_turno) calculadas en la base según Turno.hora_inicio/hora_fin
+    sobre la hora local de fecha_real_inicio.
+    Un turno nocturno (hora_fin <= hora_inicio) cruza la medianoche: lo iniciado
+    antes de hora_fin pertenece al turno del día anterior.
+    """
+    casos_turno = []
+    casos_fecha = []
+    dia_anterior = TruncDate(ExpressionWrapper(
+        F('fecha_real_inicio') - Value(timedelta(days=1)), output_field=DateTimeField()
+    ))
+    for turno in Turno.objects.filter(activo=True):
+        if turno.hora_inicio < turno.hora_fin:
+            condicion = Q(hora_inicio_real__gte=turno.hora_inicio, hora_inicio_real__lt=turno.hora_fin)
+        else:
+            condicion = Q(hora_inicio_real__gte=turno.hora_inicio) | Q(hora_inicio_real__lt=turno.hora_fin)
+            casos_fecha.append(When(hora_inicio_real__lt=turno.hora_fin, then=dia_anterior))
+        casos_turno.append(When(condicion, then=Value(turno.codigo)))
+
+    turno = Case(*casos_turno, default=Value(None), output_field=CharField())
+    fecha = Case(*casos_fecha, default=TruncDate('fecha_real_inicio')) if casos_fecha else TruncDate('fecha_real_inicio')
+    return turno, fecha
+
+
+def serie_kpis(desde, hasta, granularidad='day', agrupar=None, turno=None):
+    """
+    Serie de KPIs de producción por intervalo de tiempo, calculada en una sola
+    consulta agrupada (más la lectura de Turno para granularidad 'turno').
+
+    granularidad: hour | turno | day | week | month
+    agrupar: None | producto | maquina | turno
+    """
+    if granularidad not in GRANULARIDADES:
+        raise ValueError(f'granularity debe ser una de: {", ".join(GRANULARIDADES)}')
+    if agrupar and agrupar not in AGRUPACIONES:
+        raise ValueError(f'group_by debe ser uno de: {", ".join(AGRUPACIONES)}')
+
+    paradas = Parada.objects.filter(
+        lote_etapa__lote=OuterRef('pk'),
+        fecha_fin__isnull=False
+    ).values('lote_etapa__lote').annotate(total=Sum('duracion_minutos')).values('total')
+
+    lotes = lotes_oee(desde, hasta, turno).annotate(
+        minutos_parada_lote=Coalesce(Subquery(paradas, output_field=IntegerField()), 0)
+    )
+
+    campos = ['periodo']
+    if granularidad == 'turno':
+        turno_expr, fecha_expr = _expresion_turno()
+        lotes = lotes.annotate(hora_inicio_real=TruncTime('fecha_real_inicio'))
+        lotes = lotes.annotate(periodo=fecha_expr, turno_periodo=turno_expr)
+        campos.append('turno_periodo')
+    else:
+        truncar = {
+            'hour': TruncHour, 'day': TruncDate, 'week': TruncWeek, 'month': TruncMonth
+        }[granularidad]
+        lotes = lotes.annotate(periodo=truncar('fecha_real_inicio'))
+
+    if agrupar == 'maquina':
+        lotes = lotes.annotate(maquina_codigo=Subquery(
+            LoteEtapa.objects.filter(lote=OuterRef('pk')).order_by('-orden').values('maquina__codigo')[:1]
+        ))
+    if agrupar:
+        campos.append(AGRUPACIONES[agrupar])
+
+    filas = lotes.values(*campos).annotate(
+        lotes=Count('id'),
+        tiempo_planificado=Sum(_duracion('fecha_planificada_inicio', 'fecha_planificada_fin')),
+        tiempo_real=Sum(
+            _duracion('fecha_real_inicio', 'fecha_real_fin'),
+            filter=Q(fecha_real_fin__isnull=False)
+        ),
+        minutos_parada=Sum('minutos_parada_lote'),
+        cantidad_planificada=Sum('cantidad_planificada'),
+        cantidad_producida=Sum('cantidad_producida'),
+        cantidad_rechazada=Sum('cantidad_rechazada'),
+    ).order_by(*campos)
+
+    serie = []
+    for fila in filas:
+        totales = {
+            'total_lotes': fila['lotes'],
+            'tiempo_planificado_horas': _horas(fila['tiempo_planificado']),
+            'tiempo_real_horas': _horas(fila['tiempo_real']),
+            'tiempo_paradas_horas': (fila['minutos_parada'] or 0) / 60,
+            'cantidad_planificada': fila['cantidad_planificada'],
+            'cantidad_producida': fila['cantidad_producida'],
+            'cantidad_rechazada': fila['cantidad_rechazada'],
+        }
+        resultado = _resultado_oee(desde, hasta, turno, totales, [])
+        punto = {
+            'periodo': fila['periodo'].isoformat() if fila['periodo'] else None,
+        }
+        if granularidad == 'turno':
+            punto['turno'] = fila['turno_periodo']
+        if agrupar:
+            punto[agrupar] = fila[AGRUPACIONES[agrupar]]
+        punto.update({
+            'lotes': fila['lotes'],
+            'oee': resultado['oee'],
+            'disponibilidad': resultado['disponibilidad'],
+            'rendimiento': resultado['rendimiento'],
+            'calidad': resultado['calidad'],
+            **resultado['metricas'],
+        })
+        serie.append(punto)
+
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'turno': turno,
+        'granularity': granularidad,
+        'group_by': agrupar,
+        'series': serie,
+    }
+
+
+# ============================================
+# ROLLUP DIARIO (ResumenProduccionDiario)
+# ============================================
+
+def resumen_periodo(desde, hasta=None, turno=None):
+    """Filas del rollup diario en el rango (hasta=None: sin límite superior)"""
+    resumen = ResumenProduccionDiario.objects.filter(fecha__gte=desde)
+    if hasta:
+        resumen = resumen.filter(fecha__lte=hasta)
+    if turno:
+        resumen = resumen.filter(turno__codigo=turno)
+    return resumen
+
+
+def totales_resumen(resumen):
+    """Suma las filas del rollup en una sola consulta agregada"""
+    totales = resumen.aggregate(
+        total_lotes=Sum('lotes'),
+        horas_planificadas=Sum('horas_planificadas'),
+        horas_reales=Sum('horas_reales'),
+        minutos_parada=Sum('minutos_parada'),
+        cantidad_planificada=Sum('cantidad_planificada'),
+        cantidad_producida=Sum('cantidad_producida'),
+        cantidad_rechazada=Sum('cantidad_rechazada'),
+    )
+    totales['total_lotes'] = totales['total_lotes'] or 0
+    totales['tiempo_planificado_horas'] = float(totales['horas_planificadas'] or 0)
+    totales['tiempo_real_horas'] = float(totales['horas_reales'] or 0)
+    totales['tiempo_paradas_horas'] = (totales['minutos_parada'] or 0) / 60
+    return totales
+
+
+def calcular_oee_resumen(desde, hasta, turno=None):
+    """
+    Calcula OEE desde el rollup diario: una suma sobre ~días×turnos×máquinas×productos
+    filas pequeñas más la serie diaria (dos consultas).
+    """
+    resumen = resumen_periodo(desde, hasta, turno)
+    totales = totales_resumen(resumen)
+    if totales['total_lotes'] == 0:
+        return _resultado_oee(desde, hasta, turno, totales, [])
+
+    series = (
+        resumen.values('fecha')
+        .annotate(lotes=Sum('lotes'), cantidad_producida=Sum('cantidad_producida'))
+        .filter(lotes__gt=0)
+        .order_by('fecha')
+    )
+    return _resultado_oee(desde, hasta, turno, totales, series)
+
+
+def fecha_local(valor):
+    """Fecha local (zona horaria actual) de un DateTime, como en los lookups __date"""
+    if valor is None:
+        return None
+    if timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    return valor.date()
+
+
+def _filas_resumen(lotes):
+    """
+    Filas del rollup {(fecha, turno_id, maquina_id, producto_id): ResumenProduccionDiario}
+    calculadas para el queryset de lotes (sin guardar).
+
+    Las cantidades, horas y conteo de cada lote se asignan a la máquina de su
+    última etapa; los minutos de parada a la máquina de la etapa donde ocurrieron.
+    Usa un número fijo de consultas sin importar la cantidad de lotes.
+    """
+    ultima_maquina = LoteEtapa.objects.filter(
+        lote=OuterRef('pk')
+    ).order_by('-orden').values('maquina_id')[:1]
+
+    filas = {}
+
+    def _fila(fecha, turno_id, maquina_id, producto_id):
+        clave = (fecha, turno_id, maquina_id, producto_id)
+        if clave not in filas:
+            filas[clave] = ResumenProduccionDiario(
+                fecha=fecha, turno_id=turno_id, maquina_id=maquina_id, producto_id=producto_id
+            )
+        return filas[clave]
+
+    # Métricas a nivel lote agrupadas por día/turno/máquina final/producto
+    por_lote = (
+        lotes.annotate(
+            fecha=TruncDate('fecha_real_inicio'),
+            maquina_final=Subquery(ultima_maquina),
+        )
+        .values('fecha', 'turno_id', 'maquina_final', 'producto_id')
+        .annotate(
+            lotes=Count('id'),
+            tiempo_planificado=Sum(_duracion('fecha_planificada_inicio', 'fecha_planificada_fin')),
+            tiempo_real=Sum(
+                _duracion('fecha_real_inicio', 'fecha_real_fin'),
+                filter=Q(fecha_real_fin__isnull=False)
+            ),
+            cantidad_planificada=Sum('cantidad_planificada'),
+            cantidad_producida=Sum('cantidad_producida'),
+            cantidad_rechazada=Sum('cantidad_rechazada'),
+        )
+        .order_by()
+    )
+    for grupo in por_lote:
+        fila = _fila(grupo['fecha'], grupo['turno_id'], grupo['maquina_final'], grupo['producto_id'])
+        fila.lotes = grupo['lotes']
+        fila.horas_planificadas = Decimal(str(round(_horas(grupo['tiempo_planificado']), 4)))
+        fila.horas_reales = Decimal(str(round(_horas(grupo['tiempo_real']), 4)))
+        fila.cantidad_planificada = grupo['cantidad_planificada'] or 0
+        fila.cantidad_producida = grupo['cantidad_producida'] or 0
+        fila.cantidad_rechazada = grupo['cantidad_rechazada'] or 0
+
+    # Minutos de parada agrupados por la máquina de la etapa
+    por_parada = (
+        Parada.objects.filter(
+            lote_etapa__lote__in=lotes.values('id'),
+            fecha_fin__isnull=False
+        )
+        .annotate(fecha=TruncDate('lote_etapa__lote__fecha_real_inicio'))
+        .values('fecha', 'lote_etapa__lote__turno_id', 'lote_etapa__maquina_id', 'lote_etapa__lote__producto_id')
+        .annotate(minutos=Sum('duracion_minutos'))
+        .order_by()
+    )
+    for grupo in por_parada:
+        fila = _fila(
+            grupo['fecha'], grupo['lote_etapa__lote__turno_id'],
+            grupo['lote_etapa__maquina_id'], grupo['lote_etapa__lote__producto_id']
+        )
+        fila.minutos_parada = grupo['minutos'] or 0
+
+    return filas
+
+
+def _bloquear_grupos_resumen(grupos):
+    """
+    Serializa las actualizaciones concurrentes del rollup sobre los mismos grupos
+    (fecha, turno_id, producto_id): sin esto dos guardados simultáneos borran e insertan
+    las mismas filas (IntegrityError o filas duplicadas). En PostgreSQL toma un advisory
+    lock por grupo, en orden para no cruzarse, que se libera al terminar la transacción;
+    SQLite ya serializa las escrituras.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    claves = sorted({
+        int.from_bytes(hashlib.blake2b(f'resumen:{fecha}:{turno_id}:{producto_id}'.encode(), digest_size=8).digest(),
+                       'big', signed=True)
+        for fecha, turno_id, producto_id in grupos
+    })
+    with connection.cursor() as cursor:
+        for clave in claves:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [clave])
+
+
+def reconstruir_resumen(desde, hasta):
+    """
+    Recalcula desde cero las filas del rollup para el rango de fechas [desde, hasta].
+    Bloquea la tabla contra escrituras (las señales esperan) mientras la reemplaza.
+    Retorna la cantidad de filas generadas.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                tabla = connection.ops.quote_name(ResumenProduccionDiario._meta.db_table)
+                cursor.execute(f'LOCK TABLE {tabla} IN SHARE ROW EXCLUSIVE MODE')
+        filas = _filas_resumen(lotes_oee(desde, hasta))
+        ResumenProduccionDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+        ResumenProduccionDiario.objects.bulk_create(filas.values(), batch_size=1000)
+
+    return len(filas)
+
+
+def actualizar_resumen_claves(claves):
+    """
+    Recalcula solo las filas del rollup de las claves (fecha, turno_id, maquina_id,
+    producto_id) indicadas. Llamado desde las señales de Lote, LoteEtapa y Parada con
+    las claves que toca la fila modificada: lee únicamente los lotes de esas
+    combinaciones de día, turno y producto, no el día completo. Los grupos se bloquean
+    antes de leer, así el cálculo ve lo que confirmó cualquier otra actualización.
+    """
+    claves = {clave for clave in claves if clave[0] is not None}
+    if not claves:
+        return
+    grupos = {(fecha, turno_id, producto_id) for fecha, turno_id, _, producto_id in claves}
+
+    with transaction.atomic():
+        _bloquear_grupos_resumen(grupos)
+
+        lotes = Q()
+        for fecha, turno_id, producto_id in grupos:
+            inicio, fin = rango_dias(fecha, fecha)
+            lotes |= Q(fecha_real_inicio__gte=inicio, fecha_real_inicio__lt=fin, turno_id=turno_id, producto_id=producto_id)
+        filas = _filas_resumen(Lote.objects.filter(lotes, estado__in=ESTADOS_OEE))
+
+        existentes = Q()
+        for fecha, turno_id, maquina_id, producto_id in claves:
+            existentes |= Q(fecha=fecha, turno_id=turno_id, maquina_id=maquina_id, producto_id=producto_id)
+
+        ResumenProduccionDiario.objects.filter(existentes).delete()
+        ResumenProduccionDiario.objects.bulk_create(
+            [fila for clave, fila in filas.items() if clave in claves], batch_size=1000
+        )
+
+
+# ============================================
+# SNAPSHOT DEL DASHBOARD (caché invalidada por señales)
+# ============================================
+
+CLAVE_CACHE_DASHBOARD = 'kpis:dashboard'
+# Se incrementa en cada invalidación; el snapshot guarda la generación con la que se calculó
+CLAVE_GENERACION_DASHBOARD = 'kpis:dashboard:generacion'
+
+
+def calcular_dashboard():
+    """
+    Calcula el payload completo del dashboard con un conteo agregado por modelo
+    (Lote, Incidente, OrdenTrabajo) y el OEE de 7 días desde el rollup diario.
+    """
+    ahora = timezone.now()
+    hoy = timezone.localdate(ahora)
+
+    lotes = Lote.objects.aggregate(
+        activos=Count('id', filter=Q(estado__in=['EN_PROCESO', 'PAUSADO'])),
+        hoy=Count('id', filter=Q(fecha_real_inicio__date=hoy)),
+        total=Count('id'),
+    )
+    incidentes = Incidente.objects.aggregate(
+        abiertos=Count('id', filter=~Q(estado='CERRADO')),
+        criticos=Count('id', filter=Q(severidad='CRITICA', estado__in=['ABIERTO', 'EN_INVESTIGACION'])),
+        total=Count('id'),
+    )
+    ordenes = OrdenTrabajo.objects.aggregate(
+        abiertas=Count('id', filter=~Q(estado__in=['COMPLETADA', 'CANCELADA'])),
+        urgentes=Count('id', filter=Q(prioridad='URGENTE', estado__in=['ABIERTA', 'ASIGNADA', 'EN_PROCESO'])),
+        total=Count('id'),
+    )
+
+    # OEE de los últimos 7 días, con disponibilidad real (tiempo operativo / planificado)
+    desde = hoy - timedelta(days=7)
+    oee = _resultado_oee(desde, hoy, None, totales_resumen(resumen_periodo(desde)), [])
+
+    return {
+        'fecha': hoy,
+        'generated_at': ahora,
+        'lotes': lotes,
+        'incidentes': incidentes,
+        'ordenes_trabajo': ordenes,
+        'oee_7_dias': {
+            'oee': oee['oee'],
+            'disponibilidad': oee['disponibilidad'],
+            'rendimiento': oee['rendimiento'],
+            'calidad': oee['calidad']
+        }
+    }
+
+
+def obtener_dashboard():
+    """
+    Devuelve el snapshot del dashboard desde caché (una lectura), recalculándolo si no
+    existe o si fue invalidado. Nunca es más antiguo que settings.KPI_DASHBOARD_MAX_STALENESS
+    segundos. La invalidación solo alcanza a todos los workers si la caché es compartida
+    (settings.CACHES: Redis, Memcached o, en su defecto, la tabla de la base).
+
+    Un lector que calculó el snapshot antes de una invalidación lo guarda con la generación
+    anterior: el siguiente lector lo descarta en lugar de servir datos previos al commit.
+    """
+    valores = cache.get_many([CLAVE_CACHE_DASHBOARD, CLAVE_GENERACION_DASHBOARD])
+    generacion = valores.get(CLAVE_GENERACION_DASHBOARD, 0)
+    guardado = valores.get(CLAVE_CACHE_DASHBOARD)
+    if guardado is not None and guardado[0] == generacion:
+        return guardado[1]
+
+    snapshot = calcular_dashboard()
+    cache.set(
+        CLAVE_CACHE_DASHBOARD, (generacion, snapshot), getattr(settings, 'KPI_DASHBOARD_MAX_STALENESS', 60)
+    )
+    return snapshot
+
+
+def _descartar_dashboard():
+    try:
+        cache.incr(CLAVE_GENERACION_DASHBOARD)
+    except ValueError:
+        # Sin generación todavía (o desalojada): cualquier valor distinto del leído invalida
+        if not cache.add(CLAVE_GENERACION_DASHBOARD, 1, None):
+            cache.incr(CLAVE_GENERACION_DASHBOARD)
+
+
+def invalidar_dashboard():
+    """
+    Descarta el snapshot del dashboard (llamado desde señales). Se aplica al confirmarse
+    la transacción del cambio: antes, un lector concurrente todavía vería los datos previos.
+    """
+    transaction.on_commit(_descartar_dashboard)
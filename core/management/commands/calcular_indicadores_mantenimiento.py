@@ -0,0 +1,38 @@
+"""
+Comando Django para calcular los indicadores de mantenimiento (MTBF, MTTR, disponibilidad)
+Uso: python manage.py calcular_indicadores_mantenimiento [--desde 2025-01-01] [--hasta 2025-12-31] [--periodo MENSUAL]
+Sin --desde el cálculo es incremental (solo períodos afectados desde la última ejecución).
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.mantenimiento import calcular_indicadores_mantenimiento, PERIODOS
+
+
+class Command(BaseCommand):
+    help = 'Calcula y guarda IndicadorMantenimiento por máquina y período'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto, incremental)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto, hoy)')
+        parser.add_argument(
+            '--periodo', action='append', choices=list(PERIODOS),
+            help='Período a calcular (repetible; por defecto todos)'
+        )
+
+    def _parse_fecha(self, valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (formato esperado YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        desde = self._parse_fecha(options['desde']) if options['desde'] else None
+        hasta = self._parse_fecha(options['hasta']) if options['hasta'] else None
+        if desde and hasta and desde > hasta:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        total = calcular_indicadores_mantenimiento(desde, hasta, options['periodo'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Indicadores de mantenimiento calculados: {total}'))
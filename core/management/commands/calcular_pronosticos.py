@@ -0,0 +1,42 @@
+"""
+Comando Django para recalcular el pronóstico de consumo de insumos y repuestos
+Uso: python manage.py calcular_pronosticos [--dias-historia 180] [--ventana 28] [--alfa 0.2] [--reposicion-insumos 15]
+
+Programarlo a diario (de noche): publica en PronosticoInventario los días de
+cobertura y el punto de reorden sugerido de todos los ítems activos en una pasada.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.pronosticos import (
+    calcular_pronosticos, DIAS_HISTORIA, VENTANA_MEDIA_MOVIL, ALFA_SUAVIZADO, TIEMPO_REPOSICION_INSUMO_DIAS
+)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula PronosticoInventario (consumo pronosticado, cobertura y punto de reorden sugerido)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias-historia', type=int, default=DIAS_HISTORIA,
+                            help=f'Días de consumo leídos (por defecto {DIAS_HISTORIA})')
+        parser.add_argument('--ventana', type=int, default=VENTANA_MEDIA_MOVIL,
+                            help=f'Días de la media móvil (por defecto {VENTANA_MEDIA_MOVIL})')
+        parser.add_argument('--alfa', type=float, default=ALFA_SUAVIZADO,
+                            help=f'Factor del suavizado exponencial (por defecto {ALFA_SUAVIZADO})')
+        parser.add_argument('--reposicion-insumos', type=int, default=TIEMPO_REPOSICION_INSUMO_DIAS,
+                            help=f'Tiempo de reposición de insumos en días (por defecto {TIEMPO_REPOSICION_INSUMO_DIAS})')
+
+    def handle(self, *args, **options):
+        try:
+            resumen = calcular_pronosticos(
+                dias_historia=options['dias_historia'],
+                ventana=options['ventana'],
+                alfa=options['alfa'],
+                reposicion_insumos=options['reposicion_insumos'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for tipo_item, cantidad in resumen.items():
+            self.stdout.write(f'  - {tipo_item}: {cantidad}')
+        self.stdout.write(self.style.SUCCESS(f'✅ Pronósticos publicados: {sum(resumen.values())}'))
@@ -0,0 +1,61 @@
+"""
+Comando Django para generar cierres (snapshots de saldos por ítem y ubicación) de inventario
+Uso: python manage.py cerrar_inventario [--fecha 2025-01-31] [--desde 2024-01-01 --periodo mes]
+
+Sin --desde genera el cierre de un solo día (por defecto, ayer); programarlo a diario
+o a fin de mes. Con --desde regenera en orden todos los cierres diarios o de fin de
+mes del rango: cada uno parte del anterior y solo recorre los movimientos del período.
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.inventario import cerrar_inventario
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (formato esperado YYYY-MM-DD)")
+
+
+def fechas_cierre(desde, hasta, periodo):
+    """Días de cierre del rango: todos los días, o el último día de cada mes (y `hasta`)"""
+    fechas = []
+    dia = desde
+    while dia <= hasta:
+        siguiente = dia + timedelta(days=1)
+        if periodo == 'dia' or siguiente.day == 1 or dia == hasta:
+            fechas.append(dia)
+        dia = siguiente
+    return fechas
+
+
+class Command(BaseCommand):
+    help = 'Genera CierreInventario (saldo por ítem y ubicación) al final del día indicado (por defecto, ayer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Fecha de cierre YYYY-MM-DD (por defecto, ayer)')
+        parser.add_argument('--desde', help='Regenerar los cierres desde esta fecha hasta --fecha')
+        parser.add_argument('--periodo', choices=['dia', 'mes'], default='dia',
+                            help='Con --desde: un cierre por día o por fin de mes (por defecto, dia)')
+
+    def handle(self, *args, **options):
+        hasta = _fecha(options['fecha']) if options['fecha'] else timezone.localdate() - timedelta(days=1)
+        if hasta >= timezone.localdate():
+            raise CommandError('Solo se pueden cerrar días ya finalizados')
+
+        if options['desde']:
+            desde = _fecha(options['desde'])
+            if desde > hasta:
+                raise CommandError('--desde debe ser anterior o igual a --fecha')
+            fechas = fechas_cierre(desde, hasta, options['periodo'])
+        else:
+            fechas = [hasta]
+
+        for fecha in fechas:
+            total = cerrar_inventario(fecha)
+            self.stdout.write(self.style.SUCCESS(f'✅ Cierre de inventario al {fecha}: {total} saldos'))
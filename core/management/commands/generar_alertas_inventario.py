@@ -0,0 +1,29 @@
+"""
+Comando Django para generar alertas de inventario (stock bajo y vencimientos)
+Uso: python manage.py generar_alertas_inventario [--dias 30] [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.alertas import generar_alertas_inventario, DIAS_AVISO_VENCIMIENTO
+
+
+class Command(BaseCommand):
+    help = 'Genera AlertaInventario de stock mínimo, punto de reorden y vencimientos (sin duplicar las activas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_AVISO_VENCIMIENTO,
+                            help=f'Días de anticipación para vencimientos (por defecto {DIAS_AVISO_VENCIMIENTO})')
+        parser.add_argument('--dry-run', action='store_true', help='Solo cuenta las alertas que se generarían')
+
+    def handle(self, *args, **options):
+        resumen = generar_alertas_inventario(dias_aviso=options['dias'], dry_run=options['dry_run'])
+
+        for tipo_alerta, cantidad in resumen.items():
+            self.stdout.write(f'  - {tipo_alerta}: {cantidad}')
+
+        total = sum(resumen.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'⚠️  Dry run: {total} alertas se generarían'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Alertas de inventario generadas: {total}'))
@@ -0,0 +1,26 @@
+"""
+Comando Django para generar órdenes de trabajo preventivas a partir de los planes de mantenimiento
+Uso: python manage.py generar_ordenes_preventivas [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.mantenimiento import generar_ordenes_preventivas
+
+
+class Command(BaseCommand):
+    help = 'Genera las OTs preventivas vencidas por días, horas de uso o ciclos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo muestra las OTs que se generarían')
+
+    def handle(self, *args, **options):
+        ordenes = generar_ordenes_preventivas(dry_run=options['dry_run'])
+
+        for orden in ordenes:
+            self.stdout.write(f'  - {orden.codigo}: {orden.descripcion}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'⚠️  Dry run: {len(ordenes)} OTs se generarían'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ OTs preventivas generadas: {len(ordenes)}'))
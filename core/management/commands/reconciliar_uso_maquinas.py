@@ -0,0 +1,17 @@
+"""
+Comando Django para reconstruir los contadores de uso de máquinas (UsoMaquina)
+desde el historial de etapas de lote completadas
+Uso: python manage.py reconciliar_uso_maquinas
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.mantenimiento import reconstruir_uso_maquinas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los contadores de horas de uso de cada máquina desde LoteEtapa'
+
+    def handle(self, *args, **options):
+        total = reconstruir_uso_maquinas()
+        self.stdout.write(self.style.SUCCESS(f'✅ Contadores de uso reconciliados: {total} máquinas'))
@@ -0,0 +1,46 @@
+"""
+Comando Django para reconstruir el rollup diario de producción (ResumenProduccionDiario)
+Uso: python manage.py reconstruir_resumen_produccion --desde 2025-01-01 --hasta 2025-12-31
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Max
+
+from core.kpis import reconstruir_resumen, ESTADOS_OEE, fecha_local
+from core.models import Lote
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el resumen diario de producción para un rango de fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto, el primer lote)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto, el último lote)')
+
+    def _parse_fecha(self, valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (formato esperado YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        limites = Lote.objects.filter(
+            estado__in=ESTADOS_OEE,
+            fecha_real_inicio__isnull=False
+        ).aggregate(primero=Min('fecha_real_inicio'), ultimo=Max('fecha_real_inicio'))
+
+        desde = self._parse_fecha(options['desde']) if options['desde'] else fecha_local(limites['primero'])
+        hasta = self._parse_fecha(options['hasta']) if options['hasta'] else fecha_local(limites['ultimo'])
+
+        if not desde or not hasta:
+            self.stdout.write(self.style.WARNING('⚠️  No hay lotes finalizados para resumir'))
+            return
+        if desde > hasta:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        filas = reconstruir_resumen(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Resumen de producción reconstruido ({desde} a {hasta}): {filas} filas'
+        ))
@@ -0,0 +1,19 @@
+"""
+Comando Django para reconstruir la genealogía de lotes (trazabilidad) desde los consumos
+Uso: python manage.py reconstruir_trazabilidad
+
+Carga inicial de GenealogiaLote con los LoteInsumoConsumo existentes; luego la tabla
+se mantiene sola. Volver a ejecutarlo es seguro (regenera la tabla completa).
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.trazabilidad import reconstruir_genealogia
+
+
+class Command(BaseCommand):
+    help = 'Regenera GenealogiaLote (lote de insumo → lote de producción) desde LoteInsumoConsumo'
+
+    def handle(self, *args, **options):
+        total = reconstruir_genealogia()
+        self.stdout.write(self.style.SUCCESS(f'✅ Genealogía de lotes reconstruida: {total} pares'))
@@ -0,0 +1,182 @@
+"""
+Comando Django para detectar regresiones en los planes de consulta de los endpoints principales
+Uso: python manage.py verificar_planes [--min-filas 10000] [--detalle]
+
+Ejecuta cada endpoint de la lista con un superusuario (los listados por cursor también en
+su segunda página), captura sus SELECT y corre EXPLAIN sobre cada uno (PostgreSQL o
+SQLite). Termina con error si algún plan recorre en forma secuencial una tabla con al
+menos --min-filas filas: pensado para CI contra una base poblada, de modo que un filtro nuevo sin índice (o un índice eliminado) haga fallar el build.
+"""
+
+import json
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.kpis import ESTADOS_OEE
+from core.models import Lote, Producto, Turno, Insumo, ResumenProduccionDiario
+
+
+def endpoints():
+    """(nombre, url) de los listados y KPIs con los filtros que usa el frontend"""
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=30)
+    producto = Producto.objects.order_by('id').values_list('id', flat=True).first() or 0
+    turno = Turno.objects.order_by('id').values_list('id', flat=True).first() or 0
+    insumo = Insumo.objects.order_by('id').values_list('id', flat=True).first() or 0
+    lote = Lote.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    return [
+        ('lotes', '/api/lotes/'),
+        ('lotes por estado', '/api/lotes/?estado=EN_PROCESO'),
+        ('lotes por producto', f'/api/lotes/?producto={producto}'),
+        ('lotes por turno', f'/api/lotes/?turno={turno}'),
+        ('lotes por fecha', f'/api/lotes/?fecha_desde={desde}&fecha_hasta={hasta}'),
+        ('lotes (cursor)', '/api/lotes/?paginacion=cursor'),
+        ('kpi oee', f'/api/kpis/oee/?desde={desde}&hasta={hasta}'),
+        ('kpi series', f'/api/kpis/series/?desde={desde}&hasta={hasta}&group_by=producto'),
+        ('kpi estadísticas', f'/api/kpis/estadisticas/?metrica=duracion_minutos&group_by=maquina&desde={desde}&hasta={hasta}'),
+        ('lotes de insumo', f'/api/lotes-insumo/?insumo={insumo}&estado=APROBADO'),
+        ('movimientos (cursor)', '/api/movimientos/?paginacion=cursor'),
+        ('firmas (cursor)', '/api/firmas/?paginacion=cursor'),
+        ('auditoría (cursor)', '/api/auditoria/?paginacion=cursor'),
+        ('trazabilidad de lote', f'/api/trazabilidad/lote/{lote}/'),
+    ]
+
+
+# Alias de tabla en subconsultas de Django: "core_lote" U0
+ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([UTV]\d+)"?')
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def _recorridos_postgresql(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    tablas = []
+    pendientes = [plan[0]['Plan']]
+    while pendientes:
+        nodo = pendientes.pop()
+        if nodo['Node Type'] == 'Seq Scan':
+            tablas.append(nodo['Relation Name'])
+        pendientes.extend(nodo.get('Plans', []))
+    return tablas
+
+
+def _recorridos_sqlite(sql):
+    alias = dict((a, t) for t, a in ALIAS.findall(sql))
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        filas = cursor.fetchall()
+    tablas = []
+    for fila in filas:
+        detalle = fila[-1]
+        # "SCAN tabla" sin índice = recorrido completo ("SEARCH" y "USING INDEX" usan índice)
+        if detalle.startswith('SCAN ') and 'USING' not in detalle:
+            nombre = detalle.split()[1]
+            tablas.append(alias.get(nombre, nombre))
+    return tablas
+
+
+def _poblar_resumen():
+    """
+    El rollup de OEE se mantiene desde señales: una base cargada con bulk_create o por SQL
+    lo tiene vacío y el plan de "kpi oee" no probaría nada. Si está vacío se reconstruye
+    (dentro de la transacción que se revierte). Retorna True si lo reconstruyó.
+    """
+    if ResumenProduccionDiario.objects.exists() or not Lote.objects.filter(estado__in=ESTADOS_OEE).exists():
+        return False
+    call_command('reconstruir_resumen_produccion', stdout=StringIO())
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(ResumenProduccionDiario._meta.db_table)}')
+    return True
+
+
+class Command(BaseCommand):
+    help = 'Corre EXPLAIN sobre las consultas de los endpoints principales y falla ante recorridos secuenciales de tablas grandes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-filas', type=int, default=10000,
+                            help='Tamaño desde el cual un recorrido secuencial es un error (por defecto 10000)')
+        parser.add_argument('--detalle', action='store_true', help='Muestra cada consulta analizada')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'Motor no soportado: {connection.vendor}')
+        usuario = User.objects.filter(is_superuser=True, is_active=True).first()
+        if usuario is None:
+            raise CommandError('Se necesita un superusuario activo para ejecutar los endpoints')
+
+        recorridos = _recorridos_postgresql if connection.vendor == 'postgresql' else _recorridos_sqlite
+        tamanos = {}
+
+        def filas_tabla(tabla):
+            if tabla not in tamanos:
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'postgresql':
+                        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [tabla])
+                        fila = cursor.fetchone()
+                        tamanos[tabla] = int(fila[0]) if fila else 0
+                    else:
+                        cursor.execute(f'SELECT COUNT(*) FROM "{tabla}"')
+                        tamanos[tabla] = cursor.fetchone()[0]
+            return tamanos[tabla]
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        problemas = []
+
+        # Todo dentro de una transacción que se revierte: el comando no deja cambios
+        with transaction.atomic():
+            if _poblar_resumen():
+                self.stdout.write('  - resumen de producción vacío: reconstruido para la verificación')
+            pendientes = endpoints()
+            while pendientes:
+                nombre, url = pendientes.pop(0)
+                with CaptureQueriesContext(connection) as capturadas:
+                    respuesta = cliente.get(url, HTTP_HOST=_host())
+                if respuesta.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f'⚠️  {nombre}: HTTP {respuesta.status_code} ({url})'))
+                elif nombre.endswith('(cursor)') and respuesta.data.get('next'):
+                    # La página siguiente filtra "después de la última fila": es la consulta
+                    # que debe seguir usando el índice del orden
+                    pendientes.insert(0, (f'{nombre} página 2', respuesta.data['next']))
+
+                consultas = [q['sql'] for q in capturadas.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+                grandes = set()
+                for sql in consultas:
+                    for tabla in recorridos(sql):
+                        if filas_tabla(tabla) >= options['min_filas']:
+                            grandes.add(tabla)
+                            if options['detalle']:
+                                self.stdout.write(f'    {sql[:300]}')
+
+                if grandes:
+                    problemas.append((nombre, sorted(grandes)))
+                    self.stdout.write(self.style.ERROR(
+                        f'❌ {nombre}: recorrido secuencial de {", ".join(sorted(grandes))}'
+                    ))
+                else:
+                    self.stdout.write(f'  - {nombre}: {len(consultas)} consultas OK')
+            transaction.set_rollback(True)
+
+        if problemas:
+            raise CommandError(f'{len(problemas)} endpoints recorren secuencialmente tablas de ≥ {options["min_filas"]} filas')
+        self.stdout.write(self.style.SUCCESS('✅ Planes de consulta verificados: sin recorridos secuenciales de tablas grandes'))
@@ -0,0 +1,35 @@
+"""
+Comando Django para verificar (y opcionalmente reconstruir) los saldos de insumos
+contra los lotes de insumo
+Uso: python manage.py verificar_saldos_insumo [--reparar]
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.inventario import verificar_saldos
+
+
+class Command(BaseCommand):
+    help = 'Verifica SaldoInsumo contra LoteInsumo y reconstruye los saldos si se indica --reparar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparar', action='store_true', help='Reconstruye los saldos desde los lotes')
+
+    def handle(self, *args, **options):
+        diferencias = verificar_saldos(reparar=options['reparar'])
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('✅ Saldos de insumos consistentes'))
+            return
+
+        for d in diferencias:
+            self.stdout.write(
+                f"  - Insumo {d['insumo_id']} / Ubicación {d['ubicacion_id']} / {d['estado']}: "
+                f"saldo {d['cantidad_actual']} ({d['lotes_actuales']} lotes), "
+                f"esperado {d['cantidad_esperada']} ({d['lotes_esperados']} lotes)"
+            )
+
+        if options['reparar']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Saldos reconstruidos ({len(diferencias)} diferencias corregidas)'))
+        else:
+            self.stdout.write(self.style.WARNING(f'⚠️  {len(diferencias)} diferencias encontradas (usar --reparar)'))
@@ -0,0 +1,427 @@
+"""
+Servicios de mantenimiento para SIPROSA MES
+Cálculo en lote de IndicadorMantenimiento (MTBF, MTTR, disponibilidad) por máquina
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum, Q, F, Max, Min, OuterRef, Subquery, DateField, IntegerField
+from django.db.models.functions import Trunc, Coalesce
+from django.utils import timezone
+
+from .kpis import invalidar_dashboard
+from .models import (
+    Maquina, LoteEtapa, Parada, PlanMantenimiento, OrdenTrabajo,
+    HistorialMantenimiento, IndicadorMantenimiento, UsoMaquina
+)
+
+
+# Códigos de TipoMantenimiento (ver datos iniciales: PREV, CORR, PRED)
+TIPOS_CORRECTIVOS = ['CORR']
+TIPOS_PREVENTIVOS = ['PREV', 'PRED']
+
+# Período de IndicadorMantenimiento -> unidad de truncado
+PERIODOS = {
+    'SEMANAL': 'week',
+    'MENSUAL': 'month',
+    'ANUAL': 'year',
+}
+
+
+def inicio_periodo(fecha, periodo):
+    """Primer día del período (lunes / día 1 / 1 de enero) que contiene la fecha"""
+    if periodo == 'SEMANAL':
+        return fecha - timedelta(days=fecha.weekday())
+    if periodo == 'MENSUAL':
+        return fecha.replace(day=1)
+    return fecha.replace(month=1, day=1)
+
+
+def siguiente_periodo(fecha, periodo):
+    """Primer día del período siguiente a `fecha` (que debe ser inicio de período)"""
+    if periodo == 'SEMANAL':
+        return fecha + timedelta(days=7)
+    if periodo == 'MENSUAL':
+        return date(fecha.year + fecha.month // 12, fecha.month % 12 + 1, 1)
+    return date(fecha.year + 1, 1, 1)
+
+
+# El cálculo anterior registra su fecha al escribir: las modificaciones confirmadas
+# mientras corría (o en transacciones iniciadas antes) tienen fecha_modificacion previa
+MARGEN_INCREMENTAL = timedelta(minutes=10)
+
+
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def fecha_minima_modificada(desde_momento):
+    """
+    Fecha más antigua de los eventos creados o modificados desde `desde_momento`, según
+    la fecha_modificacion (auto_now) de las fuentes. Todas las escrituras la actualizan,
+    también las transiciones de OT con UPDATE condicional (MaquinaEstados.aplicar), de
+    modo que una edición retroactiva recalcula su período. Las paradas se toman sin
+    filtrar categoría (una que deja de ser FALLA_EQUIPO también cambia su período) y
+    con las de etapas modificadas (la etapa define su máquina). Para eventos eliminados
+    o movidos de fecha, el período anterior se recalcula con `desde`.
+    """
+    candidatos = [
+        Parada.objects.filter(fecha_modificacion__gte=desde_momento).aggregate(m=Min('fecha_inicio'))['m'],
+        Parada.objects.filter(
+            lote_etapa__in=LoteEtapa.objects.filter(fecha_modificacion__gte=desde_momento).values('id')
+        ).aggregate(m=Min('fecha_inicio'))['m'],
+        OrdenTrabajo.objects.filter(fecha_modificacion__gte=desde_momento).aggregate(m=Min('fecha_creacion'))['m'],
+        HistorialMantenimiento.objects.filter(fecha_modificacion__gte=desde_momento).aggregate(m=Min('fecha'))['m'],
+    ]
+    candidatos = [timezone.localtime(c).date() for c in candidatos if c]
+    return min(candidatos) if candidatos else None
+
+
+def _fecha_inicial_completa():
+    """Fecha del primer evento registrado en cualquiera de las fuentes"""
+    candidatos = [
+        Parada.objects.filter(categoria='FALLA_EQUIPO').aggregate(m=Min('fecha_inicio'))['m'],
+        OrdenTrabajo.objects.aggregate(m=Min('fecha_creacion'))['m'],
+        HistorialMantenimiento.objects.aggregate(m=Min('fecha'))['m'],
+    ]
+    candidatos = [timezone.localtime(c).date() for c in candidatos if c]
+    return min(candidatos) if candidatos else None
+
+
+def _agrupar(queryset, campo_fecha, campo_maquina, unidad, **agregados):
+    """Agrega un queryset por (máquina, inicio de período) en una sola consulta"""
+    filas = queryset.annotate(
+        periodo_inicio=Trunc(campo_fecha, unidad, output_field=DateField())
+    ).values(campo_maquina, 'periodo_inicio').annotate(**agregados).order_by()
+    return {(fila[campo_maquina], fila['periodo_inicio']): fila for fila in filas}
+
+
+def _indicadores_periodo(periodo, desde, hasta, maquinas_ids, ahora):
+    """Construye los IndicadorMantenimiento (sin guardar) de un tipo de período"""
+    unidad = PERIODOS[periodo]
+    primero = inicio_periodo(desde, periodo)
+    limite = siguiente_periodo(inicio_periodo(hasta, periodo), periodo)
+    rango = (_inicio_dia(primero), _inicio_dia(limite))
+
+    paradas = _agrupar(
+        Parada.objects.filter(
+            categoria='FALLA_EQUIPO',
+            lote_etapa__maquina_id__in=maquinas_ids,
+            fecha_inicio__gte=rango[0], fecha_inicio__lt=rango[1]
+        ),
+        'fecha_inicio', 'lote_etapa__maquina_id', unidad,
+        fallas=Count('id'),
+        minutos=Sum('duracion_minutos'),
+    )
+    correctiva = Q(tipo__codigo__in=TIPOS_CORRECTIVOS)
+    ordenes = _agrupar(
+        OrdenTrabajo.objects.exclude(estado='CANCELADA').filter(
+            maquina_id__in=maquinas_ids,
+            fecha_creacion__gte=rango[0], fecha_creacion__lt=rango[1]
+        ),
+        'fecha_creacion', 'maquina_id', unidad,
+        correctivas=Count('id', filter=correctiva),
+        preventivas=Count('id', filter=Q(tipo__codigo__in=TIPOS_PREVENTIVOS)),
+        horas_correctivas=Sum('duracion_real_horas', filter=correctiva),
+        costo=Sum('costo_real'),
+    )
+    # El historial solo aporta costo cuando la OT no tiene costo real cargado
+    historial = _agrupar(
+        HistorialMantenimiento.objects.filter(
+            maquina_id__in=maquinas_ids,
+            orden_trabajo__costo_real__isnull=True,
+            fecha__gte=rango[0], fecha__lt=rango[1]
+        ),
+        'fecha', 'maquina_id', unidad,
+        costo=Sum('costo'),
+    )
+
+    indicadores = []
+    inicio = primero
+    while inicio < limite and _inicio_dia(inicio) <= ahora:
+        fin = siguiente_periodo(inicio, periodo)
+        horas_periodo = Decimal(
+            (min(_inicio_dia(fin), ahora) - _inicio_dia(inicio)).total_seconds() / 3600
+        )
+        for maquina_id in maquinas_ids:
+            clave = (maquina_id, inicio)
+            parada = paradas.get(clave, {})
+            orden = ordenes.get(clave, {})
+
+            # Una misma falla puede registrarse como Parada y como OT correctiva:
+            # se toma el mayor de ambos registros para no contarla dos veces.
+            fallas = max(parada.get('fallas', 0), orden.get('correctivas', 0))
+            horas_reparacion = max(
+                Decimal(parada.get('minutos') or 0) / 60,
+                orden.get('horas_correctivas') or Decimal('0'),
+            )
+            horas_reparacion = min(horas_reparacion, horas_periodo)
+            horas_operativas = horas_periodo - horas_reparacion
+
+            if fallas:
+                mtbf = horas_operativas / fallas
+                mttr = horas_reparacion / fallas
+            else:
+                mtbf = horas_operativas
+                mttr = Decimal('0')
+            disponibilidad = (horas_operativas / horas_periodo * 100) if horas_periodo > 0 else Decimal('100')
+
+            indicadores.append(IndicadorMantenimiento(
+                maquina_id=maquina_id,
+                periodo=periodo,
+                fecha_inicio=inicio,
+                fecha_fin=fin - timedelta(days=1),
+                mtbf_horas=round(mtbf, 2),
+                mttr_horas=round(mttr, 2),
+                disponibilidad_porcentaje=round(disponibilidad, 2),
+                numero_fallas=fallas,
+                numero_mantenimientos_preventivos=orden.get('preventivas', 0),
+                numero_mantenimientos_correctivos=orden.get('correctivas', 0),
+                costo_total_mantenimiento=round(
+                    (orden.get('costo') or Decimal('0')) + (historial.get(clave, {}).get('costo') or Decimal('0')), 2
+                ),
+            ))
+        inicio = fin
+    return indicadores
+
+
+def calcular_indicadores_mantenimiento(desde=None, hasta=None, periodos=None):
+    """
+    Calcula y guarda IndicadorMantenimiento para todas las máquinas activas.
+
+    - desde=None: incremental; recalcula solo los períodos afectados por eventos
+      creados o modificados desde el último cálculo (ver fecha_minima_modificada) y
+      siempre los períodos en curso.
+    - Cada tipo de período usa tres consultas agrupadas (paradas, OTs, historial)
+      y el resultado se escribe con un único bulk_create con upsert sobre
+      (maquina, periodo, fecha_inicio).
+
+    Retorna la cantidad de indicadores escritos.
+    """
+    ahora = timezone.now()
+    hoy = timezone.localtime(ahora).date()
+    hasta = hasta or hoy
+    periodos = periodos or list(PERIODOS)
+
+    if desde is None:
+        ultimo_calculo = IndicadorMantenimiento.objects.aggregate(m=Max('fecha_calculo'))['m']
+        if ultimo_calculo:
+            modificada = fecha_minima_modificada(ultimo_calculo - MARGEN_INCREMENTAL)
+            desde = min(modificada, hoy) if modificada else hoy
+        else:
+            desde = _fecha_inicial_completa() or hoy
+
+    maquinas_ids = list(Maquina.objects.filter(activa=True).values_list('id', flat=True))
+    if not maquinas_ids or desde > hasta:
+        return 0
+
+    indicadores = []
+    for periodo in periodos:
+        indicadores.extend(_indicadores_periodo(periodo, desde, hasta, maquinas_ids, ahora))
+
+    IndicadorMantenimiento.objects.bulk_create(
+        indicadores,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['maquina', 'periodo', 'fecha_inicio'],
+        update_fields=[
+            'fecha_fin', 'mtbf_horas', 'mttr_horas', 'disponibilidad_porcentaje',
+            'numero_fallas', 'numero_mantenimientos_preventivos',
+            'numero_mantenimientos_correctivos', 'costo_total_mantenimiento', 'fecha_calculo',
+        ],
+    )
+    return len(indicadores)
+
+
+# ============================================
+# PROGRAMADOR DE MANTENIMIENTO PREVENTIVO
+# ============================================
+
+ESTADOS_OT_CERRADAS = ['COMPLETADA', 'CANCELADA']
+
+
+def _uso_desde(referencia, agregado):
+    """
+    Subconsulta correlacionada con el uso de la máquina del plan (etapas completadas)
+    posterior a la referencia del plan (campo anotado `referencia`).
+    """
+    return Coalesce(Subquery(
+        LoteEtapa.objects.filter(
+            maquina=OuterRef('maquina'),
+            estado='COMPLETADO',
+            fecha_fin__gt=OuterRef(referencia)
+        ).order_by().values('maquina').annotate(total=agregado).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def planes_con_uso():
+    """
+    Planes activos anotados (en una sola consulta) con:
+    - ordenes_pendientes: OTs del plan aún no cerradas
+    - referencia: cierre (o creación) de la última OT del plan, o creación del plan
+    - minutos_uso / ciclos_uso: uso de la máquina desde la referencia
+    """
+    ordenes = OrdenTrabajo.objects.filter(plan_mantenimiento=OuterRef('pk')).order_by().values('plan_mantenimiento')
+    ultima_orden = OrdenTrabajo.objects.filter(
+        plan_mantenimiento=OuterRef('pk')
+    ).annotate(
+        cierre=Coalesce('fecha_fin', 'fecha_creacion')
+    ).order_by('-cierre').values('cierre')[:1]
+
+    return PlanMantenimiento.objects.filter(
+        activo=True,
+        maquina__activa=True
+    ).annotate(
+        ordenes_pendientes=Coalesce(Subquery(
+            ordenes.exclude(estado__in=ESTADOS_OT_CERRADAS).annotate(total=Count('id')).values('total'),
+            output_field=IntegerField()
+        ), 0),
+        referencia=Coalesce(Subquery(ultima_orden), 'fecha_creacion'),
+    ).annotate(
+        minutos_uso=_uso_desde('referencia', Sum('duracion_minutos')),
+        ciclos_uso=_uso_desde('referencia', Count('id')),
+    ).select_related('maquina', 'tipo')
+
+
+def motivo_vencimiento(plan, ahora):
+    """Motivo por el que el plan está vencido, o None si todavía no corresponde"""
+    if plan.frecuencia_dias and ahora >= plan.referencia + timedelta(days=plan.frecuencia_dias):
+        return f'{plan.frecuencia_dias} días desde el último mantenimiento'
+    if plan.frecuencia_horas_uso and plan.minutos_uso >= plan.frecuencia_horas_uso * 60:
+        return f'{round(plan.minutos_uso / 60, 1)} horas de uso (frecuencia {plan.frecuencia_horas_uso} h)'
+    if plan.frecuencia_ciclos and plan.ciclos_uso >= plan.frecuencia_ciclos:
+        return f'{plan.ciclos_uso} ciclos (frecuencia {plan.frecuencia_ciclos})'
+    return None
+
+
+def _prefijo_ot(plan_id):
+    return f'PM-{plan_id:06d}-'
+
+
+def _ultimos_numeros_ot(plan_ids):
+    """
+    {plan_id: mayor número usado en los códigos PM-<plan>-<n>}. Se toma de los códigos
+    existentes (no de la cantidad de OTs), así una OT eliminada no hace que el
+    siguiente código choque con uno ya usado.
+    """
+    ultimos = dict.fromkeys(plan_ids, 0)
+    prefijos = {_prefijo_ot(plan_id): plan_id for plan_id in plan_ids}
+    plan_ids = list(plan_ids)
+    for inicio in range(0, len(plan_ids), 500):
+        filtro = Q()
+        for plan_id in plan_ids[inicio:inicio + 500]:
+            filtro |= Q(codigo__startswith=_prefijo_ot(plan_id))
+        for codigo in OrdenTrabajo.objects.filter(filtro).values_list('codigo', flat=True):
+            prefijo, _, numero = codigo.rpartition('-')
+            plan_id = prefijos.get(f'{prefijo}-')
+            if plan_id is not None and numero.isdigit():
+                ultimos[plan_id] = max(ultimos[plan_id], int(numero))
+    return ultimos
+
+
+def generar_ordenes_preventivas(ahora=None, dry_run=False):
+    """
+    Evalúa todos los planes activos y crea las OTs preventivas vencidas.
+
+    Usa una consulta para evaluar los planes (uso de máquina por subconsultas), otra
+    para numerar las OTs y un bulk_create dentro de una transacción. Es idempotente:
+    un plan con una OT pendiente no genera otra, y el código de la OT
+    (PM-<plan>-<n>, n = último número usado + 1) es determinístico, por lo que una
+    ejecución concurrente no duplica órdenes: la que llega segunda no inserta nada.
+
+    Retorna la lista de OTs efectivamente insertadas (las que se generarían si dry_run).
+    """
+    ahora = ahora or timezone.now()
+    vencidos = []
+
+    for plan in planes_con_uso().filter(ordenes_pendientes=0).iterator(chunk_size=1000):
+        motivo = motivo_vencimiento(plan, ahora)
+        if motivo:
+            vencidos.append((plan, motivo))
+
+    ultimos = _ultimos_numeros_ot([plan.pk for plan, _ in vencidos])
+    ordenes = [
+        OrdenTrabajo(
+            codigo=f'{_prefijo_ot(plan.pk)}{ultimos[plan.pk] + 1:04d}',
+            tipo=plan.tipo,
+            maquina=plan.maquina,
+            plan_mantenimiento=plan,
+            titulo=f'{plan.nombre} ({plan.maquina.codigo})'[:200],
+            descripcion=f'OT generada automáticamente por el plan {plan.codigo}: {motivo}.',
+            fecha_planificada=ahora,
+            creada_por_id=plan.creado_por_id,
+        )
+        for plan, motivo in vencidos
+    ]
+
+    if ordenes and not dry_run:
+        with transaction.atomic():
+            OrdenTrabajo.objects.bulk_create(ordenes, batch_size=500, ignore_conflicts=True)
+            # ignore_conflicts omite en silencio las OTs que otra ejecución ya insertó con
+            # el mismo código: se informan solo las de esta ejecución (su fecha_planificada)
+            insertadas = set(
+                OrdenTrabajo.objects.filter(
+                    codigo__in=[orden.codigo for orden in ordenes], fecha_planificada=ahora
+                ).values_list('codigo', flat=True)
+            )
+        ordenes = [orden for orden in ordenes if orden.codigo in insertadas]
+        # bulk_create no dispara señales: el dashboard cuenta OTs abiertas
+        invalidar_dashboard()
+    return ordenes
+
+
+# ============================================
+# CONTADOR DE USO DE MÁQUINAS (UsoMaquina)
+# ============================================
+
+def sumar_uso_maquina(maquina_id, minutos, ciclos):
+    """
+    Suma (o resta, con valores negativos) uso al contador de la máquina con un
+    UPDATE atómico basado en F(); crea el contador si todavía no existe.
+    """
+    if not maquina_id or (not minutos and not ciclos):
+        return
+    actualizados = UsoMaquina.objects.filter(maquina_id=maquina_id).update(
+        minutos_operacion=F('minutos_operacion') + minutos,
+        ciclos=F('ciclos') + ciclos,
+        fecha_actualizacion=timezone.now(),
+    )
+    if not actualizados:
+        UsoMaquina.objects.get_or_create(maquina_id=maquina_id)
+        sumar_uso_maquina(maquina_id, minutos, ciclos)
+
+
+def reconstruir_uso_maquinas():
+    """
+    Recalcula todos los contadores de uso desde el historial de etapas completadas
+    (una consulta agrupada y un upsert). Retorna la cantidad de máquinas.
+    """
+    uso = {
+        fila['maquina_id']: fila
+        for fila in LoteEtapa.objects.filter(
+            estado='COMPLETADO', maquina__isnull=False
+        ).order_by().values('maquina_id').annotate(
+            minutos=Sum('duracion_minutos'), ciclos=Count('id')
+        )
+    }
+    contadores = [
+        UsoMaquina(
+            maquina_id=maquina_id,
+            minutos_operacion=uso.get(maquina_id, {}).get('minutos') or 0,
+            ciclos=uso.get(maquina_id, {}).get('ciclos') or 0,
+            fecha_actualizacion=timezone.now(),
+        )
+        for maquina_id in Maquina.objects.values_list('id', flat=True)
+    ]
+    with transaction.atomic():
+        UsoMaquina.objects.bulk_create(
+            contadores,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['maquina'],
+            update_fields=['minutos_operacion', 'ciclos', 'fecha_actualizacion'],
+        )
+    return len(contadores)
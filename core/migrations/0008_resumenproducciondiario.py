@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_remove_electronicsignature_core_electr_user_ts_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenProduccionDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Fecha de inicio real del lote')),
+                ('horas_planificadas', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('horas_reales', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('minutos_parada', models.IntegerField(default=0)),
+                ('cantidad_planificada', models.BigIntegerField(default=0)),
+                ('cantidad_producida', models.BigIntegerField(default=0)),
+                ('cantidad_rechazada', models.BigIntegerField(default=0)),
+                ('lotes', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('maquina', models.ForeignKey(blank=True, help_text='Máquina de la etapa (las cantidades del lote se asignan a la máquina de su última etapa)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_produccion', to='core.maquina')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_produccion', to='core.producto')),
+                ('turno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_produccion', to='core.turno')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Producción',
+                'verbose_name_plural': 'Resúmenes Diarios de Producción',
+                'ordering': ['-fecha', 'turno', 'maquina', 'producto'],
+                'indexes': [models.Index(fields=['fecha', 'turno'], name='core_resume_fecha_daa4bd_idx')],
+                'unique_together': {('fecha', 'turno', 'maquina', 'producto')},
+            },
+        ),
+    ]
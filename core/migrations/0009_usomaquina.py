@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_resumenproducciondiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsoMaquina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutos_operacion', models.BigIntegerField(default=0)),
+                ('ciclos', models.IntegerField(default=0, help_text='Etapas completadas en la máquina')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('maquina', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='uso', to='core.maquina')),
+            ],
+            options={
+                'verbose_name': 'Uso de Máquina',
+                'verbose_name_plural': 'Usos de Máquinas',
+                'ordering': ['maquina'],
+            },
+        ),
+    ]
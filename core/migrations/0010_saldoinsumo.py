@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_saldos(apps, schema_editor):
+    """Carga los saldos iniciales desde los lotes de insumo existentes"""
+    from django.db.models import Count, Sum
+    LoteInsumo = apps.get_model('core', 'LoteInsumo')
+    SaldoInsumo = apps.get_model('core', 'SaldoInsumo')
+    SaldoInsumo.objects.bulk_create([
+        SaldoInsumo(
+            insumo_id=fila['insumo_id'], ubicacion_id=fila['ubicacion_id'], estado=fila['estado'],
+            cantidad=fila['cantidad'] or 0, lotes=fila['lotes']
+        )
+        for fila in LoteInsumo.objects.order_by().values('insumo_id', 'ubicacion_id', 'estado').annotate(
+            cantidad=Sum('cantidad_actual'), lotes=Count('id')
+        )
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_usomaquina'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoInsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('CUARENTENA', 'Cuarentena'), ('APROBADO', 'Aprobado'), ('RECHAZADO', 'Rechazado'), ('AGOTADO', 'Agotado')], max_length=20)),
+                ('cantidad', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('lotes', models.IntegerField(default=0, help_text='Cantidad de lotes en este saldo')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='core.insumo')),
+                ('ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='saldos_insumo', to='core.ubicacion')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Insumo',
+                'verbose_name_plural': 'Saldos de Insumos',
+                'ordering': ['insumo', 'ubicacion', 'estado'],
+                'unique_together': {('insumo', 'ubicacion', 'estado')},
+            },
+        ),
+        migrations.RunPython(poblar_saldos, migrations.RunPython.noop),
+    ]
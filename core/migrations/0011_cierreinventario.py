@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_saldoinsumo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Saldo acumulado al cierre de este día')),
+                ('tipo_item', models.CharField(choices=[('INSUMO', 'Insumo'), ('REPUESTO', 'Repuesto'), ('PRODUCTO_TERMINADO', 'Producto Terminado')], max_length=20)),
+                ('item_id', models.IntegerField(help_text='ID del Insumo, Repuesto o Producto')),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('fecha_creacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Cierre de Inventario',
+                'verbose_name_plural': 'Cierres de Inventario',
+                'ordering': ['-fecha', 'tipo_item', 'item_id'],
+                'indexes': [models.Index(fields=['tipo_item', 'fecha'], name='core_cierre_tipo_it_d1a404_idx')],
+                'unique_together': {('fecha', 'tipo_item', 'item_id')},
+            },
+        ),
+    ]
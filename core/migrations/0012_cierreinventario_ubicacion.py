@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def descartar_cierres_sin_ubicacion(apps, schema_editor):
+    """
+    Los cierres previos no discriminan ubicación: se descartan y se regeneran con
+    `python manage.py cerrar_inventario` (mientras tanto se recorre el historial completo).
+    """
+    apps.get_model('core', 'CierreInventario').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cierreinventario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(descartar_cierres_sin_ubicacion, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cierreinventario',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='cierreinventario',
+            name='ubicacion',
+            field=models.ForeignKey(blank=True, help_text='Vacío: movimientos registrados sin ubicación', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cierres_inventario', to='core.ubicacion'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierreinventario',
+            unique_together={('fecha', 'tipo_item', 'item_id', 'ubicacion')},
+        ),
+        migrations.AddIndex(
+            model_name='cierreinventario',
+            index=models.Index(fields=['tipo_item', 'fecha', 'item_id'], name='core_cierre_tipo_it_b00959_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['tipo_item', 'item_id', 'fecha_movimiento'], name='core_movimi_tipo_it_aef71e_idx'),
+        ),
+    ]
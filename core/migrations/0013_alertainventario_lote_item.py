@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_cierreinventario_ubicacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertainventario',
+            name='lote_item_id',
+            field=models.IntegerField(blank=True, help_text='ID del LoteInsumo o ProductoTerminado (alertas de vencimiento)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='alertainventario',
+            name='tipo_item',
+            field=models.CharField(choices=[('INSUMO', 'Insumo'), ('REPUESTO', 'Repuesto'), ('PRODUCTO_TERMINADO', 'Producto Terminado')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='alertainventario',
+            index=models.Index(fields=['estado', 'tipo_alerta'], name='core_alerta_estado_0db915_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:20
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alertainventario_lote_item'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoFisicoLinea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_item', models.CharField(choices=[('INSUMO', 'Insumo'), ('REPUESTO', 'Repuesto')], max_length=20)),
+                ('item_id', models.IntegerField(help_text='ID del Insumo o Repuesto')),
+                ('lote_item_id', models.IntegerField(blank=True, help_text='ID del LoteInsumo (obligatorio para insumos)', null=True)),
+                ('posicion', models.CharField(blank=True, help_text='ej: Estante A-3 (un lote puede contarse en varias posiciones)', max_length=100)),
+                ('cantidad_contada', models.DecimalField(decimal_places=2, max_digits=12, validators=[django.core.validators.MinValueValidator(0)])),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('conteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='core.conteofisico')),
+                ('registrado_por', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lineas_conteo_registradas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Línea de Conteo Físico',
+                'verbose_name_plural': 'Líneas de Conteo Físico',
+                'ordering': ['conteo', 'id'],
+                'indexes': [models.Index(fields=['conteo', 'tipo_item', 'item_id', 'lote_item_id'], name='core_conteo_conteo__8a15a5_idx')],
+            },
+        ),
+    ]
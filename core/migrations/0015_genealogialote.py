@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_conteofisicolinea'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenealogiaLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_lote_proveedor', models.CharField(max_length=50)),
+                ('cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('unidad', models.CharField(max_length=20)),
+                ('consumos', models.IntegerField(default=0)),
+                ('fecha_primer_consumo', models.DateTimeField()),
+                ('fecha_ultimo_consumo', models.DateTimeField()),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genealogia', to='core.insumo')),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genealogia', to='core.lote')),
+                ('lote_insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genealogia', to='core.loteinsumo')),
+            ],
+            options={
+                'verbose_name': 'Genealogía de Lote',
+                'verbose_name_plural': 'Genealogía de Lotes',
+                'indexes': [models.Index(fields=['insumo', 'codigo_lote_proveedor'], name='core_geneal_insumo__26f880_idx')],
+                'unique_together': {('lote_insumo', 'lote')},
+            },
+        ),
+    ]
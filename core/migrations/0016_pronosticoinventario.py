@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_genealogialote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_item', models.CharField(choices=[('INSUMO', 'Insumo'), ('REPUESTO', 'Repuesto')], max_length=20)),
+                ('item_id', models.IntegerField(help_text='ID del Insumo o Repuesto')),
+                ('fecha_calculo', models.DateField()),
+                ('dias_historia', models.IntegerField()),
+                ('consumo_periodo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('media_movil_diaria', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('consumo_diario_pronosticado', models.DecimalField(decimal_places=4, help_text='Suavizado exponencial', max_digits=14)),
+                ('desviacion_diaria', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('stock_actual', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('dias_cobertura', models.DecimalField(blank=True, decimal_places=1, help_text='Vacío: sin consumo pronosticado', max_digits=10, null=True)),
+                ('tiempo_reposicion_dias', models.IntegerField()),
+                ('stock_seguridad', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('punto_reorden_sugerido', models.DecimalField(decimal_places=2, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Pronóstico de Inventario',
+                'verbose_name_plural': 'Pronósticos de Inventario',
+                'ordering': ['tipo_item', 'dias_cobertura'],
+                'indexes': [models.Index(fields=['tipo_item', 'dias_cobertura'], name='core_pronos_tipo_it_ed2889_idx')],
+                'unique_together': {('tipo_item', 'item_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_pronosticoinventario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='electronicsignature',
+            index=models.Index(fields=['-timestamp', '-id'], name='core_electr_timesta_6af804_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logauditoria',
+            index=models.Index(fields=['-fecha', '-id'], name='core_logaud_fecha_099eca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['visible', '-fecha_creacion', '-id'], name='core_lote_visible_051002_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['-fecha_movimiento', '-id'], name='core_movimi_fecha_m_3cb37d_idx'),
+        ),
+    ]
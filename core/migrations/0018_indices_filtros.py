@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_indices_paginacion_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(condition=models.Q(('visible', True)), fields=['estado', '-fecha_creacion'], name='lote_visible_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['estado', 'fecha_real_inicio'], name='core_lote_estado_d5551e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['producto', 'fecha_real_inicio'], name='core_lote_product_91e0ea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['turno', 'fecha_real_inicio'], name='core_lote_turno_i_990c51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteinsumo',
+            index=models.Index(fields=['insumo', 'estado', 'fecha_vencimiento'], name='core_lotein_insumo__619989_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteinsumo',
+            index=models.Index(condition=models.Q(('cantidad_actual__gt', 0), ('estado', 'APROBADO')), fields=['insumo', 'fecha_vencimiento', 'fecha_recepcion'], name='loteinsumo_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteinsumo',
+            index=models.Index(condition=models.Q(('cantidad_actual__gt', 0), ('estado__in', ['CUARENTENA', 'APROBADO'])), fields=['fecha_vencimiento'], name='loteinsumo_vencimiento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parada',
+            index=models.Index(fields=['lote_etapa', 'fecha_fin'], include=('duracion_minutos',), name='parada_etapa_fin_idx'),
+        ),
+    ]
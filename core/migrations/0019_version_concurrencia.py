@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lote',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Aumenta en cada modificación (ETag)'),
+        ),
+        migrations.AddField(
+            model_name='loteetapa',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Aumenta en cada modificación (ETag)'),
+        ),
+        migrations.AddField(
+            model_name='ordentrabajo',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Aumenta en cada modificación (ETag)'),
+        ),
+    ]
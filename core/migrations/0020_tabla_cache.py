@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:12
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    """Tabla de la caché compartida (settings.CACHES con DatabaseCache); sin ella no hace nada"""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_version_concurrencia'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
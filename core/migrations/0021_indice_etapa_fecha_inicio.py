@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_tabla_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loteetapa',
+            index=models.Index(fields=['fecha_inicio'], name='core_loteet_fecha_i_16866f_idx'),
+        ),
+    ]
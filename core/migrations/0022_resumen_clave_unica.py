@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:18
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def vaciar_resumen(apps, schema_editor):
+    """Las actualizaciones concurrentes pudieron dejar filas duplicadas: se descarta el rollup"""
+    apps.get_model('core', 'ResumenProduccionDiario').objects.all().delete()
+
+
+def reconstruir_resumen(apps, schema_editor):
+    """
+    Regenera el rollup desde los lotes existentes; sin esto los endpoints de OEE responden
+    vacío hasta que alguien corra `python manage.py reconstruir_resumen_produccion`
+    """
+    call_command('reconstruir_resumen_produccion', stdout=StringIO())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_indice_etapa_fecha_inicio'),
+    ]
+
+    operations = [
+        migrations.RunPython(vaciar_resumen, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='resumenproducciondiario',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenproducciondiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'turno', 'maquina', 'producto'), name='resumen_produccion_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenproducciondiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('maquina__isnull', True)), fields=('fecha', 'turno', 'producto'), name='resumen_produccion_sin_maquina_unico'),
+        ),
+        migrations.RunPython(reconstruir_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_fecha_modificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialmantenimiento',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='parada',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='historialmantenimiento',
+            index=models.Index(fields=['fecha_modificacion'], name='core_histor_fecha_m_50ea89_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteetapa',
+            index=models.Index(fields=['fecha_modificacion'], name='core_loteet_fecha_m_dcfc91_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordentrabajo',
+            index=models.Index(fields=['fecha_modificacion'], name='core_ordent_fecha_m_3bb3e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parada',
+            index=models.Index(fields=['fecha_modificacion'], name='core_parada_fecha_m_517c72_idx'),
+        ),
+    ]
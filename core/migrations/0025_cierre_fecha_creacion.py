@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_modificacion_mantenimiento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cierreinventario',
+            name='fecha_creacion',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
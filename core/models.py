@@ -3,13 +3,17 @@ Modelos de datos para SIPROSA MES
 Sistema de Gestión de Manufactura para Planta Farmacéutica
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 import hashlib
 
+from .rastreo import CamposRastreadosMixin
+from .estados import MaquinaEstados, Transicion
+from .concurrencia import VersionadoMixin
+
 
 # ============================================
 # 1. MÓDULO: USUARIOS Y PERMISOS
@@ -273,7 +277,7 @@ class TipoDocumento(models.Model):
 # 3. MÓDULO: PRODUCCIÓN
 # ============================================
 
-class Lote(models.Model):
+class Lote(CamposRastreadosMixin, VersionadoMixin, models.Model):
     """Orden de producción (Batch Record)"""
     
     ESTADO_CHOICES = [
@@ -311,15 +315,45 @@ class Lote(models.Model):
     observaciones = models.TextField(blank=True)
     creado_por = models.ForeignKey(User, on_delete=models.PROTECT, related_name='lotes_creados')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     cancelado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='lotes_cancelados')
     fecha_cancelacion = models.DateTimeField(null=True, blank=True)
     motivo_cancelacion = models.TextField(blank=True, verbose_name="Motivo de cancelación")
     visible = models.BooleanField(default=True, verbose_name="Visible en listado")
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Aumenta en cada modificación (ETag)")
+    
+    # Campos registrados en LogAuditoria al modificar (visible se audita en ocultar/mostrar)
+    campos_rastreados = (
+        'codigo_lote', 'producto', 'formula', 'cantidad_planificada', 'cantidad_producida',
+        'cantidad_rechazada', 'unidad', 'estado', 'prioridad', 'fecha_planificada_inicio',
+        'fecha_real_inicio', 'fecha_planificada_fin', 'fecha_real_fin', 'turno', 'supervisor',
+        'observaciones', 'cancelado_por', 'fecha_cancelacion', 'motivo_cancelacion',
+    )
+    representacion_auditoria = {
+        'producto': 'nombre', 'turno': 'nombre', 'supervisor': 'username', 'cancelado_por': 'username',
+    }
+    
+    maquina_estados = MaquinaEstados(
+        cancelar=Transicion(['PLANIFICADO'], 'CANCELADO'),
+        liberar=Transicion(['FINALIZADO'], 'LIBERADO'),
+        rechazar=Transicion(['FINALIZADO'], 'RECHAZADO'),
+    )
     
     class Meta:
         verbose_name = "Lote de Producción"
         verbose_name_plural = "Lotes de Producción"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Listado paginado por clave (visibles, más recientes primero)
+            models.Index(fields=['visible', '-fecha_creacion', '-id']),
+            # Listado filtrado por estado (solo lotes visibles)
+            models.Index(fields=['estado', '-fecha_creacion'], condition=models.Q(visible=True),
+                         name='lote_visible_estado_idx'),
+            # KPIs: estado__in + rango de fecha_real_inicio
+            models.Index(fields=['estado', 'fecha_real_inicio']),
+            models.Index(fields=['producto', 'fecha_real_inicio']),
+            models.Index(fields=['turno', 'fecha_real_inicio']),
+        ]
     
     def __str__(self):
         return f"{self.codigo_lote} - {self.producto.nombre}"
@@ -332,7 +366,7 @@ class Lote(models.Model):
         return 0
 
 
-class LoteEtapa(models.Model):
+class LoteEtapa(CamposRastreadosMixin, VersionadoMixin, models.Model):
     """Etapas ejecutadas en un lote específico"""
     
     ESTADO_CHOICES = [
@@ -364,30 +398,51 @@ class LoteEtapa(models.Model):
     requiere_aprobacion_calidad = models.BooleanField(default=False)
     aprobada_por_calidad = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='etapas_aprobadas')
     fecha_aprobacion_calidad = models.DateTimeField(null=True, blank=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Aumenta en cada modificación (ETag)")
+    
+    # Aporte previo al contador de uso de la máquina (señales de UsoMaquina) y claves
+    # del rollup de KPIs que deja (lote, máquina, orden de la última etapa)
+    campos_rastreados = ('lote', 'orden', 'maquina', 'estado', 'duracion_minutos')
+    
+    maquina_estados = MaquinaEstados(
+        iniciar=Transicion(['PENDIENTE'], 'EN_PROCESO'),
+        completar=Transicion(['EN_PROCESO'], 'COMPLETADO'),
+        pausar=Transicion(['EN_PROCESO'], 'PAUSADO'),
+    )
+    campos_derivados = ('duracion_minutos', 'porcentaje_rendimiento')
     
     class Meta:
         verbose_name = "Etapa de Lote"
         verbose_name_plural = "Etapas de Lotes"
         ordering = ['lote', 'orden']
         unique_together = ['lote', 'orden']
+        indexes = [
+            # Estadísticas por etapa / máquina: rango de fecha_inicio
+            models.Index(fields=['fecha_inicio']),
+            # Cálculo incremental de indicadores de mantenimiento (máquina de las paradas)
+            models.Index(fields=['fecha_modificacion']),
+        ]
     
     def __str__(self):
         return f"{self.lote.codigo_lote} - {self.etapa.nombre}"
     
-    def save(self, *args, **kwargs):
+    def calcular_campos_derivados(self):
         # Calcular duración automáticamente
         if self.fecha_inicio and self.fecha_fin:
             delta = self.fecha_fin - self.fecha_inicio
             self.duracion_minutos = int(delta.total_seconds() / 60)
         
         # Calcular rendimiento
-        if self.cantidad_entrada and self.cantidad_salida and self.cantidad_entrada > 0:
-            self.porcentaje_rendimiento = round((self.cantidad_salida / self.cantidad_entrada) * 100, 2)
-        
+        if self.cantidad_entrada and self.cantidad_salida and Decimal(self.cantidad_entrada) > 0:
+            self.porcentaje_rendimiento = round((Decimal(self.cantidad_salida) / Decimal(self.cantidad_entrada)) * 100, 2)
+    
+    def save(self, *args, **kwargs):
+        self.calcular_campos_derivados()
         super().save(*args, **kwargs)
 
 
-class Parada(models.Model):
+class Parada(CamposRastreadosMixin, models.Model):
     """Paradas durante la producción"""
     
     TIPO_CHOICES = [
@@ -413,11 +468,22 @@ class Parada(models.Model):
     descripcion = models.TextField()
     solucion = models.TextField(blank=True)
     registrado_por = models.ForeignKey(User, on_delete=models.PROTECT, related_name='paradas_registradas')
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    
+    # Etapa previa (clave del rollup de KPIs que pierde los minutos si cambia)
+    campos_rastreados = ('lote_etapa',)
     
     class Meta:
         verbose_name = "Parada"
         verbose_name_plural = "Paradas"
         ordering = ['-fecha_inicio']
+        indexes = [
+            # Minutos de parada (fecha_fin__isnull) por etapa: solo índice en PostgreSQL
+            models.Index(fields=['lote_etapa', 'fecha_fin'], include=['duracion_minutos'],
+                         name='parada_etapa_fin_idx'),
+            # Cálculo incremental de indicadores de mantenimiento
+            models.Index(fields=['fecha_modificacion']),
+        ]
     
     def __str__(self):
         return f"Parada {self.get_categoria_display()} - {self.lote_etapa.lote.codigo_lote}"
@@ -571,6 +637,48 @@ class DocumentoVersionado(models.Model):
         return f"{self.codigo} - {self.titulo} (v{self.version})"
 
 
+class ResumenProduccionDiario(models.Model):
+    """
+    Rollup diario de producción por día/turno/máquina/producto (base de KPIs OEE).
+    Se mantiene desde señales y se reconstruye con `reconstruir_resumen_produccion`.
+    """
+
+    fecha = models.DateField(help_text="Fecha de inicio real del lote")
+    turno = models.ForeignKey(Turno, on_delete=models.CASCADE, related_name='resumenes_produccion')
+    maquina = models.ForeignKey(
+        Maquina, on_delete=models.CASCADE, null=True, blank=True, related_name='resumenes_produccion',
+        help_text="Máquina de la etapa (las cantidades del lote se asignan a la máquina de su última etapa)"
+    )
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='resumenes_produccion')
+    horas_planificadas = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    horas_reales = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    minutos_parada = models.IntegerField(default=0)
+    cantidad_planificada = models.BigIntegerField(default=0)
+    cantidad_producida = models.BigIntegerField(default=0)
+    cantidad_rechazada = models.BigIntegerField(default=0)
+    lotes = models.IntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen Diario de Producción"
+        verbose_name_plural = "Resúmenes Diarios de Producción"
+        ordering = ['-fecha', 'turno', 'maquina', 'producto']
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'turno', 'maquina', 'producto'],
+                                    name='resumen_produccion_unico'),
+            # NULL no cuenta para la unicidad: las filas sin máquina necesitan su propio índice
+            models.UniqueConstraint(fields=['fecha', 'turno', 'producto'], condition=models.Q(maquina__isnull=True),
+                                    name='resumen_produccion_sin_maquina_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', 'turno']),
+        ]
+
+    def __str__(self):
+        maquina = self.maquina.codigo if self.maquina else 'Sin máquina'
+        return f"{self.fecha} - {self.turno.codigo} - {maquina} - {self.producto.codigo}"
+
+
 # ============================================
 # 4. MÓDULO: INVENTARIO
 # ============================================
@@ -649,7 +757,7 @@ class FormulaInsumo(models.Model):
         return f"{self.formula.producto.nombre} - {self.insumo.nombre}"
 
 
-class LoteInsumo(models.Model):
+class LoteInsumo(CamposRastreadosMixin, models.Model):
     """Lotes de insumos en inventario (para FEFO)"""
     
     ESTADO_CHOICES = [
@@ -678,14 +786,38 @@ class LoteInsumo(models.Model):
     fecha_aprobacion = models.DateField(null=True, blank=True)
     observaciones = models.TextField(blank=True)
     
+    # Aporte previo del lote a SaldoInsumo (señales de saldos)
+    campos_rastreados = ('insumo', 'ubicacion', 'estado', 'cantidad_actual')
+    
     class Meta:
         verbose_name = "Lote de Insumo"
         verbose_name_plural = "Lotes de Insumos"
         ordering = ['fecha_vencimiento', 'fecha_recepcion']  # FEFO: First Expired, First Out
+        indexes = [
+            # Listado por insumo y estado en orden FEFO
+            models.Index(fields=['insumo', 'estado', 'fecha_vencimiento']),
+            # Asignación FEFO: solo lotes con stock
+            models.Index(fields=['insumo', 'fecha_vencimiento', 'fecha_recepcion'],
+                         condition=models.Q(estado='APROBADO', cantidad_actual__gt=0),
+                         name='loteinsumo_fefo_idx'),
+            # Alertas de vencimiento: lotes con stock en cuarentena o aprobados
+            models.Index(fields=['fecha_vencimiento'],
+                         condition=models.Q(estado__in=['CUARENTENA', 'APROBADO'], cantidad_actual__gt=0),
+                         name='loteinsumo_vencimiento_idx'),
+        ]
     
     def __str__(self):
         return f"{self.insumo.codigo} - Lote {self.codigo_lote_proveedor}"
     
+    def save(self, *args, **kwargs):
+        # Las señales actualizan SaldoInsumo en la misma transacción que el lote
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+    
     @property
     def dias_para_vencimiento(self):
         """Calcula días restantes hasta el vencimiento"""
@@ -695,7 +827,27 @@ class LoteInsumo(models.Model):
         return None
 
 
-class LoteInsumoConsumo(models.Model):
+class SaldoInsumo(models.Model):
+    """Saldo materializado de stock por insumo, ubicación y estado de lote"""
+    
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='saldos')
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.PROTECT, related_name='saldos_insumo')
+    estado = models.CharField(max_length=20, choices=LoteInsumo.ESTADO_CHOICES)
+    cantidad = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    lotes = models.IntegerField(default=0, help_text="Cantidad de lotes en este saldo")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Saldo de Insumo"
+        verbose_name_plural = "Saldos de Insumos"
+        ordering = ['insumo', 'ubicacion', 'estado']
+        unique_together = ['insumo', 'ubicacion', 'estado']
+    
+    def __str__(self):
+        return f"{self.insumo.codigo} - {self.ubicacion.codigo} - {self.estado}: {self.cantidad}"
+
+
+class LoteInsumoConsumo(CamposRastreadosMixin, models.Model):
     """Registro de consumo de insumos en producción"""
     
     lote_produccion = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name='consumos_insumo')
@@ -708,6 +860,9 @@ class LoteInsumoConsumo(models.Model):
     fecha_consumo = models.DateTimeField(auto_now_add=True)
     registrado_por = models.ForeignKey(User, on_delete=models.PROTECT, related_name='consumos_registrados')
     
+    # Par y cantidad previos del consumo (señales de GenealogiaLote)
+    campos_rastreados = ('lote_insumo', 'lote_produccion', 'cantidad_real')
+    
     class Meta:
         verbose_name = "Consumo de Insumo"
         verbose_name_plural = "Consumos de Insumos"
@@ -717,6 +872,36 @@ class LoteInsumoConsumo(models.Model):
         return f"{self.lote_produccion.codigo_lote} - {self.insumo.nombre}"
 
 
+class GenealogiaLote(models.Model):
+    """
+    Genealogía lote de insumo → lote de producción para trazabilidad (recalls).
+    Una fila por par con el total consumido, mantenida desde LoteInsumoConsumo;
+    insumo y codigo_lote_proveedor se copian para trazar todas las fracciones de
+    un lote del proveedor con un solo índice.
+    """
+
+    lote_insumo = models.ForeignKey(LoteInsumo, on_delete=models.CASCADE, related_name='genealogia')
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='genealogia')
+    codigo_lote_proveedor = models.CharField(max_length=50)
+    lote = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name='genealogia')
+    cantidad = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    unidad = models.CharField(max_length=20)
+    consumos = models.IntegerField(default=0)
+    fecha_primer_consumo = models.DateTimeField()
+    fecha_ultimo_consumo = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Genealogía de Lote"
+        verbose_name_plural = "Genealogía de Lotes"
+        unique_together = [['lote_insumo', 'lote']]
+        indexes = [
+            models.Index(fields=['insumo', 'codigo_lote_proveedor']),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo_lote_proveedor} → {self.lote_id}: {self.cantidad} {self.unidad}"
+
+
 class Repuesto(models.Model):
     """Catálogo de repuestos para mantenimiento"""
     
@@ -798,11 +983,78 @@ class MovimientoInventario(models.Model):
         verbose_name = "Movimiento de Inventario"
         verbose_name_plural = "Movimientos de Inventario"
         ordering = ['-fecha_movimiento']
+        indexes = [
+            # Saldos a fecha: movimientos de un ítem posteriores a un cierre
+            models.Index(fields=['tipo_item', 'item_id', 'fecha_movimiento']),
+            # Listado paginado por clave
+            models.Index(fields=['-fecha_movimiento', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} - {self.get_tipo_item_display()} ({self.fecha_movimiento.strftime('%Y-%m-%d')})"
 
 
+class CierreInventario(models.Model):
+    """Snapshot periódico del saldo de cada ítem y ubicación según MovimientoInventario (al final del día)"""
+    
+    fecha = models.DateField(help_text="Saldo acumulado al cierre de este día")
+    tipo_item = models.CharField(max_length=20, choices=MovimientoInventario.TIPO_ITEM_CHOICES)
+    item_id = models.IntegerField(help_text="ID del Insumo, Repuesto o Producto")
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.PROTECT, null=True, blank=True, related_name='cierres_inventario',
+                                  help_text="Vacío: movimientos registrados sin ubicación")
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Cierre de Inventario"
+        verbose_name_plural = "Cierres de Inventario"
+        ordering = ['-fecha', 'tipo_item', 'item_id']
+        unique_together = ['fecha', 'tipo_item', 'item_id', 'ubicacion']
+        indexes = [
+            models.Index(fields=['tipo_item', 'fecha']),
+            models.Index(fields=['tipo_item', 'fecha', 'item_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.get_tipo_item_display()} {self.item_id} @ {self.ubicacion_id}: {self.saldo}"
+
+
+class PronosticoInventario(models.Model):
+    """Pronóstico de consumo, días de cobertura y punto de reorden sugerido por ítem (cálculo nocturno)"""
+
+    TIPO_ITEM_CHOICES = [
+        ('INSUMO', 'Insumo'),
+        ('REPUESTO', 'Repuesto'),
+    ]
+
+    tipo_item = models.CharField(max_length=20, choices=TIPO_ITEM_CHOICES)
+    item_id = models.IntegerField(help_text="ID del Insumo o Repuesto")
+    fecha_calculo = models.DateField()
+    dias_historia = models.IntegerField()
+    consumo_periodo = models.DecimalField(max_digits=14, decimal_places=2)
+    media_movil_diaria = models.DecimalField(max_digits=14, decimal_places=4)
+    consumo_diario_pronosticado = models.DecimalField(max_digits=14, decimal_places=4, help_text="Suavizado exponencial")
+    desviacion_diaria = models.DecimalField(max_digits=14, decimal_places=4)
+    stock_actual = models.DecimalField(max_digits=14, decimal_places=2)
+    dias_cobertura = models.DecimalField(max_digits=10, decimal_places=1, null=True, blank=True,
+                                         help_text="Vacío: sin consumo pronosticado")
+    tiempo_reposicion_dias = models.IntegerField()
+    stock_seguridad = models.DecimalField(max_digits=14, decimal_places=2)
+    punto_reorden_sugerido = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Pronóstico de Inventario"
+        verbose_name_plural = "Pronósticos de Inventario"
+        ordering = ['tipo_item', 'dias_cobertura']
+        unique_together = ['tipo_item', 'item_id']
+        indexes = [
+            models.Index(fields=['tipo_item', 'dias_cobertura']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_item_display()} {self.item_id}: {self.dias_cobertura} días de cobertura"
+
+
 class ProductoTerminado(models.Model):
     """Inventario de productos terminados"""
     
@@ -840,6 +1092,7 @@ class AlertaInventario(models.Model):
     TIPO_ITEM_CHOICES = [
         ('INSUMO', 'Insumo'),
         ('REPUESTO', 'Repuesto'),
+        ('PRODUCTO_TERMINADO', 'Producto Terminado'),
     ]
     
     TIPO_ALERTA_CHOICES = [
@@ -864,6 +1117,7 @@ class AlertaInventario(models.Model):
     
     tipo_item = models.CharField(max_length=20, choices=TIPO_ITEM_CHOICES)
     item_id = models.IntegerField()
+    lote_item_id = models.IntegerField(null=True, blank=True, help_text="ID del LoteInsumo o ProductoTerminado (alertas de vencimiento)")
     tipo_alerta = models.CharField(max_length=20, choices=TIPO_ALERTA_CHOICES)
     nivel_urgencia = models.CharField(max_length=10, choices=NIVEL_CHOICES)
     mensaje = models.TextField()
@@ -881,6 +1135,9 @@ class AlertaInventario(models.Model):
         verbose_name = "Alerta de Inventario"
         verbose_name_plural = "Alertas de Inventario"
         ordering = ['-fecha_generacion', 'nivel_urgencia']
+        indexes = [
+            models.Index(fields=['estado', 'tipo_alerta']),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_alerta_display()} - {self.get_tipo_item_display()} ID:{self.item_id}"
@@ -921,6 +1178,35 @@ class ConteoFisico(models.Model):
         return f"{self.codigo} - {self.get_tipo_display()}"
 
 
+class ConteoFisicoLinea(models.Model):
+    """Línea de un conteo físico: cantidad contada en una posición para un lote de insumo o repuesto"""
+    
+    TIPO_ITEM_CHOICES = [
+        ('INSUMO', 'Insumo'),
+        ('REPUESTO', 'Repuesto'),
+    ]
+    
+    conteo = models.ForeignKey(ConteoFisico, on_delete=models.CASCADE, related_name='lineas')
+    tipo_item = models.CharField(max_length=20, choices=TIPO_ITEM_CHOICES)
+    item_id = models.IntegerField(help_text="ID del Insumo o Repuesto")
+    lote_item_id = models.IntegerField(null=True, blank=True, help_text="ID del LoteInsumo (obligatorio para insumos)")
+    posicion = models.CharField(max_length=100, blank=True, help_text="ej: Estante A-3 (un lote puede contarse en varias posiciones)")
+    cantidad_contada = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
+    registrado_por = models.ForeignKey(User, on_delete=models.PROTECT, related_name='lineas_conteo_registradas')
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Línea de Conteo Físico"
+        verbose_name_plural = "Líneas de Conteo Físico"
+        ordering = ['conteo', 'id']
+        indexes = [
+            models.Index(fields=['conteo', 'tipo_item', 'item_id', 'lote_item_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.conteo.codigo} - {self.get_tipo_item_display()} {self.item_id}: {self.cantidad_contada}"
+
+
 # ============================================
 # 5. MÓDULO: MANTENIMIENTO
 # ============================================
@@ -969,7 +1255,7 @@ class PlanMantenimiento(models.Model):
         return f"{self.codigo} - {self.nombre}"
 
 
-class OrdenTrabajo(models.Model):
+class OrdenTrabajo(CamposRastreadosMixin, VersionadoMixin, models.Model):
     """Órdenes de trabajo de mantenimiento"""
     
     PRIORIDAD_CHOICES = [
@@ -997,6 +1283,7 @@ class OrdenTrabajo(models.Model):
     titulo = models.CharField(max_length=200)
     descripcion = models.TextField()
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     fecha_planificada = models.DateTimeField(null=True, blank=True)
     fecha_inicio = models.DateTimeField(null=True, blank=True)
     fecha_fin = models.DateTimeField(null=True, blank=True)
@@ -1009,19 +1296,38 @@ class OrdenTrabajo(models.Model):
     requiere_parada_produccion = models.BooleanField(default=False)
     costo_estimado = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     costo_real = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Aumenta en cada modificación (ETag)")
+    
+    # La reasignación notifica al técnico
+    campos_rastreados = ('asignada_a',)
+    
+    maquina_estados = MaquinaEstados(
+        asignar=Transicion(['ABIERTA', 'ASIGNADA'], 'ASIGNADA'),
+        iniciar=Transicion(['ASIGNADA', 'PAUSADA'], 'EN_PROCESO'),
+        pausar=Transicion(['EN_PROCESO'], 'PAUSADA'),
+        completar=Transicion(['EN_PROCESO', 'PAUSADA'], 'COMPLETADA'),
+    )
+    campos_derivados = ('duracion_real_horas',)
     
     class Meta:
         verbose_name = "Orden de Trabajo"
         verbose_name_plural = "Órdenes de Trabajo"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Cálculo incremental de indicadores de mantenimiento
+            models.Index(fields=['fecha_modificacion']),
+        ]
     
     def __str__(self):
         return f"{self.codigo} - {self.titulo}"
     
-    def save(self, *args, **kwargs):
+    def calcular_campos_derivados(self):
         if self.fecha_inicio and self.fecha_fin:
             delta = self.fecha_fin - self.fecha_inicio
             self.duracion_real_horas = round(Decimal(delta.total_seconds() / 3600), 2)
+    
+    def save(self, *args, **kwargs):
+        self.calcular_campos_derivados()
         super().save(*args, **kwargs)
 
 
@@ -1053,11 +1359,16 @@ class HistorialMantenimiento(models.Model):
     tiempo_parada_horas = models.DecimalField(max_digits=6, decimal_places=2)
     costo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     realizado_por = models.ForeignKey(User, on_delete=models.PROTECT, related_name='mantenimientos_realizados')
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = "Historial de Mantenimiento"
         verbose_name_plural = "Historiales de Mantenimiento"
         ordering = ['-fecha']
+        indexes = [
+            # Cálculo incremental de indicadores de mantenimiento
+            models.Index(fields=['fecha_modificacion']),
+        ]
     
     def __str__(self):
         return f"{self.maquina.codigo} - {self.fecha.strftime('%Y-%m-%d')}"
@@ -1095,6 +1406,28 @@ class IndicadorMantenimiento(models.Model):
         return f"{self.maquina.codigo} - {self.get_periodo_display()} ({self.fecha_inicio})"
 
 
+class UsoMaquina(models.Model):
+    """Contador acumulado de uso por máquina (etapas de lote completadas)"""
+    
+    maquina = models.OneToOneField(Maquina, on_delete=models.CASCADE, related_name='uso')
+    minutos_operacion = models.BigIntegerField(default=0)
+    ciclos = models.IntegerField(default=0, help_text="Etapas completadas en la máquina")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Uso de Máquina"
+        verbose_name_plural = "Usos de Máquinas"
+        ordering = ['maquina']
+    
+    def __str__(self):
+        return f"{self.maquina.codigo} - {self.horas_operacion} h"
+    
+    @property
+    def horas_operacion(self):
+        """Horas de operación acumuladas"""
+        return round(self.minutos_operacion / 60, 2)
+
+
 # ============================================
 # 6. MÓDULO: INCIDENTES
 # ============================================
@@ -1258,6 +1591,8 @@ class LogAuditoria(models.Model):
         indexes = [
             models.Index(fields=['usuario', '-fecha']),
             models.Index(fields=['modelo', 'objeto_id']),
+            # Listado paginado por clave
+            models.Index(fields=['-fecha', '-id']),
         ]
     
     def __str__(self):
@@ -1432,6 +1767,8 @@ class ElectronicSignature(models.Model):
             models.Index(fields=['content_type', 'object_id']),
             models.Index(fields=['user', '-timestamp']),
             models.Index(fields=['is_valid']),
+            # Listado paginado por clave
+            models.Index(fields=['-timestamp', '-id']),
         ]
     
     def __str__(self):
@@ -0,0 +1,207 @@
+"""
+Paginación de listados grandes para SIPROSA MES
+Por defecto se mantiene la paginación por número de página de la API. Los listados que
+crecen sin límite (lotes, movimientos, firmas, auditoría) admiten además:
+
+- ?paginacion=cursor: paginación por clave (keyset) sobre el orden natural del listado
+  (`orden_cursor` de la vista, con el id como desempate). Cada página filtra
+  "después de la última fila" en lugar de usar OFFSET y no ejecuta COUNT(*): la página N
+  cuesta lo mismo que la primera si hay un índice con las columnas del orden.
+- ?conteo=aproximado: total estimado por el planificador de PostgreSQL en lugar de
+  COUNT(*) (en modo cursor el total solo se informa si se pide con ?conteo=).
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Con estimaciones menores a este umbral el COUNT(*) exacto es barato
+UMBRAL_CONTEO_EXACTO = 10000
+
+
+def contar_aproximado(queryset):
+    """
+    Cantidad de filas del queryset estimada con EXPLAIN en PostgreSQL (sin recorrer la
+    tabla). En otros motores, o si la estimación es chica, hace el COUNT(*) exacto.
+    """
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with conexion.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimado = int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count() if estimado < UMBRAL_CONTEO_EXACTO else estimado
+
+
+class PaginadorConteoAproximado(Paginator):
+    """Paginator de Django cuyo total es el estimado por contar_aproximado"""
+
+    @cached_property
+    def count(self):
+        return contar_aproximado(self.object_list)
+
+
+def _despues_de(queryset, orden, valores):
+    """
+    Filas de `queryset` posteriores a `valores` según `orden` [(campo, descendente)].
+
+    Con todos los campos en el mismo sentido (el caso de todos los listados) es una
+    comparación de filas, (a, b) < (va, vb), que PostgreSQL resuelve como condición de
+    rango sobre el índice del orden: la página N se lee igual que la primera. Con sentidos
+    mezclados: (a < va) OR (a = va AND b < vb) ... (con > en los campos ascendentes),
+    más la cota redundante a <= va para que el índice quede acotado.
+    """
+    conexion = connections[queryset.db]
+    meta = queryset.model._meta
+    campos = [meta.get_field(campo) for campo, _ in orden]
+    sentidos = {descendente for _, descendente in orden}
+
+    if len(sentidos) == 1:
+        tabla = conexion.ops.quote_name(meta.db_table)
+        columnas = ', '.join(f'{tabla}.{conexion.ops.quote_name(campo.column)}' for campo in campos)
+        marcadores = ', '.join(['%s'] * len(campos))
+        operador = '<' if sentidos.pop() else '>'
+        parametros = [campo.get_db_prep_value(valor, conexion) for campo, valor in zip(campos, valores)]
+        return queryset.filter(RawSQL(
+            f'({columnas}) {operador} ({marcadores})', parametros, output_field=BooleanField()
+        ))
+
+    filtro = Q()
+    for i, (campo, descendente) in enumerate(orden):
+        iguales = {anterior: valor for (anterior, _), valor in zip(orden[:i], valores[:i])}
+        filtro |= Q(**iguales, **{f"{campo}__{'lt' if descendente else 'gt'}": valores[i]})
+    primero, descendente = orden[0]
+    return queryset.filter(filtro, **{f"{primero}__{'lte' if descendente else 'gte'}": valores[0]})
+
+
+class PaginacionListados(PageNumberPagination):
+    """
+    Paginación de listados grandes: por número de página (por defecto) o por clave con
+    ?paginacion=cursor. La vista define `orden_cursor`, p. ej. ('-fecha_creacion', '-id');
+    los campos deben ser no nulos y el último único. En modo cursor el orden es fijo
+    (se ignora ?ordering=).
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    orden_cursor = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.conteo = request.query_params.get('conteo')
+        self.modo_cursor = (
+            request.query_params.get('paginacion') == 'cursor' or self.cursor_query_param in request.query_params
+        )
+        if self.modo_cursor:
+            return self._paginar_por_clave(queryset, request, view)
+        if self.conteo == 'aproximado':
+            self.django_paginator_class = PaginadorConteoAproximado
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if not self.modo_cursor:
+            return super().get_paginated_response(data)
+        respuesta = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.total is not None:
+            respuesta['count'] = self.total
+        respuesta['results'] = data
+        return Response(respuesta)
+
+    # ---------- Modo cursor ----------
+
+    def _codificar(self, fila, hacia_atras):
+        valores = [getattr(fila, campo) for campo, _ in self.orden]
+        valores = [valor.isoformat() if hasattr(valor, 'isoformat') else valor for valor in valores]
+        return base64.urlsafe_b64encode(json.dumps([valores, hacia_atras]).encode()).decode()
+
+    def _decodificar(self, cursor, modelo):
+        """
+        Valores del cursor convertidos al tipo de cada campo del orden (to_python), de
+        modo que un cursor alterado se responde con 404 y no llega al filtro
+        """
+        try:
+            valores, hacia_atras = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise NotFound('Cursor inválido')
+        if not isinstance(valores, list) or len(valores) != len(self.orden):
+            raise NotFound('Cursor inválido')
+        convertidos = []
+        for (campo, _), valor in zip(self.orden, valores):
+            if valor is None or isinstance(valor, (dict, list)):
+                raise NotFound('Cursor inválido')
+            try:
+                convertidos.append(modelo._meta.get_field(campo).to_python(valor))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound('Cursor inválido')
+            if convertidos[-1] is None:
+                raise NotFound('Cursor inválido')
+        return convertidos, bool(hacia_atras)
+
+    def _paginar_por_clave(self, queryset, request, view):
+        self.page_size = self.get_page_size(request)
+        self.orden = [
+            (campo.lstrip('-'), campo.startswith('-'))
+            for campo in getattr(view, 'orden_cursor', self.orden_cursor)
+        ]
+        queryset = queryset.order_by(*[f"{'-' if desc else ''}{campo}" for campo, desc in self.orden])
+
+        self.total = None
+        if self.conteo == 'aproximado':
+            self.total = contar_aproximado(queryset)
+        elif self.conteo == 'exacto':
+            self.total = queryset.count()
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        hacia_atras = False
+        if cursor:
+            valores, hacia_atras = self._decodificar(cursor, queryset.model)
+            # Hacia atrás se recorre el orden invertido y luego se da vuelta la página
+            orden = [(campo, desc != hacia_atras) for campo, desc in self.orden]
+            queryset = _despues_de(queryset, orden, valores)
+            if hacia_atras:
+                queryset = queryset.reverse()
+
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if hacia_atras:
+            filas.reverse()
+
+        self.filas = filas
+        self.hay_siguiente = bool(cursor) if hacia_atras else hay_mas
+        self.hay_anterior = hay_mas if hacia_atras else bool(cursor)
+        return filas
+
+    def _link(self, cursor):
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.modo_cursor:
+            return super().get_next_link()
+        if not self.hay_siguiente or not self.filas:
+            return None
+        return self._link(self._codificar(self.filas[-1], False))
+
+    def get_previous_link(self):
+        if not self.modo_cursor:
+            return super().get_previous_link()
+        if not self.hay_anterior or not self.filas:
+            return None
+        return self._link(self._codificar(self.filas[0], True))
@@ -0,0 +1,130 @@
+"""
+Explosión de requerimientos de materiales (MRP) para SIPROSA MES
+Explota los lotes planificados / en proceso a través de Formula → FormulaInsumo,
+descuenta lo ya consumido (LoteInsumoConsumo) y compara contra el stock aprobado
+(SaldoInsumo) en orden de fecha_planificada_inicio para detectar faltantes.
+
+Todo se resuelve con cinco consultas masivas y cruces en memoria: sin consultas por lote.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import Lote, FormulaInsumo, LoteInsumoConsumo, SaldoInsumo, Insumo
+
+
+# Lotes que todavía requieren material
+ESTADOS_LOTE_MRP = ['PLANIFICADO', 'EN_PROCESO', 'PAUSADO']
+
+_CERO = Decimal('0')
+
+
+def _lotes_pendientes(hasta=None):
+    """Lotes a explotar en orden de inicio planificado (una consulta)"""
+    lotes = Lote.objects.filter(estado__in=ESTADOS_LOTE_MRP)
+    if hasta:
+        lotes = lotes.filter(fecha_planificada_inicio__date__lte=hasta)
+    return list(
+        lotes.order_by('fecha_planificada_inicio', 'id').values(
+            'id', 'codigo_lote', 'formula_id', 'cantidad_planificada', 'fecha_planificada_inicio', 'estado'
+        )
+    )
+
+
+def _lineas_por_formula(formula_ids):
+    """FormulaInsumo agrupadas por fórmula (una consulta)"""
+    lineas = defaultdict(list)
+    for formula_id, insumo_id, cantidad in FormulaInsumo.objects.filter(
+        formula_id__in=formula_ids
+    ).values_list('formula_id', 'insumo_id', 'cantidad'):
+        lineas[formula_id].append((insumo_id, cantidad))
+    return lineas
+
+
+def _consumido_por_lote(lote_ids):
+    """Cantidad ya consumida por (lote, insumo) (una consulta agrupada)"""
+    return {
+        (fila['lote_produccion_id'], fila['insumo_id']): fila['total'] or _CERO
+        for fila in LoteInsumoConsumo.objects.filter(lote_produccion_id__in=lote_ids).order_by()
+        .values('lote_produccion_id', 'insumo_id').annotate(total=Sum('cantidad_real'))
+    }
+
+
+def _stock_aprobado(insumo_ids):
+    """Stock aprobado por insumo desde el saldo materializado (una consulta agrupada)"""
+    return dict(
+        SaldoInsumo.objects.filter(insumo_id__in=insumo_ids, estado='APROBADO').order_by()
+        .values('insumo_id').annotate(total=Sum('cantidad')).values_list('insumo_id', 'total')
+    )
+
+
+def explotar_requerimientos(hasta=None, solo_faltantes=False):
+    """
+    Requerimientos netos por insumo para los lotes pendientes hasta `hasta` (inclusive).
+
+    Requerido de cada lote = FormulaInsumo.cantidad × cantidad_planificada − lo ya consumido.
+    Los requerimientos se acumulan en orden de fecha_planificada_inicio contra el stock
+    aprobado: la fecha de faltante es el inicio del primer lote que deja el saldo negativo.
+    Resultado ordenado por fecha de faltante (los insumos sin faltante al final).
+    """
+    lotes = _lotes_pendientes(hasta)
+    lineas = _lineas_por_formula({lote['formula_id'] for lote in lotes})
+    consumido = _consumido_por_lote([lote['id'] for lote in lotes])
+
+    insumo_ids = {insumo_id for items in lineas.values() for insumo_id, _ in items}
+    stock = _stock_aprobado(insumo_ids)
+    catalogo = {
+        insumo['id']: insumo
+        for insumo in Insumo.objects.filter(id__in=insumo_ids).values('id', 'codigo', 'nombre', 'unidad_medida')
+    }
+
+    resultado = {
+        insumo_id: {
+            'insumo_id': insumo_id,
+            'codigo': catalogo[insumo_id]['codigo'],
+            'nombre': catalogo[insumo_id]['nombre'],
+            'unidad': catalogo[insumo_id]['unidad_medida'],
+            'stock_aprobado': stock.get(insumo_id) or _CERO,
+            'requerido': _CERO,
+            'lotes': 0,
+            'fecha_faltante': None,
+            'lote_faltante': None,
+            'lotes_con_faltante': 0,
+        }
+        for insumo_id in insumo_ids
+    }
+
+    # Barrido cronológico: saldo proyectado por insumo
+    for lote in lotes:
+        for insumo_id, cantidad in lineas.get(lote['formula_id'], ()):
+            requerido = cantidad * lote['cantidad_planificada'] - consumido.get((lote['id'], insumo_id), _CERO)
+            if requerido <= 0:
+                continue
+            fila = resultado[insumo_id]
+            fila['requerido'] += requerido
+            fila['lotes'] += 1
+            if fila['requerido'] > fila['stock_aprobado']:
+                fila['lotes_con_faltante'] += 1
+                if fila['fecha_faltante'] is None:
+                    fila['fecha_faltante'] = lote['fecha_planificada_inicio']
+                    fila['lote_faltante'] = lote['codigo_lote']
+
+    filas = []
+    for fila in resultado.values():
+        if not fila['lotes']:
+            continue
+        fila['saldo_proyectado'] = fila['stock_aprobado'] - fila['requerido']
+        fila['faltante'] = max(-fila['saldo_proyectado'], _CERO)
+        if solo_faltantes and not fila['faltante']:
+            continue
+        filas.append(fila)
+
+    filas.sort(key=lambda f: (f['fecha_faltante'] is None, f['fecha_faltante'] or 0, f['codigo']))
+    return {
+        'hasta': hasta,
+        'lotes_explotados': len(lotes),
+        'insumos_con_faltante': sum(1 for fila in filas if fila['faltante']),
+        'insumos': filas,
+    }
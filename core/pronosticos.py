@@ -0,0 +1,243 @@
+"""
+Pronóstico de consumo de inventario para SIPROSA MES
+Series diarias de consumo de insumos (LoteInsumoConsumo) y repuestos (OrdenTrabajoRepuesto
+y salidas de MovimientoInventario), media móvil y suavizado exponencial, días de
+cobertura y punto de reorden sugerido según el tiempo de reposición.
+
+Cada tipo de ítem se lee en consultas agrupadas por (ítem, día) a una matriz NumPy
+ítems × días y los pronósticos se calculan de forma vectorizada para todos los ítems
+a la vez. El resultado se publica en PronosticoInventario (cálculo nocturno).
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    Insumo, LoteInsumoConsumo, SaldoInsumo, Repuesto, OrdenTrabajoRepuesto,
+    MovimientoInventario, PronosticoInventario
+)
+from .inventario import fin_del_dia
+
+
+# Días de historia leídos para las series
+DIAS_HISTORIA = 180
+
+# Ventana (días) de la media móvil y de la desviación del consumo diario
+VENTANA_MEDIA_MOVIL = 28
+
+# Peso de la última observación en el suavizado exponencial simple
+ALFA_SUAVIZADO = 0.2
+
+# Factor de nivel de servicio del stock de seguridad (~95%)
+Z_NIVEL_SERVICIO = 1.65
+
+# Insumo no registra tiempo de reposición: se usa este valor para todos
+TIEMPO_REPOSICION_INSUMO_DIAS = 15
+
+
+# ============================================
+# SERIES DE CONSUMO
+# ============================================
+
+def _consumo_diario(queryset, campo_item, campo_fecha, campo_cantidad, desde, hasta):
+    """Consumo por (ítem, día local) en [desde, hasta] (una consulta agrupada)"""
+    return list(
+        queryset.filter(**{
+            f'{campo_fecha}__gte': fin_del_dia(desde - timedelta(days=1)),
+            f'{campo_fecha}__lt': fin_del_dia(hasta),
+        }).annotate(dia=TruncDate(campo_fecha)).order_by()
+        .values(campo_item, 'dia').annotate(total=Sum(campo_cantidad))
+        .values_list(campo_item, 'dia', 'total')
+    )
+
+
+def series_insumos(desde, hasta):
+    """Filas (insumo_id, día, cantidad) consumidas en producción"""
+    return _consumo_diario(
+        LoteInsumoConsumo.objects.all(), 'insumo_id', 'fecha_consumo', 'cantidad_real', desde, hasta
+    )
+
+
+def series_repuestos(desde, hasta):
+    """
+    Filas (repuesto_id, día, cantidad): repuestos usados en órdenes de trabajo más las
+    salidas de MovimientoInventario. Las salidas por MANTENIMIENTO se excluyen porque ese
+    consumo ya está registrado en la orden de trabajo.
+    """
+    usados = _consumo_diario(
+        OrdenTrabajoRepuesto.objects.filter(cantidad_real__gt=0),
+        'repuesto_id', 'fecha_uso', 'cantidad_real', desde, hasta,
+    )
+    salidas = _consumo_diario(
+        MovimientoInventario.objects.filter(tipo_item='REPUESTO', tipo_movimiento='SALIDA').exclude(motivo='MANTENIMIENTO'),
+        'item_id', 'fecha_movimiento', 'cantidad', desde, hasta,
+    )
+    return usados + salidas
+
+
+def matriz_consumo(filas, item_ids, desde, dias):
+    """Matriz ítems × días (float64) con el consumo de cada día; los ítems fuera de item_ids se ignoran"""
+    indice = {item_id: i for i, item_id in enumerate(item_ids)}
+    matriz = np.zeros((len(item_ids), dias))
+    filas = [fila for fila in filas if fila[0] in indice and fila[2]]
+    if filas:
+        posiciones = np.fromiter((indice[item_id] for item_id, _, _ in filas), dtype=np.int64, count=len(filas))
+        dias_idx = np.fromiter(((dia - desde).days for _, dia, _ in filas), dtype=np.int64, count=len(filas))
+        cantidades = np.fromiter((float(total) for _, _, total in filas), dtype=np.float64, count=len(filas))
+        # Varias fuentes pueden aportar al mismo (ítem, día): acumulación sin buffer
+        np.add.at(matriz, (posiciones, dias_idx), cantidades)
+    return matriz
+
+
+# ============================================
+# PRONÓSTICOS
+# ============================================
+
+def pronosticar(matriz, ventana=VENTANA_MEDIA_MOVIL, alfa=ALFA_SUAVIZADO):
+    """
+    Media móvil, desviación (de la ventana) y suavizado exponencial simple del consumo
+    diario de cada fila. El suavizado s_t = α·x_t + (1-α)·s_(t-1), con s_0 = x_0, se
+    resuelve en forma cerrada como un único producto matriz × vector de pesos.
+    """
+    dias = matriz.shape[1]
+    reciente = matriz[:, -ventana:]
+    pesos = alfa * (1 - alfa) ** np.arange(dias - 1, -1, -1, dtype=np.float64)
+    pesos[0] = (1 - alfa) ** (dias - 1)
+    return reciente.mean(axis=1), reciente.std(axis=1), matriz @ pesos
+
+
+def _decimal(valor, decimales):
+    return Decimal(f'{float(valor):.{decimales}f}')
+
+
+def _pronosticos_tipo(tipo_item, item_ids, stock, reposicion, filas, desde, dias, ventana, alfa, hoy, enteros):
+    """PronosticoInventario (sin guardar) de todos los ítems de un tipo"""
+    if not item_ids:
+        return []
+    matriz = matriz_consumo(filas, item_ids, desde, dias)
+    media_movil, desviacion, suavizado = pronosticar(matriz, ventana, alfa)
+
+    stock = np.asarray(stock, dtype=np.float64)
+    reposicion = np.asarray(reposicion, dtype=np.float64)
+    stock_seguridad = Z_NIVEL_SERVICIO * desviacion * np.sqrt(reposicion)
+    punto_reorden = suavizado * reposicion + stock_seguridad
+    if enteros:
+        stock_seguridad = np.ceil(stock_seguridad)
+        punto_reorden = np.ceil(punto_reorden)
+    cobertura = np.divide(stock, suavizado, out=np.full_like(stock, np.nan), where=suavizado > 1e-9)
+    consumo_periodo = matriz.sum(axis=1)
+
+    return [
+        PronosticoInventario(
+            tipo_item=tipo_item,
+            item_id=item_id,
+            fecha_calculo=hoy,
+            dias_historia=dias,
+            consumo_periodo=_decimal(consumo_periodo[i], 2),
+            media_movil_diaria=_decimal(media_movil[i], 4),
+            consumo_diario_pronosticado=_decimal(suavizado[i], 4),
+            desviacion_diaria=_decimal(desviacion[i], 4),
+            stock_actual=_decimal(stock[i], 2),
+            dias_cobertura=None if np.isnan(cobertura[i]) else _decimal(min(cobertura[i], 999999), 1),
+            tiempo_reposicion_dias=int(reposicion[i]),
+            stock_seguridad=_decimal(stock_seguridad[i], 2),
+            punto_reorden_sugerido=_decimal(punto_reorden[i], 2),
+        )
+        for i, item_id in enumerate(item_ids)
+    ]
+
+
+def calcular_pronosticos(hoy=None, dias_historia=DIAS_HISTORIA, ventana=VENTANA_MEDIA_MOVIL,
+                         alfa=ALFA_SUAVIZADO, reposicion_insumos=TIEMPO_REPOSICION_INSUMO_DIAS):
+    """
+    Recalcula y publica el pronóstico de todos los insumos y repuestos activos con la
+    historia de los `dias_historia` días completos anteriores a `hoy`.
+    Retorna la cantidad de pronósticos publicados por tipo de ítem.
+    """
+    if not 0 < alfa <= 1:
+        raise ValueError('alfa debe estar en (0, 1]')
+    if ventana < 1 or dias_historia < ventana:
+        raise ValueError('La ventana debe ser al menos 1 y no mayor que los días de historia')
+
+    hoy = hoy or timezone.localdate()
+    hasta = hoy - timedelta(days=1)
+    desde = hoy - timedelta(days=dias_historia)
+
+    # Insumos: stock aprobado del saldo materializado
+    insumo_ids = list(Insumo.objects.filter(activo=True).order_by('id').values_list('id', flat=True))
+    aprobado = dict(
+        SaldoInsumo.objects.filter(insumo_id__in=insumo_ids, estado='APROBADO').order_by()
+        .values('insumo_id').annotate(total=Sum('cantidad')).values_list('insumo_id', 'total')
+    )
+    insumos = _pronosticos_tipo(
+        'INSUMO', insumo_ids,
+        [float(aprobado.get(insumo_id) or 0) for insumo_id in insumo_ids],
+        [reposicion_insumos] * len(insumo_ids),
+        series_insumos(desde, hasta), desde, dias_historia, ventana, alfa, hoy, enteros=False,
+    )
+
+    repuestos = list(
+        Repuesto.objects.filter(activo=True).order_by('id').values_list('id', 'stock_actual', 'tiempo_reposicion_dias')
+    )
+    repuestos = _pronosticos_tipo(
+        'REPUESTO', [r[0] for r in repuestos], [r[1] for r in repuestos], [r[2] for r in repuestos],
+        series_repuestos(desde, hasta), desde, dias_historia, ventana, alfa, hoy, enteros=True,
+    )
+
+    with transaction.atomic():
+        PronosticoInventario.objects.all().delete()
+        PronosticoInventario.objects.bulk_create(insumos + repuestos, batch_size=1000)
+
+    return {'INSUMO': len(insumos), 'REPUESTO': len(repuestos)}
+
+
+# ============================================
+# CONSULTA DE PRONÓSTICOS PUBLICADOS
+# ============================================
+
+# Campos del pronóstico que se anotan en los listados de insumos y repuestos
+CAMPOS_PUBLICADOS = ('consumo_diario_pronosticado', 'dias_cobertura', 'punto_reorden_sugerido')
+
+CATALOGOS = {'INSUMO': Insumo, 'REPUESTO': Repuesto}
+
+
+def pronostico_subqueries(tipo_item, item_ref='pk'):
+    """Expresiones con los campos publicados del pronóstico de cada ítem, para anotar querysets de Insumo / Repuesto"""
+    pronostico = PronosticoInventario.objects.filter(tipo_item=tipo_item, item_id=OuterRef(item_ref))
+    return {campo: Subquery(pronostico.values(campo)[:1]) for campo in CAMPOS_PUBLICADOS}
+
+
+def listar_pronosticos(tipo_item, cobertura_max=None):
+    """
+    Pronósticos publicados de un tipo de ítem con código, nombre y punto de reorden
+    actual, de menor a mayor cobertura (sin consumo al final). Dos consultas.
+    """
+    pronosticos = PronosticoInventario.objects.filter(tipo_item=tipo_item)
+    if cobertura_max is not None:
+        pronosticos = pronosticos.filter(dias_cobertura__lte=cobertura_max)
+    filas = list(
+        pronosticos.order_by(F('dias_cobertura').asc(nulls_last=True), 'item_id').values(
+            'item_id', 'fecha_calculo', 'dias_historia', 'consumo_periodo', 'media_movil_diaria',
+            'consumo_diario_pronosticado', 'desviacion_diaria', 'stock_actual', 'dias_cobertura',
+            'tiempo_reposicion_dias', 'stock_seguridad', 'punto_reorden_sugerido',
+        )
+    )
+    catalogo = {
+        item['id']: item
+        for item in CATALOGOS[tipo_item].objects.filter(id__in=[fila['item_id'] for fila in filas]).values(
+            'id', 'codigo', 'nombre', 'punto_reorden'
+        )
+    }
+    for fila in filas:
+        item = catalogo.get(fila['item_id'], {})
+        fila['codigo'] = item.get('codigo')
+        fila['nombre'] = item.get('nombre')
+        fila['punto_reorden_actual'] = item.get('punto_reorden')
+    return filas
@@ -0,0 +1,144 @@
+"""
+Seguimiento de campos modificados para SIPROSA MES
+Los modelos auditados heredan CamposRastreadosMixin: la instancia guarda los valores
+originales de sus campos al leerse de la base (y después de cada save), de modo que las
+señales de auditoría detectan los cambios sin volver a consultar la fila. Las FK se
+comparan por id y solo se resuelven a un nombre legible las que efectivamente cambiaron.
+"""
+
+import copy
+from datetime import date, datetime, time
+from decimal import Decimal
+
+
+class CamposRastreadosMixin:
+    """
+    Mixin de modelo con los valores originales de los campos rastreados.
+    `campos_rastreados`: nombres de los campos a seguir (None = todos los campos concretos
+    salvo la PK). `representacion_auditoria`: {fk: atributo del objeto relacionado} para
+    mostrar las FK en la auditoría (por defecto str()).
+    """
+    campos_rastreados = None
+    representacion_auditoria = {}
+
+    @classmethod
+    def _campos_de_rastreo(cls):
+        campos = [f for f in cls._meta.concrete_fields if not f.primary_key]
+        if cls.campos_rastreados is not None:
+            campos = [f for f in campos if f.name in cls.campos_rastreados]
+        return campos
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._tomar_originales()
+        return instancia
+
+    def _tomar_originales(self, campos=None):
+        """Toma como originales los valores cargados (de los campos indicados o de todos)"""
+        if campos is None or not hasattr(self, '_valores_originales'):
+            self._valores_originales = {}
+        for campo in self._campos_de_rastreo():
+            if campos is not None and campo.name not in campos and campo.attname not in campos:
+                continue
+            if campo.attname in self.__dict__:
+                # Copia: un JSONField modificado en el lugar no debe alterar el original
+                self._valores_originales[campo.attname] = copy.deepcopy(self.__dict__[campo.attname])
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Lo guardado pasa a ser el nuevo original (solo lo escrito si hubo update_fields)
+        self._tomar_originales(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._tomar_originales(fields)
+
+    def valores_originales(self):
+        """
+        {attname: valor} de los campos rastreados tal como se leyeron. Los que no se
+        cargaron (instancia creada a mano con pk, o campos diferidos con .only()) se leen
+        de la base en una sola consulta, y quedan guardados para los siguientes usos.
+        """
+        originales = getattr(self, '_valores_originales', None)
+        if originales is None:
+            originales = self._valores_originales = {}
+        if self.pk is None:
+            return originales
+        faltantes = [
+            campo.attname for campo in self._campos_de_rastreo()
+            if campo.attname not in originales and campo.attname in self.__dict__
+        ]
+        if faltantes:
+            fila = type(self)._base_manager.filter(pk=self.pk).values(*faltantes).first()
+            if fila:
+                originales.update(fila)
+        return originales
+
+    def campos_modificados(self):
+        """{campo: (antes, despues)} de los campos rastreados que cambiaron (FK por id)"""
+        if self.pk is None:
+            return {}
+        originales = self.valores_originales()
+        cambios = {}
+        for campo in self._campos_de_rastreo():
+            if campo.attname not in self.__dict__ or campo.attname not in originales:
+                continue
+            actual = self.__dict__[campo.attname]
+            if actual != originales[campo.attname]:
+                cambios[campo.name] = (originales[campo.attname], actual)
+        return cambios
+
+
+def _valor_auditoria(valor):
+    """Valor serializable a JSON para el registro de auditoría"""
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def cambios_legibles(instancia, cambios):
+    """
+    {campo: {'antes', 'despues'}} para LogAuditoria a partir de campos_modificados().
+    Las FK se muestran según representacion_auditoria; los objetos relacionados ya
+    cargados en la instancia se reutilizan y el resto se lee con una consulta por
+    modelo relacionado (p. ej. supervisor y cancelado_por juntos).
+    """
+    meta = instancia._meta
+    pendientes = {}
+    for nombre, (antes, despues) in cambios.items():
+        campo = meta.get_field(nombre)
+        if campo.is_relation:
+            ids = pendientes.setdefault(campo.related_model, set())
+            ids.add(antes)
+            cargado = campo.get_cached_value(instancia, None)
+            if cargado is None or cargado.pk != despues:
+                ids.add(despues)
+    objetos = {
+        modelo: modelo._default_manager.in_bulk([pk for pk in ids if pk is not None])
+        for modelo, ids in pendientes.items()
+    }
+
+    def mostrar(campo, pk, cargado=None):
+        if pk is None:
+            return None
+        if cargado is not None and cargado.pk == pk:
+            objeto = cargado
+        else:
+            objeto = objetos[campo.related_model].get(pk)
+        if objeto is None:
+            return pk
+        atributo = instancia.representacion_auditoria.get(campo.name)
+        return getattr(objeto, atributo) if atributo else str(objeto)
+
+    legibles = {}
+    for nombre, (antes, despues) in cambios.items():
+        campo = meta.get_field(nombre)
+        if campo.is_relation:
+            cargado = campo.get_cached_value(instancia, None)
+            legibles[nombre] = {'antes': mostrar(campo, antes), 'despues': mostrar(campo, despues, cargado)}
+        else:
+            legibles[nombre] = {'antes': _valor_auditoria(antes), 'despues': _valor_auditoria(despues)}
+    return legibles
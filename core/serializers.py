@@ -3,6 +3,8 @@ Serializers para SIPROSA MES
 Nota: Esta es una versión inicial. Se expandirá según se necesite.
 """
 
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
@@ -13,14 +15,15 @@ from .models import (
     # Producción
     Lote, LoteEtapa, Parada, ControlCalidad, Desviacion, DocumentoVersionado,
     # Inventario
-    Insumo, LoteInsumo, Repuesto, ProductoTerminado, MovimientoInventario,
+    Insumo, LoteInsumo, Repuesto, ProductoTerminado, MovimientoInventario, ConteoFisico,
     # Mantenimiento
-    TipoMantenimiento, OrdenTrabajo,
+    TipoMantenimiento, OrdenTrabajo, UsoMaquina,
     # Incidentes
     TipoIncidente, Incidente, AccionCorrectiva,
     # Auditoría
     Notificacion, LogAuditoria, ElectronicSignature,
 )
+from .pronosticos import CAMPOS_PUBLICADOS
 
 
 # ============================================
@@ -329,15 +332,33 @@ class MaquinaSerializer(serializers.ModelSerializer):
     """Serializer de máquinas"""
     ubicacion_nombre = serializers.CharField(source='ubicacion.nombre', read_only=True)
     tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
+    horas_operacion = serializers.SerializerMethodField()
+    ciclos_operacion = serializers.SerializerMethodField()
     
     class Meta:
         model = Maquina
         fields = [
             'id', 'codigo', 'nombre', 'tipo', 'tipo_display', 'fabricante', 'modelo',
             'ubicacion', 'ubicacion_nombre', 'descripcion', 'capacidad_nominal',
-            'unidad_capacidad', 'activa', 'fecha_instalacion'
+            'unidad_capacidad', 'activa', 'fecha_instalacion',
+            'horas_operacion', 'ciclos_operacion'
         ]
         read_only_fields = ['id']
+    
+    def _uso(self, obj):
+        # El ViewSet hace select_related('uso'): sin consultas extra por fila
+        try:
+            return obj.uso
+        except UsoMaquina.DoesNotExist:
+            return None
+    
+    def get_horas_operacion(self, obj):
+        uso = self._uso(obj)
+        return uso.horas_operacion if uso else 0
+    
+    def get_ciclos_operacion(self, obj):
+        uso = self._uso(obj)
+        return uso.ciclos if uso else 0
 
 
 class ProductoSerializer(serializers.ModelSerializer):
@@ -411,7 +432,7 @@ class LoteListSerializer(serializers.ModelSerializer):
             'unidad', 'rendimiento_porcentaje', 'rendimiento',
             'fecha_planificada_inicio', 'fecha_real_inicio', 
             'fecha_planificada_fin', 'fecha_real_fin',
-            'fecha_creacion', 'supervisor', 'supervisor_nombre'
+            'fecha_creacion', 'supervisor', 'supervisor_nombre', 'version'
         ]
 
 
@@ -438,7 +459,8 @@ class LoteSerializer(serializers.ModelSerializer):
             'turno', 'turno_nombre', 'supervisor', 'supervisor_nombre',
             'observaciones', 'creado_por', 'creado_por_nombre',
             'fecha_creacion', 'rendimiento', 'visible',
-            'cancelado_por', 'cancelado_por_nombre', 'fecha_cancelacion', 'motivo_cancelacion'
+            'cancelado_por', 'cancelado_por_nombre', 'fecha_cancelacion', 'motivo_cancelacion',
+            'version'
         ]
         read_only_fields = ['id', 'fecha_creacion', 'creado_por', 'cancelado_por', 'fecha_cancelacion']
     
@@ -469,7 +491,7 @@ class LoteEtapaSerializer(serializers.ModelSerializer):
             'orden', 'maquina', 'maquina_nombre', 'estado', 'estado_display',
             'fecha_inicio', 'fecha_fin', 'duracion_minutos',
             'operario', 'operario_nombre', 'cantidad_entrada', 'cantidad_salida',
-            'cantidad_merma', 'porcentaje_rendimiento', 'observaciones'
+            'cantidad_merma', 'porcentaje_rendimiento', 'observaciones', 'version'
         ]
         read_only_fields = ['id', 'duracion_minutos', 'porcentaje_rendimiento']
 
@@ -506,10 +528,31 @@ class ControlCalidadSerializer(serializers.ModelSerializer):
 # INVENTARIO
 # ============================================
 
-class InsumoSerializer(serializers.ModelSerializer):
+class StockAFechaMixin:
+    """Agrega stock_a_fecha cuando el ViewSet lo anotó (consulta con ?as_of=)"""
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'stock_a_fecha'):
+            data['stock_a_fecha'] = instance.stock_a_fecha
+        return data
+
+
+class PronosticoMixin:
+    """Agrega el pronóstico publicado (cobertura y punto de reorden sugerido) cuando el ViewSet lo anotó"""
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for campo in CAMPOS_PUBLICADOS:
+            if hasattr(instance, campo):
+                data[campo] = getattr(instance, campo)
+        return data
+
+
+class InsumoSerializer(PronosticoMixin, StockAFechaMixin, serializers.ModelSerializer):
     """Serializer de insumos"""
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
-    stock_disponible = serializers.ReadOnlyField(source='stock_actual')
+    stock_disponible = serializers.SerializerMethodField()
     
     class Meta:
         model = Insumo
@@ -519,6 +562,11 @@ class InsumoSerializer(serializers.ModelSerializer):
             'stock_disponible', 'activo'
         ]
         read_only_fields = ['id']
+    
+    def get_stock_disponible(self, obj):
+        # InsumoViewSet anota el saldo aprobado; fuera del ViewSet se calcula desde los lotes
+        stock = getattr(obj, 'stock_aprobado', None)
+        return stock if stock is not None else obj.stock_actual
 
 
 class LoteInsumoSerializer(serializers.ModelSerializer):
@@ -540,7 +588,7 @@ class LoteInsumoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RepuestoSerializer(serializers.ModelSerializer):
+class RepuestoSerializer(PronosticoMixin, StockAFechaMixin, serializers.ModelSerializer):
     """Serializer de repuestos"""
     categoria_display = serializers.CharField(source='get_categoria_display', read_only=True)
     ubicacion_nombre = serializers.CharField(source='ubicacion.nombre', read_only=True)
@@ -573,6 +621,29 @@ class ProductoTerminadoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class ConteoFisicoSerializer(serializers.ModelSerializer):
+    """Serializer de conteos físicos"""
+    tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
+    estado_display = serializers.CharField(source='get_estado_display', read_only=True)
+    ubicacion_nombre = serializers.CharField(source='ubicacion.nombre', read_only=True, allow_null=True)
+    responsable_nombre = serializers.CharField(source='responsable.get_full_name', read_only=True)
+    total_lineas = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ConteoFisico
+        fields = [
+            'id', 'codigo', 'tipo', 'tipo_display', 'ubicacion', 'ubicacion_nombre',
+            'fecha_planificada', 'fecha_inicio', 'fecha_fin', 'estado', 'estado_display',
+            'responsable', 'responsable_nombre', 'observaciones', 'total_lineas'
+        ]
+        read_only_fields = ['id', 'fecha_inicio', 'fecha_fin', 'estado']
+    
+    def get_total_lineas(self, obj):
+        # ConteoFisicoViewSet anota la cantidad de líneas
+        total = getattr(obj, 'total_lineas', None)
+        return total if total is not None else obj.lineas.count()
+
+
 # ============================================
 # MANTENIMIENTO
 # ============================================
@@ -599,7 +670,7 @@ class OrdenTrabajoListSerializer(serializers.ModelSerializer):
             'id', 'codigo', 'maquina', 'maquina_nombre',
             'tipo', 'tipo_nombre', 'prioridad', 'prioridad_display',
             'estado', 'estado_display', 'titulo', 'fecha_creacion',
-            'fecha_planificada', 'asignada_a'
+            'fecha_planificada', 'asignada_a', 'version'
         ]
 
 
@@ -620,7 +691,7 @@ class OrdenTrabajoSerializer(serializers.ModelSerializer):
             'fecha_inicio', 'fecha_fin', 'duracion_real_horas',
             'creada_por', 'creada_por_nombre', 'asignada_a', 'completada_por',
             'trabajo_realizado', 'observaciones', 'requiere_parada_produccion',
-            'costo_estimado', 'costo_real'
+            'costo_estimado', 'costo_real', 'version'
         ]
         read_only_fields = ['id', 'fecha_creacion', 'duracion_real_horas', 'creada_por']
 
@@ -720,6 +791,35 @@ class MovimientoInventarioSerializer(serializers.ModelSerializer):
             'fecha_movimiento', 'registrado_por', 'registrado_por_nombre', 'observaciones'
         ]
         read_only_fields = ['id', 'fecha_movimiento', 'registrado_por']
+    
+    def validate(self, data):
+        """Solo un AJUSTE lleva signo: el resto de los movimientos exige cantidad positiva"""
+        tipo = data.get('tipo_movimiento', getattr(self.instance, 'tipo_movimiento', None))
+        cantidad = data.get('cantidad', getattr(self.instance, 'cantidad', None))
+        if cantidad is not None:
+            if tipo == 'AJUSTE' and cantidad == 0:
+                raise serializers.ValidationError({'cantidad': 'Un ajuste no puede ser de cantidad cero'})
+            if tipo != 'AJUSTE' and cantidad <= 0:
+                raise serializers.ValidationError({'cantidad': 'La cantidad debe ser mayor que cero'})
+        return data
+
+
+class AsignacionFEFOSerializer(serializers.Serializer):
+    """Solicitud de dispensado de un insumo con asignación FEFO de lotes"""
+    insumo = serializers.PrimaryKeyRelatedField(queryset=Insumo.objects.all())
+    cantidad = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    lote_produccion = serializers.PrimaryKeyRelatedField(queryset=Lote.objects.all())
+    lote_etapa = serializers.PrimaryKeyRelatedField(queryset=LoteEtapa.objects.all(), required=False, allow_null=True)
+    referencia_documento = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
+    def validate(self, data):
+        """La etapa, si se indica, debe pertenecer al lote de producción"""
+        lote_etapa = data.get('lote_etapa')
+        if lote_etapa and lote_etapa.lote_id != data['lote_produccion'].id:
+            raise serializers.ValidationError({
+                'lote_etapa': 'La etapa no pertenece al lote de producción indicado'
+            })
+        return data
 
 
 # ============================================
@@ -6,56 +6,34 @@ Sistema de trazabilidad completa de cambios en SIPROSA MES
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from threading import local
 from .models import (
     Lote, LogAuditoria, UserProfile, Notificacion, 
-    LoteEtapa, Incidente, OrdenTrabajo
+    LoteEtapa, Parada, Incidente, OrdenTrabajo, LoteInsumo, LoteInsumoConsumo
 )
+from .kpis import ESTADOS_OEE, actualizar_resumen_claves, fecha_local, invalidar_dashboard
+from .mantenimiento import sumar_uso_maquina
+from .inventario import aporte_lote, ajustar_saldo
+from .trazabilidad import acumular_genealogia
+from .rastreo import cambios_legibles
+from .estados import transicion_realizada
 import json
 
 
-# Variable por hilo para almacenar el estado anterior del objeto antes de modificarlo
-_lote_thread_state = local()
-
-def _get_lote_state_storage():
-    """Obtiene el contenedor por hilo para el estado previo de los lotes."""
-    if not hasattr(_lote_thread_state, "data"):
-        _lote_thread_state.data = {}
-    return _lote_thread_state.data
-
-
 @receiver(pre_save, sender=Lote)
 def lote_pre_save(sender, instance, **kwargs):
     """
-    Captura el estado ANTES de guardar para comparar cambios
+    Captura los cambios ANTES de guardar, comparando con los valores originales de la
+    instancia (sin volver a leer el lote; las FK se comparan por id)
     """
+    instance._resumen_previo = None
     if instance.pk:  # Solo si ya existe (edicion)
-        storage = _get_lote_state_storage()
-        try:
-            anterior = Lote.objects.get(pk=instance.pk)
-            storage[instance.pk] = {
-                'codigo_lote': anterior.codigo_lote,
-                'producto': anterior.producto.nombre if anterior.producto else None,
-                'formula': str(anterior.formula) if anterior.formula else None,
-                'cantidad_planificada': anterior.cantidad_planificada,
-                'cantidad_producida': anterior.cantidad_producida,
-                'cantidad_rechazada': anterior.cantidad_rechazada,
-                'unidad': anterior.unidad,
-                'estado': anterior.estado,
-                'prioridad': anterior.prioridad,
-                'fecha_planificada_inicio': anterior.fecha_planificada_inicio.isoformat() if anterior.fecha_planificada_inicio else None,
-                'fecha_real_inicio': anterior.fecha_real_inicio.isoformat() if anterior.fecha_real_inicio else None,
-                'fecha_planificada_fin': anterior.fecha_planificada_fin.isoformat() if anterior.fecha_planificada_fin else None,
-                'fecha_real_fin': anterior.fecha_real_fin.isoformat() if anterior.fecha_real_fin else None,
-                'turno': anterior.turno.nombre if anterior.turno else None,
-                'supervisor': anterior.supervisor.username if anterior.supervisor else None,
-                'observaciones': anterior.observaciones,
-                'cancelado_por': anterior.cancelado_por.username if anterior.cancelado_por else None,
-                'fecha_cancelacion': anterior.fecha_cancelacion.isoformat() if anterior.fecha_cancelacion else None,
-                'motivo_cancelacion': anterior.motivo_cancelacion,
-            }
-        except Lote.DoesNotExist:
-            pass
+        instance._cambios_auditoria = instance.campos_modificados()
+        originales = instance.valores_originales()
+        # Grupo previo del rollup de KPIs (día, estado, turno, producto), por si cambia
+        campos = ('fecha_real_inicio', 'estado', 'turno_id', 'producto_id')
+        if set(campos) <= originales.keys():
+            instance._resumen_previo = tuple(originales[campo] for campo in campos)
+        instance._resumen_modificado = bool(CAMPOS_RESUMEN_LOTE & instance._cambios_auditoria.keys())
 
 
 @receiver(post_save, sender=Lote)
@@ -94,63 +72,32 @@ def lote_post_save(sender, instance, created, **kwargs):
         )
     else:
         # MODIFICACIÓN de lote existente
-        estado_anterior = _get_lote_state_storage().get(instance.pk, {})
-        if estado_anterior:
-            cambios = {}
-            
-            # Comparar cada campo
-            estado_actual = {
-                'codigo_lote': instance.codigo_lote,
-                'producto': instance.producto.nombre if instance.producto else None,
-                'formula': str(instance.formula) if instance.formula else None,
-                'cantidad_planificada': instance.cantidad_planificada,
-                'cantidad_producida': instance.cantidad_producida,
-                'cantidad_rechazada': instance.cantidad_rechazada,
-                'unidad': instance.unidad,
-                'estado': instance.estado,
-                'prioridad': instance.prioridad,
-                'fecha_planificada_inicio': instance.fecha_planificada_inicio.isoformat() if instance.fecha_planificada_inicio else None,
-                'fecha_real_inicio': instance.fecha_real_inicio.isoformat() if instance.fecha_real_inicio else None,
-                'fecha_planificada_fin': instance.fecha_planificada_fin.isoformat() if instance.fecha_planificada_fin else None,
-                'fecha_real_fin': instance.fecha_real_fin.isoformat() if instance.fecha_real_fin else None,
-                'turno': instance.turno.nombre if instance.turno else None,
-                'supervisor': instance.supervisor.username if instance.supervisor else None,
-                'observaciones': instance.observaciones,
-                'cancelado_por': instance.cancelado_por.username if instance.cancelado_por else None,
-                'fecha_cancelacion': instance.fecha_cancelacion.isoformat() if instance.fecha_cancelacion else None,
-                'motivo_cancelacion': instance.motivo_cancelacion,
-            }
-            
-            # Detectar cambios
-            for campo, valor_nuevo in estado_actual.items():
-                valor_anterior = estado_anterior.get(campo)
-                if valor_anterior != valor_nuevo:
-                    cambios[campo] = {
-                        'antes': valor_anterior,
-                        'despues': valor_nuevo
-                    }
-            
-            # Si hubo cambios, registrar en auditoría
-            if cambios:
-                # Determinar si fue una CANCELACIÓN
-                accion = 'MODIFICAR'
-                if 'estado' in cambios and cambios['estado']['despues'] == 'CANCELADO':
-                    accion = 'CANCELAR'
-                    usuario = instance.cancelado_por or usuario
-                
-                LogAuditoria.objects.create(
-                    usuario=usuario,
-                    accion=accion,
-                    modelo='Lote',
-                    objeto_id=instance.pk,
-                    objeto_str=str(instance),
-                    cambios=cambios,
-                    ip_address=getattr(instance, '_ip_address', None),
-                    user_agent=getattr(instance, '_user_agent', ''),
-                )
-            
-            # Limpiar el estado anterior
-            _get_lote_state_storage().pop(instance.pk, None)
+        cambios = getattr(instance, '_cambios_auditoria', None)
+        instance._cambios_auditoria = None
+        if cambios:
+            _auditar_modificacion_lote(instance, cambios, usuario)
+
+
+def _auditar_modificacion_lote(instance, cambios, usuario):
+    """LogAuditoria de una modificación; solo se resuelven los nombres de las FK que cambiaron"""
+    cambios = cambios_legibles(instance, cambios)
+    
+    # Determinar si fue una CANCELACIÓN
+    accion = 'MODIFICAR'
+    if 'estado' in cambios and cambios['estado']['despues'] == 'CANCELADO':
+        accion = 'CANCELAR'
+        usuario = instance.cancelado_por or usuario
+    
+    LogAuditoria.objects.create(
+        usuario=usuario,
+        accion=accion,
+        modelo='Lote',
+        objeto_id=instance.pk,
+        objeto_str=str(instance),
+        cambios=cambios,
+        ip_address=getattr(instance, '_ip_address', None),
+        user_agent=getattr(instance, '_user_agent', ''),
+    )
 
 
 @receiver(post_delete, sender=Lote)
@@ -256,6 +203,12 @@ def notificar_incidente_critico(sender, instance, created, **kwargs):
         )
 
 
+@receiver(pre_save, sender=OrdenTrabajo)
+def orden_trabajo_pre_save(sender, instance, **kwargs):
+    """Detecta la reasignación comparando con el técnico original de la instancia"""
+    instance._reasignada = 'asignada_a' in instance.campos_modificados()
+
+
 @receiver(post_save, sender=OrdenTrabajo)
 def notificar_orden_trabajo_urgente(sender, instance, created, **kwargs):
     """Notificar cuando se crea una OT urgente"""
@@ -275,20 +228,292 @@ def notificar_orden_trabajo_urgente(sender, instance, created, **kwargs):
             referencia_id=instance.id
         )
     
-    # Notificar al técnico asignado
-    if not created and instance.asignada_a:
-        # Verificar si cambió la asignación
-        try:
-            anterior = OrdenTrabajo.objects.get(pk=instance.pk)
-            if anterior.asignada_a != instance.asignada_a:
-                _crear_notificacion(
-                    usuarios=instance.asignada_a,
-                    tipo='INFO',
-                    titulo=f'OT asignada: {instance.codigo}',
-                    mensaje=f'Se te ha asignado la orden de trabajo: {instance.titulo}',
-                    referencia_modelo='OrdenTrabajo',
-                    referencia_id=instance.id
-                )
-        except OrdenTrabajo.DoesNotExist:
-            pass
+    # Notificar al técnico asignado si cambió la asignación
+    if not created and instance.asignada_a and getattr(instance, '_reasignada', False):
+        _crear_notificacion(
+            usuarios=instance.asignada_a,
+            tipo='INFO',
+            titulo=f'OT asignada: {instance.codigo}',
+            mensaje=f'Se te ha asignado la orden de trabajo: {instance.titulo}',
+            referencia_modelo='OrdenTrabajo',
+            referencia_id=instance.id
+        )
+
+
+# ============================================
+# SEÑALES PARA ROLLUP DE KPIs (ResumenProduccionDiario)
+# ============================================
+
+# Campos del lote que entran en el rollup (otros cambios no lo tocan)
+CAMPOS_RESUMEN_LOTE = {
+    'estado', 'turno', 'producto', 'fecha_real_inicio', 'fecha_real_fin', 'fecha_planificada_inicio',
+    'fecha_planificada_fin', 'cantidad_planificada', 'cantidad_producida', 'cantidad_rechazada',
+}
+
+
+def _claves_resumen(grupos, maquinas):
+    """
+    Claves del rollup (fecha, turno_id, maquina_id, producto_id) de los grupos de lote
+    (fecha_real_inicio, estado, turno_id, producto_id) que cuentan para OEE, una por máquina
+    """
+    return {
+        (fecha_local(fecha), turno_id, maquina_id, producto_id)
+        for fecha, estado, turno_id, producto_id in grupos
+        if fecha is not None and estado in ESTADOS_OEE
+        for maquina_id in maquinas
+    }
+
+
+def _actualizar_resumen_lotes(grupos, lote_ids, maquinas=()):
+    """
+    Recalcula las claves del rollup de los lotes: sus grupos con cada máquina de sus
+    etapas (la última recibe las cantidades, todas pueden tener paradas), las
+    `maquinas` adicionales (la previa de una etapa modificada) y sin máquina (lote
+    sin etapas).
+    """
+    grupos = [grupo for grupo in grupos if grupo and grupo[0] is not None and grupo[1] in ESTADOS_OEE]
+    if not grupos:
+        return
+    maquinas = set(maquinas) | {None} | set(
+        LoteEtapa.objects.filter(lote_id__in=lote_ids).values_list('maquina_id', flat=True)
+    )
+    actualizar_resumen_claves(_claves_resumen(grupos, maquinas))
+
+
+@receiver(post_save, sender=Lote)
+@receiver(post_delete, sender=Lote)
+def actualizar_resumen_lote(sender, instance, created=False, **kwargs):
+    """Recalcula las claves del rollup del lote (grupo actual y previo)"""
+    if kwargs.get('signal') is post_save and not created and not getattr(instance, '_resumen_modificado', True):
+        return
+    grupos = [
+        (instance.fecha_real_inicio, instance.estado, instance.turno_id, instance.producto_id),
+        getattr(instance, '_resumen_previo', None),
+    ]
+    _actualizar_resumen_lotes(grupos, [instance.pk])
+
+
+@receiver(pre_save, sender=LoteEtapa)
+def lote_etapa_resumen_pre_save(sender, instance, **kwargs):
+    """Lote y máquina previos de la etapa (las claves del rollup que dejan de recibirla)"""
+    instance._resumen_previo = None
+    instance._resumen_modificado = True
+    if instance.pk:
+        originales = instance.valores_originales()
+        instance._resumen_previo = (originales.get('lote_id'), originales.get('maquina_id'))
+        # El estado, las fechas y cantidades de la etapa no entran en el rollup
+        instance._resumen_modificado = bool({'lote', 'maquina', 'orden'} & instance.campos_modificados().keys())
+
+
+@receiver(post_save, sender=LoteEtapa)
+@receiver(post_delete, sender=LoteEtapa)
+def actualizar_resumen_lote_etapa(sender, instance, created=False, **kwargs):
+    """Las etapas definen la máquina a la que se asigna el lote en el rollup"""
+    if kwargs.get('signal') is post_save and not created and not getattr(instance, '_resumen_modificado', True):
+        return
+    lote_ids = {instance.lote_id}
+    maquinas = {instance.maquina_id}
+    previo = getattr(instance, '_resumen_previo', None)
+    if previo:
+        lote_ids.add(previo[0])
+        maquinas.add(previo[1])
+    lote_ids.discard(None)
+    grupos = Lote.objects.filter(pk__in=lote_ids).values_list('fecha_real_inicio', 'estado', 'turno_id', 'producto_id')
+    _actualizar_resumen_lotes(list(grupos), lote_ids, maquinas)
+
+
+@receiver(pre_save, sender=Parada)
+def parada_resumen_pre_save(sender, instance, **kwargs):
+    """Etapa previa de la parada (si se la cambia, su clave del rollup pierde los minutos)"""
+    instance._resumen_previo = None
+    if instance.pk:
+        instance._resumen_previo = instance.valores_originales().get('lote_etapa_id')
+
+
+@receiver(post_save, sender=Parada)
+@receiver(post_delete, sender=Parada)
+def actualizar_resumen_parada(sender, instance, **kwargs):
+    """Las paradas suman minutos de parada en la clave de la máquina de su etapa"""
+    etapa_ids = {instance.lote_etapa_id, getattr(instance, '_resumen_previo', None)} - {None}
+    claves = set()
+    for maquina_id, *grupo in LoteEtapa.objects.filter(pk__in=etapa_ids).values_list(
+        'maquina_id', 'lote__fecha_real_inicio', 'lote__estado', 'lote__turno_id', 'lote__producto_id'
+    ):
+        claves |= _claves_resumen([grupo], [maquina_id])
+    actualizar_resumen_claves(claves)
+
+
+# ============================================
+# SEÑALES PARA INVALIDAR EL SNAPSHOT DEL DASHBOARD
+# ============================================
+
+@receiver(post_save, sender=Lote)
+@receiver(post_delete, sender=Lote)
+@receiver(post_save, sender=Parada)
+@receiver(post_delete, sender=Parada)
+@receiver(post_save, sender=Incidente)
+@receiver(post_delete, sender=Incidente)
+@receiver(post_save, sender=OrdenTrabajo)
+@receiver(post_delete, sender=OrdenTrabajo)
+def invalidar_snapshot_dashboard(sender, instance, **kwargs):
+    """Cualquier cambio en estos modelos deja obsoleto el dashboard en caché"""
+    invalidar_dashboard()
+
+
+# ============================================
+# SEÑALES PARA CONTADOR DE USO DE MÁQUINAS
+# ============================================
+
+def _uso_etapa(maquina_id, estado, duracion_minutos):
+    """Aporte (máquina, minutos, ciclos) de una etapa al contador de uso"""
+    if estado != 'COMPLETADO' or not maquina_id:
+        return maquina_id, 0, 0
+    return maquina_id, duracion_minutos or 0, 1
+
+
+@receiver(pre_save, sender=LoteEtapa)
+def lote_etapa_pre_save(sender, instance, **kwargs):
+    """
+    Captura el aporte previo de la etapa al contador de uso de su máquina, desde los
+    valores originales de la instancia (sin volver a leer la etapa)
+    """
+    instance._uso_previo = None
+    if instance.pk:
+        originales = instance.valores_originales()
+        if {'maquina_id', 'estado', 'duracion_minutos'} <= originales.keys():
+            instance._uso_previo = _uso_etapa(
+                originales['maquina_id'], originales['estado'], originales['duracion_minutos']
+            )
+
+
+@receiver(post_save, sender=LoteEtapa)
+def actualizar_uso_maquina(sender, instance, **kwargs):
+    """Suma al contador de la máquina la diferencia de uso de la etapa"""
+    maquina_id, minutos, ciclos = _uso_etapa(instance.maquina_id, instance.estado, instance.duracion_minutos)
+    previo = getattr(instance, '_uso_previo', None)
+    if previo:
+        if previo[0] == maquina_id:
+            minutos -= previo[1]
+            ciclos -= previo[2]
+        else:
+            sumar_uso_maquina(previo[0], -previo[1], -previo[2])
+    sumar_uso_maquina(maquina_id, minutos, ciclos)
+
+
+@receiver(post_delete, sender=LoteEtapa)
+def descontar_uso_maquina(sender, instance, **kwargs):
+    """Una etapa completada eliminada descuenta su uso del contador"""
+    maquina_id, minutos, ciclos = _uso_etapa(instance.maquina_id, instance.estado, instance.duracion_minutos)
+    sumar_uso_maquina(maquina_id, -minutos, -ciclos)
+
+
+# ============================================
+# SEÑALES PARA SALDOS DE INSUMOS (SaldoInsumo)
+# ============================================
+
+@receiver(pre_save, sender=LoteInsumo)
+def lote_insumo_pre_save(sender, instance, **kwargs):
+    """Captura el aporte previo del lote a los saldos (valores originales de la instancia)"""
+    instance._saldo_previo = None
+    if instance.pk:
+        originales = instance.valores_originales()
+        campos = ('insumo_id', 'ubicacion_id', 'estado', 'cantidad_actual')
+        if set(campos) <= originales.keys():
+            instance._saldo_previo = aporte_lote(**{campo: originales[campo] for campo in campos})
+
+
+@receiver(post_save, sender=LoteInsumo)
+def actualizar_saldo_insumo(sender, instance, **kwargs):
+    """Aplica al saldo la diferencia entre el aporte previo y el actual del lote"""
+    clave, cantidad, lotes = aporte_lote(
+        instance.insumo_id, instance.ubicacion_id, instance.estado, instance.cantidad_actual
+    )
+    previo = getattr(instance, '_saldo_previo', None)
+    if previo:
+        if previo[0] == clave:
+            cantidad -= previo[1]
+            lotes -= previo[2]
+        else:
+            ajustar_saldo(previo[0], -previo[1], -previo[2])
+    ajustar_saldo(clave, cantidad, lotes)
+
+
+@receiver(post_delete, sender=LoteInsumo)
+def descontar_saldo_insumo(sender, instance, **kwargs):
+    """Un lote eliminado descuenta su aporte del saldo"""
+    clave, cantidad, lotes = aporte_lote(
+        instance.insumo_id, instance.ubicacion_id, instance.estado, instance.cantidad_actual
+    )
+    ajustar_saldo(clave, -cantidad, -lotes)
+
+
+# ============================================
+# SEÑALES PARA GENEALOGÍA DE LOTES (GenealogiaLote)
+# ============================================
+
+@receiver(pre_save, sender=LoteInsumoConsumo)
+def consumo_insumo_pre_save(sender, instance, **kwargs):
+    """Captura el par y la cantidad previos del consumo (valores originales de la instancia)"""
+    instance._genealogia_previa = None
+    if instance.pk:
+        originales = instance.valores_originales()
+        campos = ('lote_insumo_id', 'lote_produccion_id', 'cantidad_real')
+        if set(campos) <= originales.keys():
+            instance._genealogia_previa = tuple(originales[campo] for campo in campos)
+
+
+@receiver(post_save, sender=LoteInsumoConsumo)
+def actualizar_genealogia(sender, instance, **kwargs):
+    """Aplica a la genealogía la diferencia entre el consumo previo y el actual"""
+    deltas = {
+        (instance.lote_insumo_id, instance.lote_produccion_id): (instance.cantidad_real, 1, instance.fecha_consumo)
+    }
+    previo = getattr(instance, '_genealogia_previa', None)
+    if previo:
+        clave = previo[:2]
+        cantidad, consumos, fecha = deltas.get(clave, (0, 0, None))
+        deltas[clave] = (cantidad - previo[2], consumos - 1, fecha)
+    # acumular_genealogia bloquea las filas del par (select_for_update) en su propia transacción
+    acumular_genealogia(deltas)
+
+
+@receiver(post_delete, sender=LoteInsumoConsumo)
+def descontar_genealogia(sender, instance, **kwargs):
+    """Un consumo eliminado descuenta su cantidad de la genealogía"""
+    acumular_genealogia({(instance.lote_insumo_id, instance.lote_produccion_id): (-instance.cantidad_real, -1, None)})
+
+
+# ============================================
+# EFECTOS DE TRANSICIONES DE ESTADO
+# ============================================
+# Las transiciones (core.estados) son un UPDATE condicional que no pasa por save():
+# estos receptores aplican los mismos efectos que las señales de post_save, con el
+# estado previo tomado de los cambios de la transición.
+
+@receiver(transicion_realizada, sender=Lote)
+def efectos_transicion_lote(sender, instance, cambios, **kwargs):
+    """Auditoría, rollup diario y dashboard tras una transición de un lote"""
+    usuario = getattr(instance, '_usuario_actual', None) or instance.creado_por
+    _auditar_modificacion_lote(instance, cambios, usuario)
+    fecha_previa = cambios.get('fecha_real_inicio', (instance.fecha_real_inicio,))[0]
+    instance._resumen_previo = (fecha_previa, cambios['estado'][0], instance.turno_id, instance.producto_id)
+    actualizar_resumen_lote(sender, instance)
+    invalidar_dashboard()
+
+
+@receiver(transicion_realizada, sender=LoteEtapa)
+def efectos_transicion_lote_etapa(sender, instance, cambios, **kwargs):
+    """Contador de uso de la máquina y aviso de pausa tras una transición de etapa"""
+    duracion_previa = cambios.get('duracion_minutos', (instance.duracion_minutos,))[0]
+    instance._uso_previo = _uso_etapa(instance.maquina_id, cambios['estado'][0], duracion_previa)
+    actualizar_uso_maquina(sender, instance)
+    # El rollup no depende del estado de la etapa: la transición no lo toca
+    notificar_pausa_etapa(sender, instance, created=False)
+
 
+@receiver(transicion_realizada, sender=OrdenTrabajo)
+def efectos_transicion_orden_trabajo(sender, instance, cambios, **kwargs):
+    """Aviso de asignación y dashboard tras una transición de una OT"""
+    instance._reasignada = 'asignada_a' in cambios
+    notificar_orden_trabajo_urgente(sender, instance, created=False)
+    invalidar_dashboard()
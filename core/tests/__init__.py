@@ -0,0 +1,7 @@
+"""
+Tests de SIPROSA MES
+Uso: python manage.py test core
+
+Un módulo por área (planes de consulta, rollup de KPIs, inventario, concurrencia...);
+cada clase crea en setUpTestData solo los datos que usa.
+"""
@@ -0,0 +1,95 @@
+"""
+Control de concurrencia optimista en la API: la versión del lote viaja como ETag y una
+escritura sobre una versión vieja responde 412 (con If-Match) o 409 (sin If-Match)
+"""
+
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Producto, Formula, Turno, Lote
+
+
+class ControlVersionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        producto = Producto.objects.create(
+            codigo='PARA-500', nombre='Paracetamol 500', forma_farmaceutica='COMPRIMIDO',
+            principio_activo='Paracetamol', concentracion='500 mg', unidad_medida='comprimidos',
+            lote_minimo=1000, lote_optimo=5000, tiempo_vida_util_meses=24,
+        )
+        formula = Formula.objects.create(
+            producto=producto, version='1', fecha_vigencia_desde=date(2024, 1, 1),
+            rendimiento_teorico=95, tiempo_estimado_horas=8, aprobada_por=cls.usuario, fecha_aprobacion=date(2024, 1, 1),
+        )
+        turno = Turno.objects.create(codigo='M', nombre='Mañana', hora_inicio=time(6), hora_fin=time(14))
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(8)))
+        cls.lote = Lote.objects.create(
+            codigo_lote='LV-001', producto=producto, formula=formula, cantidad_planificada=5000,
+            unidad='comprimidos', estado='PLANIFICADO',
+            fecha_planificada_inicio=inicio, fecha_planificada_fin=inicio + timedelta(hours=8),
+            turno=turno, supervisor=cls.usuario, creado_por=cls.usuario,
+        )
+        cls.url = f'/api/lotes/{cls.lote.pk}/'
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def test_detalle_informa_la_version_como_etag(self):
+        respuesta = self.cliente.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['ETag'], f'"{self.lote.version}"')
+
+    def test_if_match_vigente_guarda_y_devuelve_nuevo_etag(self):
+        respuesta = self.cliente.patch(
+            self.url, {'observaciones': 'Ajuste'}, format='json', HTTP_IF_MATCH=f'"{self.lote.version}"'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['ETag'], f'"{self.lote.version + 1}"')
+
+    def test_if_match_desactualizado_responde_412(self):
+        etag = self.cliente.get(self.url)['ETag']
+        # Otro usuario guarda después de la lectura
+        otro = Lote.objects.get(pk=self.lote.pk)
+        otro.observaciones = 'Cambio de otro usuario'
+        otro.save()
+
+        respuesta = self.cliente.patch(self.url, {'observaciones': 'Mío'}, format='json', HTTP_IF_MATCH=etag)
+
+        self.assertEqual(respuesta.status_code, 412)
+        self.assertEqual(respuesta.data['version_actual'], otro.version)
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.observaciones, 'Cambio de otro usuario')
+
+    def test_etag_debil_no_coincide(self):
+        respuesta = self.cliente.patch(
+            self.url, {'observaciones': 'Mío'}, format='json', HTTP_IF_MATCH=f'W/"{self.lote.version}"'
+        )
+        self.assertEqual(respuesta.status_code, 412)
+
+    def _patch_con_escritura_concurrente(self, **encabezados):
+        guardar = Lote.save
+
+        def guardar_despues_de_otro(instancia, *args, **kwargs):
+            # Otro usuario guarda entre la lectura de la vista y su UPDATE
+            Lote.objects.filter(pk=instancia.pk).update(version=instancia.version + 1)
+            return guardar(instancia, *args, **kwargs)
+
+        with mock.patch.object(Lote, 'save', guardar_despues_de_otro):
+            return self.cliente.patch(self.url, {'observaciones': 'Mío'}, format='json', **encabezados)
+
+    def test_escritura_concurrente_con_if_match_responde_412(self):
+        respuesta = self._patch_con_escritura_concurrente(HTTP_IF_MATCH=f'"{self.lote.version}"')
+        self.assertEqual(respuesta.status_code, 412)
+        self.assertEqual(respuesta.data['version_actual'], self.lote.version + 1)
+
+    def test_escritura_concurrente_sin_if_match_responde_409(self):
+        respuesta = self._patch_con_escritura_concurrente()
+        self.assertEqual(respuesta.status_code, 409)
@@ -0,0 +1,94 @@
+"""
+Carga masiva de líneas de conteo físico: cada fila se valida por separado y una sola
+fila inválida rechaza la carga completa con el detalle por línea
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.conteos import _leer_linea
+from core.models import Ubicacion, CategoriaInsumo, Insumo, LoteInsumo, ConteoFisico
+
+
+class LineasConteoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        almacen = Ubicacion.objects.create(codigo='ALM', nombre='Almacén', tipo='ALMACEN')
+        categoria = CategoriaInsumo.objects.create(codigo='MP', nombre='Materia prima')
+        cls.insumo = Insumo.objects.create(
+            codigo='ALM-01', nombre='Almidón', categoria=categoria, unidad_medida='kg',
+            stock_minimo=10, stock_maximo=1000, punto_reorden=50, tiempo_vida_util_meses=12,
+        )
+        hoy = timezone.localdate()
+        cls.lote_insumo = LoteInsumo.objects.create(
+            insumo=cls.insumo, codigo_lote_proveedor='CT-001', fecha_recepcion=hoy - timedelta(days=30),
+            fecha_vencimiento=hoy + timedelta(days=60), cantidad_inicial=40, cantidad_actual=40, unidad='kg',
+            ubicacion=almacen, proveedor='Proveedor SA', estado='APROBADO',
+        )
+        cls.conteo = ConteoFisico.objects.create(
+            codigo='CF-001', tipo='TOTAL', fecha_planificada=hoy, estado='EN_PROCESO', responsable=cls.usuario,
+        )
+        cls.url = f'/api/conteos-fisicos/{cls.conteo.pk}/lineas/'
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def test_lee_lineas_validas(self):
+        linea = _leer_linea({'tipo_item': ' insumo ', 'lote_item_id': '7', 'cantidad': '12,5', 'posicion': 'A-3'})
+        self.assertEqual(linea, {
+            'tipo_item': 'INSUMO', 'item_id': None, 'lote_item_id': 7, 'posicion': 'A-3',
+            'cantidad_contada': Decimal('12.5'),
+        })
+        linea = _leer_linea({'tipo_item': 'REPUESTO', 'item_id': '3', 'cantidad': '2'})
+        self.assertEqual((linea['item_id'], linea['lote_item_id']), (3, None))
+
+    def test_rechaza_lineas_invalidas(self):
+        invalidas = [
+            ['no es un objeto'],
+            {'tipo_item': 'PRODUCTO', 'lote_item_id': '1', 'cantidad': '1'},
+            {'tipo_item': 'INSUMO', 'cantidad': '1'},
+            {'tipo_item': 'INSUMO', 'lote_item_id': 'x', 'cantidad': '1'},
+            {'tipo_item': 'REPUESTO', 'item_id': '1', 'cantidad': '1.5'},
+        ] + [
+            {'tipo_item': 'INSUMO', 'lote_item_id': '1', 'cantidad': cantidad}
+            for cantidad in ('', 'abc', '-1', '1.234', 'NaN', 'sNaN', 'Infinity', '-Infinity', '1e400', '1e11')
+        ]
+        for fila in invalidas:
+            with self.subTest(fila=fila):
+                with self.assertRaises(ValueError):
+                    _leer_linea(fila)
+
+    def test_carga_json_con_errores_por_linea(self):
+        respuesta = self.cliente.post(self.url, [
+            {'tipo_item': 'INSUMO', 'lote_item_id': self.lote_insumo.id, 'cantidad': '38'},
+            'texto',
+            {'tipo_item': 'INSUMO', 'lote_item_id': self.lote_insumo.id, 'cantidad': 'NaN'},
+        ], format='json')
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([error['linea'] for error in respuesta.data['errores']], [2, 3])
+        self.assertFalse(self.conteo.lineas.exists())
+
+    def test_carga_csv(self):
+        archivo = SimpleUploadedFile(
+            'conteo.csv', f'tipo_item;lote_item_id;cantidad\nINSUMO;{self.lote_insumo.id};38,50\n'.encode()
+        )
+        respuesta = self.cliente.post(self.url, {'archivo': archivo}, format='multipart')
+
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        linea = self.conteo.lineas.get()
+        self.assertEqual((linea.item_id, linea.cantidad_contada), (self.insumo.id, Decimal('38.50')))
+
+    def test_csv_que_no_es_utf8_responde_400(self):
+        archivo = SimpleUploadedFile('conteo.csv', b'tipo_item,lote_item_id,cantidad\nINSUMO,1,\xff\xfe\n')
+        respuesta = self.cliente.post(self.url, {'archivo': archivo}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
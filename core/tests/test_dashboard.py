@@ -0,0 +1,65 @@
+"""
+Snapshot del dashboard en caché: se sirve sin consultas y se invalida recién cuando
+se confirma la transacción del cambio
+"""
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from core import kpis
+from core.kpis import obtener_dashboard
+from core.models import Ubicacion, TipoIncidente, Incidente
+
+
+class SnapshotDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operario', 'operario@siprosa.test', 'clave-segura')
+        cls.ubicacion = Ubicacion.objects.create(codigo='PROD', nombre='Producción', tipo='PRODUCCION')
+        cls.tipo = TipoIncidente.objects.create(codigo='SEG', nombre='Seguridad')
+
+    def setUp(self):
+        cache.clear()
+
+    def _incidente(self, codigo):
+        return Incidente.objects.create(
+            codigo=codigo, tipo=self.tipo, severidad='CRITICA', titulo='Derrame', descripcion='Derrame de solvente',
+            fecha_ocurrencia=timezone.now(), ubicacion=self.ubicacion, reportado_por=self.usuario,
+        )
+
+    def test_segunda_lectura_sale_de_la_cache(self):
+        primero = obtener_dashboard()
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_dashboard(), primero)
+
+    def test_invalidacion_al_confirmar_la_transaccion(self):
+        obtener_dashboard()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._incidente('INC-001')
+            # Antes del commit el snapshot sigue vigente: un lector no ve el cambio a medias
+            with self.assertNumQueries(0):
+                self.assertEqual(obtener_dashboard()['incidentes']['criticos'], 0)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(obtener_dashboard()['incidentes']['criticos'], 1)
+
+    def test_snapshot_calculado_antes_de_una_invalidacion_no_se_sirve(self):
+        calcular = kpis.calcular_dashboard
+
+        def calcular_y_confirmar_otro_cambio():
+            snapshot = calcular()
+            # Otro worker confirma un incidente mientras este calculaba
+            with self.captureOnCommitCallbacks(execute=True):
+                self._incidente('INC-002')
+            return snapshot
+
+        with mock.patch.object(kpis, 'calcular_dashboard', calcular_y_confirmar_otro_cambio):
+            self.assertEqual(obtener_dashboard()['incidentes']['criticos'], 0)
+
+        self.assertEqual(obtener_dashboard()['incidentes']['criticos'], 1)
@@ -0,0 +1,86 @@
+"""
+Transiciones de estado con UPDATE condicional: dos transiciones sobre la misma lectura
+no pueden aplicarse las dos, y la transición cuenta como modificación de la fila
+"""
+
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.estados import transicionar
+from core.models import Producto, Formula, Turno, Lote, LogAuditoria
+
+
+class TransicionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        producto = Producto.objects.create(
+            codigo='PARA-500', nombre='Paracetamol 500', forma_farmaceutica='COMPRIMIDO',
+            principio_activo='Paracetamol', concentracion='500 mg', unidad_medida='comprimidos',
+            lote_minimo=1000, lote_optimo=5000, tiempo_vida_util_meses=24,
+        )
+        formula = Formula.objects.create(
+            producto=producto, version='1', fecha_vigencia_desde=date(2024, 1, 1),
+            rendimiento_teorico=95, tiempo_estimado_horas=8, aprobada_por=cls.usuario, fecha_aprobacion=date(2024, 1, 1),
+        )
+        turno = Turno.objects.create(codigo='M', nombre='Mañana', hora_inicio=time(6), hora_fin=time(14))
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=1), time(8)))
+        cls.lote = Lote.objects.create(
+            codigo_lote='LT-001', producto=producto, formula=formula, cantidad_planificada=5000,
+            cantidad_producida=4900, cantidad_rechazada=50, unidad='comprimidos', estado='FINALIZADO',
+            fecha_planificada_inicio=inicio, fecha_planificada_fin=inicio + timedelta(hours=8),
+            fecha_real_inicio=inicio, fecha_real_fin=inicio + timedelta(hours=9),
+            turno=turno, supervisor=cls.usuario, creado_por=cls.usuario,
+        )
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def test_segunda_transicion_sobre_lectura_vieja_no_se_aplica(self):
+        primero = Lote.objects.get(pk=self.lote.pk)
+        segundo = Lote.objects.get(pk=self.lote.pk)
+
+        self.assertTrue(transicionar(primero, 'liberar'))
+        self.assertFalse(transicionar(segundo, 'rechazar'))
+
+        self.assertEqual(segundo.estado, 'FINALIZADO')  # la instancia queda como estaba
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.estado, 'LIBERADO')
+        self.assertEqual(self.lote.version, primero.version)
+
+    def test_transicion_actualiza_fecha_de_modificacion(self):
+        anterior = self.lote.fecha_modificacion
+        lote = Lote.objects.get(pk=self.lote.pk)
+
+        self.assertTrue(transicionar(lote, 'liberar'))
+
+        self.assertGreater(lote.fecha_modificacion, anterior)
+        self.assertEqual(Lote.objects.get(pk=lote.pk).fecha_modificacion, lote.fecha_modificacion)
+        # La fecha de modificación no es un cambio auditado
+        auditoria = LogAuditoria.objects.filter(modelo='Lote', objeto_id=lote.pk, accion='MODIFICAR').latest('fecha')
+        self.assertEqual(set(auditoria.cambios), {'estado'})
+
+    def test_endpoint_responde_409_si_otro_usuario_cambio_el_estado(self):
+        def rechazar_antes(instancia, nombre, **valores):
+            # Otro usuario rechaza el lote entre la lectura de la vista y su UPDATE
+            transicionar(Lote.objects.get(pk=instancia.pk), 'rechazar')
+            return transicionar(instancia, nombre, **valores)
+
+        with mock.patch('core.views.transicionar', side_effect=rechazar_antes):
+            respuesta = self.cliente.post(
+                f'/api/lotes/{self.lote.pk}/liberar/',
+                {'password': 'clave-segura', 'motivo': 'Cumple especificaciones'},
+                format='json',
+            )
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.data['estado_actual'], 'RECHAZADO')
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.estado, 'RECHAZADO')
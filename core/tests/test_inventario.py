@@ -0,0 +1,278 @@
+"""
+Inventario de insumos: movimientos aplicados a LoteInsumo, saldos materializados
+(SaldoInsumo) que deben coincidir siempre con los lotes, recepción masiva de remitos y
+asignación FEFO de lotes
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.inventario import asignar_fefo, verificar_saldos
+from core.models import (
+    Ubicacion, Producto, Formula, Turno, Lote, CategoriaInsumo, Insumo, LoteInsumo, LoteInsumoConsumo,
+    MovimientoInventario, SaldoInsumo, GenealogiaLote,
+)
+
+
+class MovimientosLoteInsumoTests(TestCase):
+    """POST /api/movimientos/ con lote_item_id también mueve el stock del LoteInsumo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        cls.almacen = Ubicacion.objects.create(codigo='ALM', nombre='Almacén', tipo='ALMACEN')
+        cls.produccion = Ubicacion.objects.create(codigo='PROD', nombre='Producción', tipo='PRODUCCION')
+        categoria = CategoriaInsumo.objects.create(codigo='MP', nombre='Materia prima')
+        cls.insumo = Insumo.objects.create(
+            codigo='ALM-01', nombre='Almidón', categoria=categoria, unidad_medida='kg',
+            stock_minimo=10, stock_maximo=1000, punto_reorden=50, tiempo_vida_util_meses=12,
+        )
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+        hoy = timezone.localdate()
+        self.lote = LoteInsumo.objects.create(
+            insumo=self.insumo, codigo_lote_proveedor='PR-001', fecha_recepcion=hoy - timedelta(days=10),
+            fecha_vencimiento=hoy + timedelta(days=180), cantidad_inicial=100, cantidad_actual=100, unidad='kg',
+            ubicacion=self.almacen, proveedor='Proveedor SA', estado='APROBADO',
+        )
+
+    def _movimiento(self, tipo, cantidad, **campos):
+        datos = {
+            'tipo_item': 'INSUMO', 'item_id': self.insumo.id, 'lote_item_id': self.lote.id,
+            'tipo_movimiento': tipo, 'motivo': 'AJUSTE_INVENTARIO', 'cantidad': cantidad, 'unidad': 'kg',
+        }
+        datos.update(campos)
+        return self.cliente.post('/api/movimientos/', datos, format='json')
+
+    def _saldos(self):
+        return {
+            (saldo.ubicacion_id, saldo.estado): (saldo.cantidad, saldo.lotes)
+            for saldo in SaldoInsumo.objects.filter(insumo=self.insumo).exclude(lotes=0)
+        }
+
+    def test_salida_descuenta_del_lote_y_del_saldo(self):
+        respuesta = self._movimiento('SALIDA', '30')
+
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.cantidad_actual, 70)
+        self.assertEqual(self._saldos(), {(self.almacen.id, 'APROBADO'): (Decimal('70'), 1)})
+
+    def test_cantidad_no_positiva_se_rechaza_salvo_en_ajuste(self):
+        for tipo, cantidad in [('SALIDA', '-5'), ('ENTRADA', '-5'), ('TRANSFERENCIA', '0'), ('AJUSTE', '0')]:
+            with self.subTest(tipo=tipo, cantidad=cantidad):
+                respuesta = self._movimiento(tipo, cantidad, ubicacion_destino=self.produccion.id)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn('cantidad', respuesta.data)
+
+        self.assertEqual(self._movimiento('AJUSTE', '-5').status_code, 201)
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.cantidad_actual, 95)
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+
+    def test_salida_mayor_al_stock_no_registra_el_movimiento(self):
+        respuesta = self._movimiento('SALIDA', '101')
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(MovimientoInventario.objects.exists())
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.cantidad_actual, 100)
+
+    def test_transferencia_parcial_divide_el_lote(self):
+        respuesta = self._movimiento('TRANSFERENCIA', '40', ubicacion_destino=self.produccion.id)
+
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(
+            sorted(LoteInsumo.objects.values_list('ubicacion_id', 'cantidad_actual')),
+            sorted([(self.almacen.id, Decimal('60')), (self.produccion.id, Decimal('40'))]),
+        )
+        self.assertEqual(self._saldos(), {
+            (self.almacen.id, 'APROBADO'): (Decimal('60'), 1),
+            (self.produccion.id, 'APROBADO'): (Decimal('40'), 1),
+        })
+
+    def test_saldos_siguen_a_los_lotes(self):
+        self.lote.estado = 'CUARENTENA'
+        self.lote.save()
+        self.assertEqual(self._saldos(), {(self.almacen.id, 'CUARENTENA'): (Decimal('100'), 1)})
+
+        self.lote.delete()
+        self.assertEqual(self._saldos(), {})
+        self.assertEqual(verificar_saldos(), [])
+
+
+class RecepcionLotesTests(TestCase):
+    """POST /api/lotes-insumo/recepcion/ crea todos los lotes del remito en cuarentena o ninguno"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        cls.almacen = Ubicacion.objects.create(codigo='ALM', nombre='Almacén', tipo='ALMACEN')
+        categoria = CategoriaInsumo.objects.create(codigo='MP', nombre='Materia prima')
+        cls.insumo = Insumo.objects.create(
+            codigo='ALM-01', nombre='Almidón', categoria=categoria, unidad_medida='kg',
+            stock_minimo=10, stock_maximo=1000, punto_reorden=50, tiempo_vida_util_meses=12,
+        )
+        cls.vencimiento = (timezone.localdate() + timedelta(days=365)).isoformat()
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def _recepcion(self, lineas):
+        return self.cliente.post('/api/lotes-insumo/recepcion/', {
+            'proveedor': 'Proveedor SA', 'numero_factura': 'FC-0001', 'ubicacion': 'ALM', 'lineas': lineas,
+        }, format='json')
+
+    def _linea(self, codigo, cantidad):
+        return {'insumo': 'ALM-01', 'codigo_lote_proveedor': codigo, 'fecha_vencimiento': self.vencimiento, 'cantidad': cantidad}
+
+    def test_remito_crea_lotes_en_cuarentena_con_su_entrada_y_saldo(self):
+        respuesta = self._recepcion([self._linea('PR-001', '100'), self._linea('PR-002', '25,50')])
+
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(respuesta.data['lotes_creados'], 2)
+        self.assertEqual(
+            sorted(LoteInsumo.objects.values_list('codigo_lote_proveedor', 'estado', 'cantidad_actual', 'unidad')),
+            [('PR-001', 'CUARENTENA', Decimal('100'), 'kg'), ('PR-002', 'CUARENTENA', Decimal('25.50'), 'kg')],
+        )
+        self.assertEqual(
+            set(MovimientoInventario.objects.values_list('tipo_movimiento', 'referencia_documento', 'cantidad')),
+            {('ENTRADA', 'FC-0001', Decimal('100')), ('ENTRADA', 'FC-0001', Decimal('25.50'))},
+        )
+        # bulk_create no dispara señales: el saldo se ajusta en la misma recepción
+        saldo = SaldoInsumo.objects.get(insumo=self.insumo, ubicacion=self.almacen, estado='CUARENTENA')
+        self.assertEqual((saldo.cantidad, saldo.lotes), (Decimal('125.50'), 2))
+        self.assertEqual(verificar_saldos(), [])
+
+    def test_lineas_con_error_rechazan_el_remito_completo(self):
+        self.assertEqual(self._recepcion([self._linea('PR-001', '100')]).status_code, 201)
+
+        respuesta = self._recepcion([
+            self._linea('PR-002', '10'),
+            self._linea('PR-001', '10'),
+            self._linea('PR-003', 'NaN'),
+            dict(self._linea('PR-004', '10'), insumo='NO-EXISTE'),
+            self._linea('PR-002', '5'),
+            'texto',
+        ])
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([error['linea'] for error in respuesta.data['errores']], [2, 3, 4, 5, 6])
+        self.assertEqual(list(LoteInsumo.objects.values_list('codigo_lote_proveedor', flat=True)), ['PR-001'])
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+
+    def test_carga_csv(self):
+        archivo = SimpleUploadedFile(
+            'remito.csv',
+            f'insumo;codigo_lote_proveedor;fecha_vencimiento;cantidad\nALM-01;PR-010;{self.vencimiento};12,5\n'.encode(),
+        )
+        respuesta = self.cliente.post(
+            '/api/lotes-insumo/recepcion/', {'archivo': archivo, 'proveedor': 'Proveedor SA', 'ubicacion': 'ALM'},
+            format='multipart',
+        )
+
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(LoteInsumo.objects.get().cantidad_actual, Decimal('12.5'))
+
+    def test_csv_que_no_es_utf8_responde_400(self):
+        archivo = SimpleUploadedFile('remito.csv', b'insumo,codigo_lote_proveedor,fecha_vencimiento,cantidad\nALM-01,\xff\xfe,2030-01-01,1\n')
+        respuesta = self.cliente.post(
+            '/api/lotes-insumo/recepcion/', {'archivo': archivo, 'proveedor': 'Proveedor SA', 'ubicacion': 'ALM'},
+            format='multipart',
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(LoteInsumo.objects.exists())
+
+
+class AsignacionFEFOTests(TestCase):
+    """asignar_fefo reparte por vencimiento entre lotes aprobados y no vencidos, o no consume nada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        cls.almacen = Ubicacion.objects.create(codigo='ALM', nombre='Almacén', tipo='ALMACEN')
+        categoria = CategoriaInsumo.objects.create(codigo='MP', nombre='Materia prima')
+        cls.insumo = Insumo.objects.create(
+            codigo='ALM-01', nombre='Almidón', categoria=categoria, unidad_medida='kg',
+            stock_minimo=10, stock_maximo=1000, punto_reorden=50, tiempo_vida_util_meses=12,
+        )
+        producto = Producto.objects.create(
+            codigo='PARA-500', nombre='Paracetamol 500', forma_farmaceutica='COMPRIMIDO',
+            principio_activo='Paracetamol', concentracion='500 mg', unidad_medida='comprimidos',
+            lote_minimo=1000, lote_optimo=5000, tiempo_vida_util_meses=24,
+        )
+        formula = Formula.objects.create(
+            producto=producto, version='1', fecha_vigencia_desde=date(2024, 1, 1),
+            rendimiento_teorico=95, tiempo_estimado_horas=8, aprobada_por=cls.usuario, fecha_aprobacion=date(2024, 1, 1),
+        )
+        turno = Turno.objects.create(codigo='M', nombre='Mañana', hora_inicio=time(6), hora_fin=time(14))
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate(), time(8)))
+        cls.lote = Lote.objects.create(
+            codigo_lote='LF-001', producto=producto, formula=formula, cantidad_planificada=5000,
+            unidad='comprimidos', estado='EN_PROCESO',
+            fecha_planificada_inicio=inicio, fecha_planificada_fin=inicio + timedelta(hours=8), fecha_real_inicio=inicio,
+            turno=turno, supervisor=cls.usuario, creado_por=cls.usuario,
+        )
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+        self.tardio = self._lote_insumo('B-TARDIO', 100, dias_vencimiento=90)
+        self.temprano = self._lote_insumo('A-TEMPRANO', 30, dias_vencimiento=30)
+        self.vencido = self._lote_insumo('V-VENCIDO', 500, dias_vencimiento=-1)
+        self.cuarentena = self._lote_insumo('C-CUARENTENA', 500, dias_vencimiento=10, estado='CUARENTENA')
+
+    def _lote_insumo(self, codigo, cantidad, dias_vencimiento, estado='APROBADO'):
+        hoy = timezone.localdate()
+        return LoteInsumo.objects.create(
+            insumo=self.insumo, codigo_lote_proveedor=codigo, fecha_recepcion=hoy - timedelta(days=30),
+            fecha_vencimiento=hoy + timedelta(days=dias_vencimiento), cantidad_inicial=cantidad,
+            cantidad_actual=cantidad, unidad='kg', ubicacion=self.almacen, proveedor='Proveedor SA', estado=estado,
+        )
+
+    def test_reparte_por_vencimiento_y_agota_el_primer_lote(self):
+        asignaciones = asignar_fefo(self.insumo.id, Decimal('50'), self.lote.id, self.usuario)
+
+        self.assertEqual(
+            [(a['lote_insumo_id'], a['cantidad'], a['agotado']) for a in asignaciones],
+            [(self.temprano.id, Decimal('30'), True), (self.tardio.id, Decimal('20'), False)],
+        )
+        self.temprano.refresh_from_db()
+        self.tardio.refresh_from_db()
+        self.assertEqual((self.temprano.estado, self.temprano.cantidad_actual), ('AGOTADO', 0))
+        self.assertEqual(self.tardio.cantidad_actual, 80)
+
+        self.assertEqual(MovimientoInventario.objects.filter(tipo_movimiento='SALIDA').count(), 2)
+        self.assertEqual(LoteInsumoConsumo.objects.filter(lote_produccion=self.lote).count(), 2)
+        self.assertEqual(
+            set(GenealogiaLote.objects.values_list('lote_insumo_id', 'cantidad')),
+            {(self.temprano.id, Decimal('30')), (self.tardio.id, Decimal('20'))},
+        )
+        saldo = SaldoInsumo.objects.get(insumo=self.insumo, ubicacion=self.almacen, estado='APROBADO')
+        # Sigue contando el lote vencido: el saldo es stock aprobado, no stock asignable
+        self.assertEqual((saldo.cantidad, saldo.lotes), (Decimal('580'), 2))
+
+    def test_stock_insuficiente_no_consume_nada(self):
+        with self.assertRaises(ValueError):
+            asignar_fefo(self.insumo.id, Decimal('131'), self.lote.id, self.usuario)
+
+        self.temprano.refresh_from_db()
+        self.tardio.refresh_from_db()
+        self.assertEqual((self.temprano.cantidad_actual, self.tardio.cantidad_actual), (30, 100))
+        self.assertFalse(MovimientoInventario.objects.exists())
+        self.assertFalse(LoteInsumoConsumo.objects.exists())
+
+    def test_endpoint_responde_409_sin_stock(self):
+        respuesta = self.cliente.post('/api/movimientos/asignar_fefo/', {
+            'insumo': self.insumo.id, 'cantidad': '1000', 'lote_produccion': self.lote.id,
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 409)
@@ -0,0 +1,76 @@
+"""
+Cálculo incremental de IndicadorMantenimiento: una transición de OT o una edición
+retroactiva recalcula el período del evento aunque sea anterior al último cálculo
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from core.estados import transicionar
+from core.mantenimiento import calcular_indicadores_mantenimiento
+from core.models import (
+    Ubicacion, Maquina, TipoMantenimiento, OrdenTrabajo, HistorialMantenimiento, IndicadorMantenimiento,
+)
+
+
+def _hora(dia, hora):
+    return timezone.make_aware(datetime.combine(date(2025, 3, dia), time(hora)))
+
+
+class IndicadoresIncrementalesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tecnico = User.objects.create_user('tecnico', 'tecnico@siprosa.test', 'clave-segura')
+        ubicacion = Ubicacion.objects.create(codigo='PROD', nombre='Producción', tipo='PRODUCCION')
+        cls.maquina = Maquina.objects.create(codigo='COMP-01', nombre='Compresora', tipo='COMPRESION', ubicacion=ubicacion)
+        cls.correctivo = TipoMantenimiento.objects.create(codigo='CORR', nombre='Correctivo')
+        cls.preventivo = TipoMantenimiento.objects.create(codigo='PREV', nombre='Preventivo')
+
+    def setUp(self):
+        self.orden = OrdenTrabajo.objects.create(
+            codigo='OT-001', tipo=self.correctivo, maquina=self.maquina, estado='EN_PROCESO', titulo='Cambio de punzones',
+            descripcion='Punzones gastados', fecha_inicio=_hora(3, 8), creada_por=self.tecnico,
+        )
+        self.preventiva = OrdenTrabajo.objects.create(
+            codigo='OT-002', tipo=self.preventivo, maquina=self.maquina, estado='COMPLETADA', titulo='Lubricación',
+            descripcion='Rutina mensual', creada_por=self.tecnico,
+        )
+        self.historial = HistorialMantenimiento.objects.create(
+            maquina=self.maquina, orden_trabajo=self.preventiva, fecha=_hora(10, 9), tipo=self.preventivo,
+            descripcion='Lubricación', tiempo_parada_horas=1, costo=50, realizado_por=self.tecnico,
+        )
+        OrdenTrabajo.objects.filter(pk=self.orden.pk).update(fecha_creacion=_hora(3, 8))
+        OrdenTrabajo.objects.filter(pk=self.preventiva.pk).update(fecha_creacion=_hora(10, 8))
+        self.orden.refresh_from_db()
+
+        calcular_indicadores_mantenimiento(date(2025, 3, 1), date(2025, 3, 31), ['MENSUAL'])
+        # Todo lo anterior quedó registrado antes del último cálculo, que fue hace un día
+        hace_dos_dias = timezone.now() - timedelta(days=2)
+        for modelo in (OrdenTrabajo, HistorialMantenimiento):
+            modelo.objects.update(fecha_modificacion=hace_dos_dias)
+        IndicadorMantenimiento.objects.update(fecha_calculo=timezone.now() - timedelta(days=1))
+
+    def _marzo(self):
+        return IndicadorMantenimiento.objects.get(maquina=self.maquina, periodo='MENSUAL', fecha_inicio=date(2025, 3, 1))
+
+    def test_transicion_de_ot_recalcula_su_periodo(self):
+        self.assertEqual(self._marzo().mttr_horas, 0)
+
+        self.assertTrue(transicionar(self.orden, 'completar', fecha_fin=_hora(3, 12)))
+        calcular_indicadores_mantenimiento(periodos=['MENSUAL'])
+
+        self.assertEqual(self._marzo().mttr_horas, Decimal('4.00'))
+
+    def test_edicion_retroactiva_recalcula_su_periodo(self):
+        self.assertEqual(self._marzo().costo_total_mantenimiento, Decimal('50.00'))
+
+        self.historial.costo = 80
+        self.historial.save()
+        calcular_indicadores_mantenimiento(periodos=['MENSUAL'])
+
+        self.assertEqual(self._marzo().costo_total_mantenimiento, Decimal('80.00'))
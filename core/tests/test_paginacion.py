@@ -0,0 +1,72 @@
+"""
+Paginación por cursor: las páginas siguientes a la primera recorren el listado sin
+saltos ni repeticiones, también con empates en la columna del orden
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import MovimientoInventario
+
+
+class PaginacionCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                tipo_item='INSUMO', item_id=1, tipo_movimiento='ENTRADA', motivo='COMPRA',
+                cantidad=i + 1, unidad='kg', registrado_por=cls.usuario,
+            )
+            for i in range(25)
+        ])
+        # Grupos de movimientos con la misma fecha: el id desempata
+        ahora = timezone.now()
+        for i, movimiento in enumerate(MovimientoInventario.objects.order_by('id')):
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(fecha_movimiento=ahora - timedelta(minutes=i // 4))
+        cls.esperado = list(MovimientoInventario.objects.order_by('-fecha_movimiento', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def _pagina(self, url):
+        respuesta = self.cliente.get(url)
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return respuesta.data
+
+    def test_recorrido_completo_hacia_adelante_y_hacia_atras(self):
+        paginas = [self._pagina('/api/movimientos/?paginacion=cursor&page_size=10')]
+        while paginas[-1]['next']:
+            paginas.append(self._pagina(paginas[-1]['next']))
+
+        ids = [[fila['id'] for fila in pagina['results']] for pagina in paginas]
+        self.assertEqual([len(pagina) for pagina in ids], [10, 10, 5])
+        self.assertEqual(sum(ids, []), self.esperado)
+
+        anterior = self._pagina(paginas[2]['previous'])
+        self.assertEqual([fila['id'] for fila in anterior['results']], ids[1])
+        self.assertEqual(
+            [fila['id'] for fila in self._pagina(anterior['previous'])['results']], ids[0]
+        )
+
+    def test_pagina_siguiente_filtra_con_comparacion_de_filas(self):
+        primera = self._pagina('/api/movimientos/?paginacion=cursor&page_size=10')
+
+        with CaptureQueriesContext(connection) as capturadas:
+            self._pagina(primera['next'])
+
+        consulta = next(q['sql'] for q in capturadas.captured_queries if 'core_movimientoinventario' in q['sql'])
+        self.assertRegex(consulta, r'\("core_movimientoinventario"\."fecha_movimiento", "core_movimientoinventario"\."id"\) < \(')
+        self.assertNotIn(' OR ', consulta)
+
+    def test_cursor_invalido(self):
+        respuesta = self.cliente.get('/api/movimientos/?paginacion=cursor&cursor=no-es-un-cursor')
+        self.assertEqual(respuesta.status_code, 404)
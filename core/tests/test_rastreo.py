@@ -0,0 +1,76 @@
+"""
+Valores originales rastreados: el save de un lote detecta y audita sus cambios sin
+volver a leer la fila
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Producto, Formula, Turno, Lote, LogAuditoria
+
+
+class CamposRastreadosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@siprosa.test', 'clave-segura')
+        cls.otro_supervisor = User.objects.create_user('supervisor', 'supervisor@siprosa.test', 'clave-segura')
+        producto = Producto.objects.create(
+            codigo='PARA-500', nombre='Paracetamol 500', forma_farmaceutica='COMPRIMIDO',
+            principio_activo='Paracetamol', concentracion='500 mg', unidad_medida='comprimidos',
+            lote_minimo=1000, lote_optimo=5000, tiempo_vida_util_meses=24,
+        )
+        formula = Formula.objects.create(
+            producto=producto, version='1', fecha_vigencia_desde=date(2024, 1, 1),
+            rendimiento_teorico=95, tiempo_estimado_horas=8, aprobada_por=cls.usuario, fecha_aprobacion=date(2024, 1, 1),
+        )
+        turno = Turno.objects.create(codigo='M', nombre='Mañana', hora_inicio=time(6), hora_fin=time(14))
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(8)))
+        cls.lote = Lote.objects.create(
+            codigo_lote='LR-001', producto=producto, formula=formula, cantidad_planificada=5000,
+            unidad='comprimidos', estado='PLANIFICADO',
+            fecha_planificada_inicio=inicio, fecha_planificada_fin=inicio + timedelta(hours=8),
+            turno=turno, supervisor=cls.usuario, creado_por=cls.usuario,
+        )
+
+    def test_originales_y_campos_modificados_antes_y_despues_de_guardar(self):
+        lote = Lote.objects.get(pk=self.lote.pk)
+        self.assertEqual(lote.valores_originales()['cantidad_planificada'], 5000)
+        self.assertEqual(lote.campos_modificados(), {})
+
+        lote.cantidad_planificada = 6000
+        lote.observaciones = 'Ampliación'
+        self.assertEqual(lote.campos_modificados(), {
+            'cantidad_planificada': (5000, 6000), 'observaciones': ('', 'Ampliación'),
+        })
+
+        lote.save()
+        # Lo guardado pasa a ser el nuevo original
+        self.assertEqual(lote.campos_modificados(), {})
+        self.assertEqual(lote.valores_originales()['cantidad_planificada'], 6000)
+
+    def test_guardar_no_vuelve_a_leer_el_lote(self):
+        lote = Lote.objects.get(pk=self.lote.pk)
+        lote.observaciones = 'Sin relectura'
+
+        with CaptureQueriesContext(connection) as capturadas:
+            lote.save()
+
+        lecturas = [
+            q['sql'] for q in capturadas.captured_queries
+            if q['sql'].lstrip().upper().startswith('SELECT') and 'FROM "core_lote"' in q['sql']
+        ]
+        self.assertEqual(lecturas, [])
+
+    def test_auditoria_de_fk_muestra_el_objeto_relacionado(self):
+        lote = Lote.objects.get(pk=self.lote.pk)
+        lote.supervisor = self.otro_supervisor
+        lote.save()
+
+        auditoria = LogAuditoria.objects.filter(modelo='Lote', objeto_id=lote.pk, accion='MODIFICAR').latest('fecha')
+        self.assertEqual(auditoria.cambios, {'supervisor': {'antes': 'admin', 'despues': 'supervisor'}})
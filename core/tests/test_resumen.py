@@ -0,0 +1,135 @@
+"""
+Mantenimiento incremental del rollup diario de producción (ResumenProduccionDiario):
+después de cada guardado debe coincidir con una reconstrucción completa
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.estados import transicionar
+from core.kpis import reconstruir_resumen
+from core.models import (
+    Ubicacion, Maquina, Producto, Formula, Turno, EtapaProduccion, Lote, LoteEtapa, Parada,
+    ResumenProduccionDiario,
+)
+
+
+def _hora(dia, hora, minuto=0):
+    return timezone.make_aware(datetime.combine(date(2025, 3, dia), time(hora, minuto)))
+
+
+class ResumenProduccionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('supervisor', 'supervisor@siprosa.test', 'clave-segura')
+        ubicacion = Ubicacion.objects.create(codigo='PROD', nombre='Producción', tipo='PRODUCCION')
+        cls.compresora = Maquina.objects.create(codigo='COMP-01', nombre='Compresora', tipo='COMPRESION', ubicacion=ubicacion)
+        cls.blistera = Maquina.objects.create(codigo='BLIS-01', nombre='Blistera', tipo='BLISTERADO', ubicacion=ubicacion)
+        cls.producto = Producto.objects.create(
+            codigo='PARA-500', nombre='Paracetamol 500', forma_farmaceutica='COMPRIMIDO',
+            principio_activo='Paracetamol', concentracion='500 mg', unidad_medida='comprimidos',
+            lote_minimo=1000, lote_optimo=5000, tiempo_vida_util_meses=24,
+        )
+        cls.formula = Formula.objects.create(
+            producto=cls.producto, version='1', fecha_vigencia_desde=date(2024, 1, 1),
+            rendimiento_teorico=95, tiempo_estimado_horas=8, aprobada_por=cls.usuario, fecha_aprobacion=date(2024, 1, 1),
+        )
+        cls.manana = Turno.objects.create(codigo='M', nombre='Mañana', hora_inicio=time(6), hora_fin=time(14))
+        cls.tarde = Turno.objects.create(codigo='T', nombre='Tarde', hora_inicio=time(14), hora_fin=time(22))
+        cls.compresion = EtapaProduccion.objects.create(codigo='COMP', nombre='Compresión', orden_tipico=1)
+        cls.blisteado = EtapaProduccion.objects.create(codigo='BLIS', nombre='Blisteado', orden_tipico=2)
+
+    def _lote(self, codigo, dia=1, **campos):
+        datos = dict(
+            codigo_lote=codigo, producto=self.producto, formula=self.formula, cantidad_planificada=5000,
+            cantidad_producida=4900, cantidad_rechazada=50, unidad='comprimidos', estado='FINALIZADO',
+            fecha_planificada_inicio=_hora(dia, 8), fecha_planificada_fin=_hora(dia, 16),
+            fecha_real_inicio=_hora(dia, 8), fecha_real_fin=_hora(dia, 17),
+            turno=self.manana, supervisor=self.usuario, creado_por=self.usuario,
+        )
+        datos.update(campos)
+        return Lote.objects.create(**datos)
+
+    def _etapa(self, lote, orden, maquina):
+        return LoteEtapa.objects.create(
+            lote=lote, etapa=self.compresion if orden == 1 else self.blisteado, orden=orden, maquina=maquina,
+            estado='COMPLETADO', fecha_inicio=_hora(1, 8), fecha_fin=_hora(1, 12), operario=self.usuario,
+        )
+
+    def _filas(self):
+        return sorted(
+            ResumenProduccionDiario.objects.values_list(
+                'fecha', 'turno_id', 'maquina_id', 'producto_id', 'lotes', 'horas_planificadas', 'horas_reales',
+                'minutos_parada', 'cantidad_producida', 'cantidad_rechazada',
+            ),
+            key=str,
+        )
+
+    def assertIgualAReconstruccion(self):
+        incremental = self._filas()
+        reconstruir_resumen(date(2025, 2, 1), date(2025, 3, 31))
+        self.assertEqual(incremental, self._filas())
+        return incremental
+
+    def test_cambios_de_lote_etapa_y_parada(self):
+        lote = self._lote('LR-001')
+        etapa = self._etapa(lote, 1, self.compresora)
+        otro = self._lote('LR-002')
+        self._etapa(otro, 1, self.blistera)
+        self.assertEqual(len(self.assertIgualAReconstruccion()), 2)
+
+        lote.turno = self.tarde
+        lote.save()
+        self.assertIgualAReconstruccion()
+
+        lote.fecha_real_inicio = _hora(2, 15)
+        lote.save()
+        self.assertIgualAReconstruccion()
+
+        ultima = self._etapa(lote, 2, self.blistera)  # pasa a ser la máquina final del lote
+        self.assertIgualAReconstruccion()
+
+        parada = Parada.objects.create(
+            lote_etapa=etapa, tipo='NO_PLANIFICADA', categoria='OTROS', fecha_inicio=_hora(1, 9),
+            fecha_fin=_hora(1, 9, 45), descripcion='Atasco', registrado_por=self.usuario,
+        )
+        self.assertIgualAReconstruccion()
+
+        parada.lote_etapa = ultima
+        parada.save()
+        self.assertIgualAReconstruccion()
+
+        parada.delete()
+        ultima.delete()
+        self.assertIgualAReconstruccion()
+
+        transicionar(otro, 'liberar')  # FINALIZADO -> LIBERADO: sigue contando para OEE
+        lote.estado = 'EN_PROCESO'
+        lote.save()
+        filas = self.assertIgualAReconstruccion()
+        self.assertEqual([fila[2] for fila in filas], [self.blistera.id])
+
+    def test_lotes_sin_etapas_comparten_una_fila_sin_maquina(self):
+        self._lote('LR-010')
+        self._lote('LR-011')
+
+        fila = ResumenProduccionDiario.objects.get()
+        self.assertEqual((fila.maquina_id, fila.lotes), (None, 2))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ResumenProduccionDiario.objects.create(
+                fecha=fila.fecha, turno=fila.turno, maquina=None, producto=fila.producto
+            )
+
+    def test_guardado_sin_campos_del_rollup_no_lo_recalcula(self):
+        lote = self._lote('LR-020')
+        lote.observaciones = 'Sin cambios de cantidades ni fechas'
+        with CaptureQueriesContext(connection) as consultas:
+            lote.save()
+        tabla = ResumenProduccionDiario._meta.db_table
+        self.assertFalse([q for q in consultas.captured_queries if tabla in q['sql']])
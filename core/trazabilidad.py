@@ -0,0 +1,301 @@
+"""
+Trazabilidad de lotes (genealogía) para SIPROSA MES
+Mantiene GenealogiaLote (lote de insumo → lote de producción) a partir de los
+LoteInsumoConsumo y resuelve las trazas hacia adelante (¿qué lotes y productos
+terminados usaron este lote del proveedor?) y hacia atrás (¿qué lotes de insumo
+usó este lote?) con consultas indexadas sobre esa tabla, sin encadenar consumos.
+
+La genealogía de la planta tiene dos niveles (los lotes de producción no se consumen
+en otros lotes y cada uno tiene a lo sumo un ProductoTerminado), por lo que la
+clausura se reduce a los pares directos insumo → lote.
+"""
+
+from django.db import transaction
+from django.db.models import Sum, Count, Min, Max, Q
+from django.utils import timezone
+
+from .models import LoteInsumo, LoteInsumoConsumo, GenealogiaLote, Lote
+
+
+TANDA_GENEALOGIA = 2000
+
+
+# ============================================
+# MANTENIMIENTO DE LA GENEALOGÍA
+# ============================================
+
+def acumular_genealogia(deltas):
+    """
+    Suma (o resta) consumos a la genealogía.
+    `deltas`: {(lote_insumo_id, lote_id): (cantidad, consumos, fecha_consumo)}, con la
+    fecha del consumo agregado (None si solo se descuentan consumos). Solo se crean filas
+    para consumos nuevos; las que quedan sin consumos se eliminan y, en las que perdieron
+    consumos, las fechas de primer / último consumo se recalculan de los que quedan.
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        nuevas = {clave: fecha for clave, (_, consumos, fecha) in deltas.items() if consumos > 0}
+        if nuevas:
+            lotes_insumo = {
+                lote['id']: lote
+                for lote in LoteInsumo.objects.filter(id__in={li for li, _ in nuevas}).values(
+                    'id', 'insumo_id', 'codigo_lote_proveedor', 'unidad'
+                )
+            }
+            GenealogiaLote.objects.bulk_create([
+                GenealogiaLote(
+                    lote_insumo_id=lote_insumo_id,
+                    lote_id=lote_id,
+                    insumo_id=lotes_insumo[lote_insumo_id]['insumo_id'],
+                    codigo_lote_proveedor=lotes_insumo[lote_insumo_id]['codigo_lote_proveedor'],
+                    unidad=lotes_insumo[lote_insumo_id]['unidad'],
+                    fecha_primer_consumo=fecha or timezone.now(),
+                    fecha_ultimo_consumo=fecha or timezone.now(),
+                )
+                for (lote_insumo_id, lote_id), fecha in nuevas.items()
+            ], ignore_conflicts=True)
+
+        filtro = Q()
+        for lote_insumo_id, lote_id in deltas:
+            filtro |= Q(lote_insumo_id=lote_insumo_id, lote_id=lote_id)
+        filas = list(GenealogiaLote.objects.select_for_update().filter(filtro))
+        recalcular = []
+        for fila in filas:
+            cantidad, consumos, fecha = deltas[(fila.lote_insumo_id, fila.lote_id)]
+            fila.cantidad += cantidad
+            fila.consumos += consumos
+            if fecha is not None:
+                fila.fecha_primer_consumo = min(fila.fecha_primer_consumo, fecha)
+                fila.fecha_ultimo_consumo = max(fila.fecha_ultimo_consumo, fecha)
+            if consumos < 0 and fila.consumos > 0:
+                recalcular.append(fila)
+
+        if recalcular:
+            # El consumo quitado podía ser el primero o el último del par
+            filtro = Q()
+            for fila in recalcular:
+                filtro |= Q(lote_insumo_id=fila.lote_insumo_id, lote_produccion_id=fila.lote_id)
+            fechas = {
+                (par['lote_insumo_id'], par['lote_produccion_id']): (par['primero'], par['ultimo'])
+                for par in LoteInsumoConsumo.objects.filter(filtro).order_by().values(
+                    'lote_insumo_id', 'lote_produccion_id'
+                ).annotate(primero=Min('fecha_consumo'), ultimo=Max('fecha_consumo'))
+            }
+            for fila in recalcular:
+                if (fila.lote_insumo_id, fila.lote_id) in fechas:
+                    fila.fecha_primer_consumo, fila.fecha_ultimo_consumo = fechas[(fila.lote_insumo_id, fila.lote_id)]
+
+        GenealogiaLote.objects.bulk_update(
+            filas, ['cantidad', 'consumos', 'fecha_primer_consumo', 'fecha_ultimo_consumo'], batch_size=1000
+        )
+        GenealogiaLote.objects.filter(id__in=[fila.id for fila in filas if fila.consumos <= 0]).delete()
+
+
+def reconstruir_genealogia():
+    """
+    Regenera la genealogía completa desde LoteInsumoConsumo con una consulta agrupada
+    e inserciones por tandas. Retorna la cantidad de pares generados.
+    """
+    pares = LoteInsumoConsumo.objects.order_by().values(
+        'lote_insumo_id', 'lote_produccion_id',
+        'lote_insumo__insumo_id', 'lote_insumo__codigo_lote_proveedor', 'lote_insumo__unidad',
+    ).annotate(
+        total=Sum('cantidad_real'),
+        cantidad_consumos=Count('id'),
+        primero=Min('fecha_consumo'),
+        ultimo=Max('fecha_consumo'),
+    )
+
+    total = 0
+    with transaction.atomic():
+        GenealogiaLote.objects.all().delete()
+        tanda = []
+        for par in pares.iterator(chunk_size=TANDA_GENEALOGIA):
+            tanda.append(GenealogiaLote(
+                lote_insumo_id=par['lote_insumo_id'],
+                lote_id=par['lote_produccion_id'],
+                insumo_id=par['lote_insumo__insumo_id'],
+                codigo_lote_proveedor=par['lote_insumo__codigo_lote_proveedor'],
+                unidad=par['lote_insumo__unidad'],
+                cantidad=par['total'],
+                consumos=par['cantidad_consumos'],
+                fecha_primer_consumo=par['primero'],
+                fecha_ultimo_consumo=par['ultimo'],
+            ))
+            if len(tanda) >= TANDA_GENEALOGIA:
+                GenealogiaLote.objects.bulk_create(tanda)
+                total += len(tanda)
+                tanda = []
+        GenealogiaLote.objects.bulk_create(tanda)
+        total += len(tanda)
+    return total
+
+
+# ============================================
+# TRAZAS
+# ============================================
+
+def _producto_terminado(fila, prefijo):
+    if fila[f'{prefijo}id'] is None:
+        return None
+    return {
+        'id': fila[f'{prefijo}id'],
+        'cantidad': fila[f'{prefijo}cantidad'],
+        'unidad': fila[f'{prefijo}unidad'],
+        'estado': fila[f'{prefijo}estado'],
+        'fecha_vencimiento': fila[f'{prefijo}fecha_vencimiento'],
+        'ubicacion': fila[f'{prefijo}ubicacion__codigo'],
+    }
+
+
+def _campos_producto_terminado(prefijo):
+    return [f'{prefijo}{campo}' for campo in (
+        'id', 'cantidad', 'unidad', 'estado', 'fecha_vencimiento', 'ubicacion__codigo'
+    )]
+
+
+def traza_adelante(lote_insumo_id):
+    """
+    Lotes de producción y productos terminados que consumieron el lote del proveedor
+    al que pertenece `lote_insumo_id` (incluidas sus fracciones por transferencias),
+    con las cantidades consumidas y dónde queda stock del lote. Tres consultas.
+    Lanza LoteInsumo.DoesNotExist si el lote no existe.
+    """
+    origen = LoteInsumo.objects.values(
+        'insumo_id', 'insumo__codigo', 'insumo__nombre', 'codigo_lote_proveedor',
+        'proveedor', 'fecha_recepcion', 'fecha_vencimiento',
+    ).get(pk=lote_insumo_id)
+
+    existencias = [
+        {
+            'lote_insumo_id': lote['id'],
+            'ubicacion': lote['ubicacion__codigo'],
+            'cantidad_actual': lote['cantidad_actual'],
+            'unidad': lote['unidad'],
+            'estado': lote['estado'],
+        }
+        for lote in LoteInsumo.objects.filter(
+            insumo_id=origen['insumo_id'], codigo_lote_proveedor=origen['codigo_lote_proveedor']
+        ).order_by('id').values('id', 'ubicacion__codigo', 'cantidad_actual', 'unidad', 'estado')
+    ]
+
+    pt = 'lote__producto_terminado__'
+    filas = GenealogiaLote.objects.filter(
+        insumo_id=origen['insumo_id'], codigo_lote_proveedor=origen['codigo_lote_proveedor']
+    ).order_by('fecha_primer_consumo', 'lote_id').values(
+        'lote_id', 'lote__codigo_lote', 'lote__producto__codigo', 'lote__producto__nombre',
+        'lote__estado', 'lote__fecha_real_fin', 'lote_insumo_id', 'cantidad', 'unidad',
+        'fecha_primer_consumo', 'fecha_ultimo_consumo', *_campos_producto_terminado(pt),
+    )
+
+    # Un lote de producción puede haber consumido varias fracciones del mismo lote
+    lotes = {}
+    for fila in filas:
+        lote = lotes.get(fila['lote_id'])
+        if lote is None:
+            lote = lotes[fila['lote_id']] = {
+                'lote_id': fila['lote_id'],
+                'codigo_lote': fila['lote__codigo_lote'],
+                'producto_codigo': fila['lote__producto__codigo'],
+                'producto_nombre': fila['lote__producto__nombre'],
+                'estado': fila['lote__estado'],
+                'fecha_real_fin': fila['lote__fecha_real_fin'],
+                'cantidad_consumida': 0,
+                'unidad': fila['unidad'],
+                'lotes_insumo': [],
+                'fecha_primer_consumo': fila['fecha_primer_consumo'],
+                'fecha_ultimo_consumo': fila['fecha_ultimo_consumo'],
+                'producto_terminado': _producto_terminado(fila, pt),
+            }
+        lote['cantidad_consumida'] += fila['cantidad']
+        lote['lotes_insumo'].append(fila['lote_insumo_id'])
+        lote['fecha_ultimo_consumo'] = max(lote['fecha_ultimo_consumo'], fila['fecha_ultimo_consumo'])
+
+    terminados = [lote['producto_terminado'] for lote in lotes.values() if lote['producto_terminado']]
+    ubicaciones = {e['ubicacion'] for e in existencias if e['cantidad_actual'] > 0}
+    ubicaciones.update(p['ubicacion'] for p in terminados)
+
+    return {
+        'lote_proveedor': {
+            'insumo_id': origen['insumo_id'],
+            'insumo_codigo': origen['insumo__codigo'],
+            'insumo_nombre': origen['insumo__nombre'],
+            'codigo_lote_proveedor': origen['codigo_lote_proveedor'],
+            'proveedor': origen['proveedor'],
+            'fecha_recepcion': origen['fecha_recepcion'],
+            'fecha_vencimiento': origen['fecha_vencimiento'],
+        },
+        'existencias': existencias,
+        'lotes': list(lotes.values()),
+        'resumen': {
+            'lotes_produccion': len(lotes),
+            'cantidad_consumida': sum(lote['cantidad_consumida'] for lote in lotes.values()),
+            'cantidad_en_stock': sum(e['cantidad_actual'] for e in existencias),
+            'productos_terminados': len(terminados),
+            'unidades_terminadas': sum(p['cantidad'] for p in terminados),
+            'ubicaciones': sorted(ubicaciones),
+        },
+    }
+
+
+def traza_atras(lote_id):
+    """
+    Lotes de insumo (con proveedor, ubicación y stock actual) consumidos por el lote
+    de producción `lote_id`, con las cantidades consumidas. Dos consultas.
+    Lanza Lote.DoesNotExist si el lote no existe.
+    """
+    pt = 'producto_terminado__'
+    lote = Lote.objects.values(
+        'id', 'codigo_lote', 'producto__codigo', 'producto__nombre', 'estado',
+        'fecha_real_inicio', 'fecha_real_fin', *_campos_producto_terminado(pt),
+    ).get(pk=lote_id)
+
+    lotes_insumo = [
+        {
+            'lote_insumo_id': fila['lote_insumo_id'],
+            'insumo_id': fila['insumo_id'],
+            'insumo_codigo': fila['insumo__codigo'],
+            'insumo_nombre': fila['insumo__nombre'],
+            'codigo_lote_proveedor': fila['codigo_lote_proveedor'],
+            'proveedor': fila['lote_insumo__proveedor'],
+            'fecha_vencimiento': fila['lote_insumo__fecha_vencimiento'],
+            'estado': fila['lote_insumo__estado'],
+            'ubicacion': fila['lote_insumo__ubicacion__codigo'],
+            'cantidad_actual': fila['lote_insumo__cantidad_actual'],
+            'cantidad_consumida': fila['cantidad'],
+            'unidad': fila['unidad'],
+            'consumos': fila['consumos'],
+            'fecha_primer_consumo': fila['fecha_primer_consumo'],
+            'fecha_ultimo_consumo': fila['fecha_ultimo_consumo'],
+        }
+        for fila in GenealogiaLote.objects.filter(lote_id=lote_id).order_by(
+            'insumo__codigo', 'codigo_lote_proveedor', 'lote_insumo_id'
+        ).values(
+            'lote_insumo_id', 'insumo_id', 'insumo__codigo', 'insumo__nombre', 'codigo_lote_proveedor',
+            'lote_insumo__proveedor', 'lote_insumo__fecha_vencimiento', 'lote_insumo__estado',
+            'lote_insumo__ubicacion__codigo', 'lote_insumo__cantidad_actual',
+            'cantidad', 'unidad', 'consumos', 'fecha_primer_consumo', 'fecha_ultimo_consumo',
+        )
+    ]
+
+    return {
+        'lote': {
+            'lote_id': lote['id'],
+            'codigo_lote': lote['codigo_lote'],
+            'producto_codigo': lote['producto__codigo'],
+            'producto_nombre': lote['producto__nombre'],
+            'estado': lote['estado'],
+            'fecha_real_inicio': lote['fecha_real_inicio'],
+            'fecha_real_fin': lote['fecha_real_fin'],
+            'producto_terminado': _producto_terminado(lote, pt),
+        },
+        'lotes_insumo': lotes_insumo,
+        'resumen': {
+            'insumos': len({fila['insumo_id'] for fila in lotes_insumo}),
+            'lotes_insumo': len(lotes_insumo),
+            'proveedores': sorted({fila['proveedor'] for fila in lotes_insumo}),
+        },
+    }
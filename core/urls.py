@@ -16,7 +16,7 @@ from .views import (
     DesviacionViewSet, AccionCorrectivaViewSet, DocumentoVersionadoViewSet,
     # Inventario
     InsumoViewSet, LoteInsumoViewSet, RepuestoViewSet, ProductoTerminadoViewSet,
-    MovimientoInventarioViewSet,
+    MovimientoInventarioViewSet, ConteoFisicoViewSet,
     # Mantenimiento
     TipoMantenimientoViewSet, OrdenTrabajoViewSet,
     # Incidentes
@@ -26,7 +26,9 @@ from .views import (
     # Firmas
     ElectronicSignatureViewSet,
     # KPIs
-    KpiOEEView, KpiDashboardView, KpiExportCSVView,
+    KpiOEEView, KpiSeriesView, KpiEstadisticasView, KpiMaquinasView, KpiDashboardView, KpiExportCSVView,
+    # Trazabilidad
+    TrazabilidadLoteInsumoView, TrazabilidadLoteView,
     # Búsqueda y Auditoría
     BusquedaGlobalView, AuditoriaGenericaView,
     # Health check
@@ -65,6 +67,7 @@ router.register(r'insumos', InsumoViewSet)
 router.register(r'lotes-insumo', LoteInsumoViewSet)
 router.register(r'repuestos', RepuestoViewSet)
 router.register(r'productos-terminados', ProductoTerminadoViewSet)
+router.register(r'conteos-fisicos', ConteoFisicoViewSet)
 
 # Mantenimiento
 router.register(r'tipos-mantenimiento', TipoMantenimientoViewSet)
@@ -96,9 +99,16 @@ urlpatterns = [
     
     # KPIs
     path("kpis/oee/", KpiOEEView.as_view(), name="kpi_oee"),
+    path("kpis/series/", KpiSeriesView.as_view(), name="kpi_series"),
+    path("kpis/estadisticas/", KpiEstadisticasView.as_view(), name="kpi_estadisticas"),
+    path("kpis/maquinas/", KpiMaquinasView.as_view(), name="kpi_maquinas"),
     path("kpis/resumen_dashboard/", KpiDashboardView.as_view(), name="kpi_dashboard"),
     path("kpis/export.csv", KpiExportCSVView.as_view(), name="kpi_export_csv"),
     
+    # Trazabilidad
+    path("trazabilidad/lote-insumo/<int:pk>/", TrazabilidadLoteInsumoView.as_view(), name="trazabilidad_lote_insumo"),
+    path("trazabilidad/lote/<int:pk>/", TrazabilidadLoteView.as_view(), name="trazabilidad_lote"),
+    
     # Búsqueda y Auditoría
     path("buscar/", BusquedaGlobalView.as_view(), name="busqueda_global"),
     path("auditoria/", AuditoriaGenericaView.as_view(), name="auditoria_generica"),
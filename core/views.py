@@ -2,17 +2,21 @@
 Views (ViewSets) para SIPROSA MES
 """
 
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import viewsets, permissions, filters, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Count, Q, Sum
 from django.utils import timezone
 from django.http import JsonResponse
 from django.conf import settings
-from django.db import connections
+from django.db import connections, transaction
 from django.db.utils import OperationalError
 from django.contrib.auth.models import User
 from datetime import datetime, timedelta
+import codecs
+import csv
+import itertools
+import math
 import django
 
 from .models import (
@@ -23,7 +27,7 @@ from .models import (
     # Producci�n
     Lote, LoteEtapa, Parada, ControlCalidad, Desviacion, DocumentoVersionado,
     # Inventario
-    Insumo, LoteInsumo, Repuesto, ProductoTerminado, MovimientoInventario,
+    Insumo, LoteInsumo, Repuesto, ProductoTerminado, MovimientoInventario, ConteoFisico,
     # Mantenimiento
     TipoMantenimiento, OrdenTrabajo,
     # Incidentes
@@ -43,7 +47,8 @@ from .serializers import (
     ParadaSerializer, ControlCalidadSerializer, DesviacionSerializer, DocumentoVersionadoSerializer,
     # Inventario
     InsumoSerializer, LoteInsumoSerializer, RepuestoSerializer,
-    ProductoTerminadoSerializer, MovimientoInventarioSerializer,
+    ProductoTerminadoSerializer, MovimientoInventarioSerializer, AsignacionFEFOSerializer,
+    ConteoFisicoSerializer,
     # Mantenimiento
     TipoMantenimientoSerializer, OrdenTrabajoSerializer, OrdenTrabajoListSerializer,
     # Incidentes
@@ -57,6 +62,16 @@ from .serializers import (
 from .permissions import (
     IsAdmin, IsAdminOrSupervisor, IsAdminOrOperario
 )
+from .inventario import (
+    aplicar_movimiento, asignar_fefo, recibir_lotes, stock_aprobado_subquery, stock_a_fecha_subquery,
+    resumen_movimientos
+)
+from .pagination import PaginacionListados
+from .planificacion import explotar_requerimientos
+from .pronosticos import pronostico_subqueries, listar_pronosticos
+from .estados import transicion_permitida, transicionar, estado_actual
+from .concurrencia import ControlVersionMixin
+from .conteos import cargar_lineas, conciliar_conteo, aprobar_conteo
 
 
 # ============================================
@@ -214,7 +229,7 @@ class UbicacionViewSet(viewsets.ModelViewSet):
 
 class MaquinaViewSet(viewsets.ModelViewSet):
     """ViewSet para gestionar M�quinas"""
-    queryset = Maquina.objects.select_related('ubicacion').all().order_by('codigo')
+    queryset = Maquina.objects.select_related('ubicacion', 'uso').all().order_by('codigo')
     serializer_class = MaquinaSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['codigo', 'nombre', 'fabricante', 'modelo']
@@ -351,7 +366,15 @@ class TurnoViewSet(viewsets.ModelViewSet):
 # PRODUCCI�N
 # ============================================
 
-class LoteViewSet(viewsets.ModelViewSet):
+def _conflicto_transicion(instancia, error):
+    """409: otro usuario cambió el estado entre la lectura y el UPDATE condicional"""
+    return Response(
+        {'error': error, 'estado_actual': estado_actual(instancia)},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+class LoteViewSet(ControlVersionMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar Lotes de Producci�n"""
     queryset = Lote.objects.select_related(
         'producto', 'formula', 'turno', 'supervisor', 'creado_por'
@@ -360,6 +383,9 @@ class LoteViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['codigo_lote', 'producto__nombre']
     ordering_fields = ['fecha_creacion', 'fecha_planificada_inicio', 'codigo_lote']
+    # ?paginacion=cursor: paginación por clave sobre este orden
+    pagination_class = PaginacionListados
+    orden_cursor = ('-fecha_creacion', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -475,7 +501,7 @@ class LoteViewSet(viewsets.ModelViewSet):
         lote = self.get_object()
         
         # Validar que solo se puedan cancelar lotes PLANIFICADOS
-        if lote.estado != 'PLANIFICADO':
+        if not transicion_permitida(lote, 'cancelar'):
             return Response(
                 {
                     'error': 'Solo se pueden cancelar lotes en estado PLANIFICADO',
@@ -492,18 +518,15 @@ class LoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Cancelar el lote
-        lote.estado = 'CANCELADO'
-        lote.cancelado_por = request.user
-        lote.fecha_cancelacion = timezone.now()
-        lote.motivo_cancelacion = motivo
-        
         # Adjuntar informaci�n para auditoria
         lote._usuario_actual = request.user
         lote._ip_address = self.get_client_ip(request)
         lote._user_agent = request.META.get('HTTP_USER_AGENT', '')
         
-        lote.save()
+        # Cancelar el lote (UPDATE condicional: falla si otro usuario cambió el estado)
+        if not transicionar(lote, 'cancelar', cancelado_por=request.user,
+                            fecha_cancelacion=timezone.now(), motivo_cancelacion=motivo):
+            return _conflicto_transicion(lote, 'El lote cambió de estado y ya no puede cancelarse')
         
         serializer = self.get_serializer(lote)
         return Response({
@@ -660,7 +683,7 @@ class LoteViewSet(viewsets.ModelViewSet):
         lote = self.get_object()
         
         # Validar que solo se puedan liberar lotes FINALIZADOS
-        if lote.estado != 'FINALIZADO':
+        if not transicion_permitida(lote, 'liberar'):
             return Response(
                 {
                     'error': 'Solo se pueden liberar lotes en estado FINALIZADO',
@@ -693,47 +716,50 @@ class LoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Crear firma electrónica
         import hashlib
         import json
         from django.utils import timezone
         
-        data_to_sign = {
-            'lote_id': lote.id,
-            'codigo_lote': lote.codigo_lote,
-            'producto': lote.producto.nombre,
-            'cantidad_producida': lote.cantidad_producida,
-            'cantidad_rechazada': lote.cantidad_rechazada,
-            'estado_anterior': lote.estado,
-            'estado_nuevo': 'LIBERADO',
-            'timestamp': timezone.now().isoformat()
-        }
-        
-        data_string = json.dumps(data_to_sign, sort_keys=True)
-        data_hash = hashlib.sha256(data_string.encode()).hexdigest()
-        password_hash = hashlib.sha256(f"{request.user.username}{password}{timezone.now().isoformat()}".encode()).hexdigest()
-        
-        firma = ElectronicSignature.objects.create(
-            user=request.user,
-            action='RELEASE',
-            meaning='RELEASED_BY',
-            content_type='Lote',
-            object_id=lote.id,
-            object_str=str(lote),
-            reason=motivo,
-            comments=comentarios,
-            data_hash=data_hash,
-            password_hash=password_hash,
-            ip_address=self.get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        
-        # Cambiar estado del lote
-        lote.estado = 'LIBERADO'
+        # Cambiar estado del lote y firmar en la misma transacción: si otro usuario
+        # cambió el estado, el UPDATE condicional no se aplica y no queda firma huérfana
         lote._usuario_actual = request.user
         lote._ip_address = self.get_client_ip(request)
         lote._user_agent = request.META.get('HTTP_USER_AGENT', '')
-        lote.save()
+        estado_anterior = lote.estado
+        with transaction.atomic():
+            if not transicionar(lote, 'liberar'):
+                return _conflicto_transicion(lote, 'El lote cambió de estado y ya no puede liberarse')
+            
+            # Crear firma electrónica
+            data_to_sign = {
+                'lote_id': lote.id,
+                'codigo_lote': lote.codigo_lote,
+                'producto': lote.producto.nombre,
+                'cantidad_producida': lote.cantidad_producida,
+                'cantidad_rechazada': lote.cantidad_rechazada,
+                'estado_anterior': estado_anterior,
+                'estado_nuevo': 'LIBERADO',
+                'timestamp': timezone.now().isoformat()
+            }
+        
+            data_string = json.dumps(data_to_sign, sort_keys=True)
+            data_hash = hashlib.sha256(data_string.encode()).hexdigest()
+            password_hash = hashlib.sha256(f"{request.user.username}{password}{timezone.now().isoformat()}".encode()).hexdigest()
+        
+            firma = ElectronicSignature.objects.create(
+                user=request.user,
+                action='RELEASE',
+                meaning='RELEASED_BY',
+                content_type='Lote',
+                object_id=lote.id,
+                object_str=str(lote),
+                reason=motivo,
+                comments=comentarios,
+                data_hash=data_hash,
+                password_hash=password_hash,
+                ip_address=self.get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
         
         # Crear notificación para el supervisor
         Notificacion.objects.create(
@@ -761,7 +787,7 @@ class LoteViewSet(viewsets.ModelViewSet):
         lote = self.get_object()
         
         # Validar que solo se puedan rechazar lotes FINALIZADOS
-        if lote.estado != 'FINALIZADO':
+        if not transicion_permitida(lote, 'rechazar'):
             return Response(
                 {
                     'error': 'Solo se pueden rechazar lotes en estado FINALIZADO',
@@ -794,47 +820,50 @@ class LoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Crear firma electrónica
         import hashlib
         import json
         from django.utils import timezone
         
-        data_to_sign = {
-            'lote_id': lote.id,
-            'codigo_lote': lote.codigo_lote,
-            'producto': lote.producto.nombre,
-            'cantidad_producida': lote.cantidad_producida,
-            'cantidad_rechazada': lote.cantidad_rechazada,
-            'estado_anterior': lote.estado,
-            'estado_nuevo': 'RECHAZADO',
-            'timestamp': timezone.now().isoformat()
-        }
-        
-        data_string = json.dumps(data_to_sign, sort_keys=True)
-        data_hash = hashlib.sha256(data_string.encode()).hexdigest()
-        password_hash = hashlib.sha256(f"{request.user.username}{password}{timezone.now().isoformat()}".encode()).hexdigest()
-        
-        firma = ElectronicSignature.objects.create(
-            user=request.user,
-            action='REJECT',
-            meaning='REJECTED_BY',
-            content_type='Lote',
-            object_id=lote.id,
-            object_str=str(lote),
-            reason=motivo,
-            comments=comentarios,
-            data_hash=data_hash,
-            password_hash=password_hash,
-            ip_address=self.get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        
-        # Cambiar estado del lote
-        lote.estado = 'RECHAZADO'
+        # Cambiar estado del lote y firmar en la misma transacción: si otro usuario
+        # cambió el estado, el UPDATE condicional no se aplica y no queda firma huérfana
         lote._usuario_actual = request.user
         lote._ip_address = self.get_client_ip(request)
         lote._user_agent = request.META.get('HTTP_USER_AGENT', '')
-        lote.save()
+        estado_anterior = lote.estado
+        with transaction.atomic():
+            if not transicionar(lote, 'rechazar'):
+                return _conflicto_transicion(lote, 'El lote cambió de estado y ya no puede rechazarse')
+            
+            # Crear firma electrónica
+            data_to_sign = {
+                'lote_id': lote.id,
+                'codigo_lote': lote.codigo_lote,
+                'producto': lote.producto.nombre,
+                'cantidad_producida': lote.cantidad_producida,
+                'cantidad_rechazada': lote.cantidad_rechazada,
+                'estado_anterior': estado_anterior,
+                'estado_nuevo': 'RECHAZADO',
+                'timestamp': timezone.now().isoformat()
+            }
+        
+            data_string = json.dumps(data_to_sign, sort_keys=True)
+            data_hash = hashlib.sha256(data_string.encode()).hexdigest()
+            password_hash = hashlib.sha256(f"{request.user.username}{password}{timezone.now().isoformat()}".encode()).hexdigest()
+        
+            firma = ElectronicSignature.objects.create(
+                user=request.user,
+                action='REJECT',
+                meaning='REJECTED_BY',
+                content_type='Lote',
+                object_id=lote.id,
+                object_str=str(lote),
+                reason=motivo,
+                comments=comentarios,
+                data_hash=data_hash,
+                password_hash=password_hash,
+                ip_address=self.get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
         
         # Crear notificación para el supervisor
         Notificacion.objects.create(
@@ -854,7 +883,7 @@ class LoteViewSet(viewsets.ModelViewSet):
         })
 
 
-class LoteEtapaViewSet(viewsets.ModelViewSet):
+class LoteEtapaViewSet(ControlVersionMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar Etapas de Lotes"""
     queryset = LoteEtapa.objects.select_related(
         'lote', 'etapa', 'maquina', 'operario'
@@ -887,6 +916,15 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
         else:
             perm_classes = [IsAdmin]
         return [p() for p in perm_classes]
+    
+    def get_client_ip(self, request):
+        """Obtiene la IP del cliente"""
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = request.META.get('REMOTE_ADDR')
+        return ip
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminOrOperario])
     def iniciar(self, request, pk=None):
@@ -897,7 +935,7 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
         lote_etapa = self.get_object()
 
         # Validar que solo se puedan iniciar etapas PENDIENTES
-        if lote_etapa.estado != 'PENDIENTE':
+        if not transicion_permitida(lote_etapa, 'iniciar'):
             return Response(
                 {
                     'error': 'Solo se pueden iniciar etapas en estado PENDIENTE',
@@ -906,17 +944,14 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Iniciar la etapa
-        lote_etapa.estado = 'EN_PROCESO'
-        lote_etapa.fecha_inicio = timezone.now()
-        lote_etapa.operario = request.user
-
         # Adjuntar informaci�n para auditoria
         lote_etapa._usuario_actual = request.user
         lote_etapa._ip_address = self.get_client_ip(request)
         lote_etapa._user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-        lote_etapa.save()
+        # Iniciar la etapa (UPDATE condicional: falla si otro operario ya la inició)
+        if not transicionar(lote_etapa, 'iniciar', fecha_inicio=timezone.now(), operario=request.user):
+            return _conflicto_transicion(lote_etapa, 'La etapa cambió de estado y ya no puede iniciarse')
 
         serializer = self.get_serializer(lote_etapa)
         return Response({
@@ -933,7 +968,7 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
         lote_etapa = self.get_object()
 
         # Validar que solo se puedan completar etapas EN_PROCESO
-        if lote_etapa.estado != 'EN_PROCESO':
+        if not transicion_permitida(lote_etapa, 'completar'):
             return Response(
                 {
                     'error': 'Solo se pueden completar etapas en estado EN_PROCESO',
@@ -995,24 +1030,23 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
         requiere_aprobacion_calidad = request.data.get('requiere_aprobacion_calidad', False)
 
         # Completar la etapa
-        lote_etapa.estado = 'COMPLETADO'
-        lote_etapa.fecha_fin = timezone.now()
-
+        valores = {'fecha_fin': timezone.now()}
         if cantidad_salida is not None:
-            lote_etapa.cantidad_salida = cantidad_salida
+            valores['cantidad_salida'] = cantidad_salida
         if cantidad_merma is not None:
-            lote_etapa.cantidad_merma = cantidad_merma
+            valores['cantidad_merma'] = cantidad_merma
         if observaciones:
-            lote_etapa.observaciones = observaciones
+            valores['observaciones'] = observaciones
         if requiere_aprobacion_calidad is not None:
-            lote_etapa.requiere_aprobacion_calidad = requiere_aprobacion_calidad
+            valores['requiere_aprobacion_calidad'] = requiere_aprobacion_calidad
 
         # Adjuntar informaci�n para auditoria
         lote_etapa._usuario_actual = request.user
         lote_etapa._ip_address = self.get_client_ip(request)
         lote_etapa._user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-        lote_etapa.save()
+        if not transicionar(lote_etapa, 'completar', **valores):
+            return _conflicto_transicion(lote_etapa, 'La etapa cambió de estado y ya no puede completarse')
 
         serializer = self.get_serializer(lote_etapa)
         return Response({
@@ -1029,7 +1063,7 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
         lote_etapa = self.get_object()
 
         # Validar que solo se puedan pausar etapas EN_PROCESO
-        if lote_etapa.estado != 'EN_PROCESO':
+        if not transicion_permitida(lote_etapa, 'pausar'):
             return Response(
                 {
                     'error': 'Solo se pueden pausar etapas en estado EN_PROCESO',
@@ -1046,16 +1080,15 @@ class LoteEtapaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Pausar la etapa
-        lote_etapa.estado = 'PAUSADO'
-        lote_etapa.observaciones = f"{lote_etapa.observaciones}\n\nPAUSADO: {motivo}".strip()
-
         # Adjuntar informaci�n para auditoria
         lote_etapa._usuario_actual = request.user
         lote_etapa._ip_address = self.get_client_ip(request)
         lote_etapa._user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-        lote_etapa.save()
+        # Pausar la etapa
+        observaciones = f"{lote_etapa.observaciones}\n\nPAUSADO: {motivo}".strip()
+        if not transicionar(lote_etapa, 'pausar', observaciones=observaciones):
+            return _conflicto_transicion(lote_etapa, 'La etapa cambió de estado y ya no puede pausarse')
 
         serializer = self.get_serializer(lote_etapa)
         return Response({
@@ -1157,6 +1190,75 @@ class ControlCalidadViewSet(viewsets.ModelViewSet):
 # INVENTARIO
 # ============================================
 
+def _lineas_utf8(archivo):
+    """Líneas del archivo decodificadas como UTF-8; un archivo en otra codificación es un ValueError"""
+    try:
+        yield from codecs.iterdecode(archivo, 'utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError('El archivo CSV debe estar codificado en UTF-8')
+
+
+def _filas_csv(archivo):
+    """
+    Filas (dict) de un CSV subido, leídas en streaming; separador , o ; (se detecta del
+    encabezado). Lanza ValueError si el archivo no es UTF-8 (también al iterar las filas).
+    """
+    texto = _lineas_utf8(archivo)
+    encabezado = next(texto, '')
+    separador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    return csv.DictReader(itertools.chain([encabezado], texto), delimiter=separador)
+
+
+def _anotar_stock_a_fecha(queryset, request, tipo_item):
+    """
+    Si la consulta trae ?as_of=YYYY-MM-DD (y opcionalmente &ubicacion=<id>), anota
+    stock_a_fecha: saldo al final de ese día según el último cierre de inventario
+    anterior más los movimientos posteriores.
+    """
+    as_of = request.query_params.get('as_of')
+    if not as_of:
+        return queryset
+    try:
+        fecha = datetime.strptime(as_of, '%Y-%m-%d').date()
+    except ValueError:
+        raise serializers.ValidationError({'as_of': 'Formato de fecha inválido (YYYY-MM-DD)'})
+    
+    ubicacion_id = request.query_params.get('ubicacion')
+    if ubicacion_id is not None:
+        if not ubicacion_id.isdigit():
+            raise serializers.ValidationError({'ubicacion': 'Debe ser el ID de una ubicación'})
+        ubicacion_id = int(ubicacion_id)
+    
+    return queryset.annotate(stock_a_fecha=stock_a_fecha_subquery(tipo_item, fecha, ubicacion_id))
+
+
+def _cobertura_max(request):
+    """Parámetro ?cobertura_max=<días> (None si no viene)"""
+    cobertura_max = request.query_params.get('cobertura_max')
+    if not cobertura_max:
+        return None
+    try:
+        dias = float(cobertura_max)
+    except ValueError:
+        dias = None
+    # float() también acepta 'nan' e 'inf', que no son una cantidad de días
+    if dias is None or not math.isfinite(dias):
+        raise serializers.ValidationError({'cobertura_max': 'Debe ser una cantidad de días'})
+    return dias
+
+
+def _anotar_pronostico(queryset, request, tipo_item):
+    """
+    Anota el pronóstico publicado (consumo diario, días de cobertura y punto de reorden
+    sugerido); con ?cobertura_max=<días> deja solo los ítems que se agotan antes.
+    """
+    queryset = queryset.annotate(**pronostico_subqueries(tipo_item))
+    cobertura_max = _cobertura_max(request)
+    if cobertura_max is not None:
+        queryset = queryset.filter(dias_cobertura__lte=cobertura_max)
+    return queryset
+
+
 class InsumoViewSet(viewsets.ModelViewSet):
     """ViewSet para gestionar Insumos"""
     queryset = Insumo.objects.select_related('categoria').all().order_by('codigo')
@@ -1166,7 +1268,8 @@ class InsumoViewSet(viewsets.ModelViewSet):
     ordering_fields = ['codigo', 'nombre']
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Stock aprobado desde SaldoInsumo (subconsulta): sin consultas extra por insumo
+        queryset = super().get_queryset().annotate(stock_aprobado=stock_aprobado_subquery())
         
         # Filtro por categor�a
         categoria_id = self.request.query_params.get('categoria', None)
@@ -1179,7 +1282,11 @@ class InsumoViewSet(viewsets.ModelViewSet):
             activo = activo.lower() == 'true'
             queryset = queryset.filter(activo=activo)
         
-        return queryset
+        # Pronóstico publicado: ?cobertura_max=<días>
+        queryset = _anotar_pronostico(queryset, self.request, 'INSUMO')
+        
+        # Stock histórico: ?as_of=YYYY-MM-DD[&ubicacion=<id>]
+        return _anotar_stock_a_fecha(queryset, self.request, 'INSUMO')
     
     def get_permissions(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -1187,6 +1294,35 @@ class InsumoViewSet(viewsets.ModelViewSet):
         else:
             perm_classes = [IsAdmin]
         return [p() for p in perm_classes]
+    
+    @action(detail=False, methods=['get'])
+    def requerimientos(self, request):
+        """
+        Endpoint: /api/insumos/requerimientos/?hasta=YYYY-MM-DD&solo_faltantes=true
+        Explosión de materiales (MRP) de los lotes planificados / en proceso contra el
+        stock aprobado, con la fecha del primer faltante de cada insumo.
+        """
+        hasta = request.query_params.get('hasta')
+        if hasta:
+            try:
+                hasta = datetime.strptime(hasta, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Formato de fecha inválido (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        solo_faltantes = request.query_params.get('solo_faltantes', 'false').lower() == 'true'
+        
+        return Response(explotar_requerimientos(hasta, solo_faltantes))
+    
+    @action(detail=False, methods=['get'])
+    def pronostico(self, request):
+        """
+        Endpoint: /api/insumos/pronostico/?cobertura_max=30
+        Pronóstico de consumo publicado (media móvil, suavizado exponencial), días de
+        cobertura y punto de reorden sugerido, de menor a mayor cobertura.
+        """
+        return Response(listar_pronosticos('INSUMO', _cobertura_max(request)))
 
 
 class LoteInsumoViewSet(viewsets.ModelViewSet):
@@ -1220,6 +1356,62 @@ class LoteInsumoViewSet(viewsets.ModelViewSet):
         else:
             perm_classes = [IsAdmin]
         return [p() for p in perm_classes]
+    
+    @action(detail=False, methods=['post'])
+    def recepcion(self, request):
+        """
+        Endpoint: /api/lotes-insumo/recepcion/
+        Recepción masiva de un remito / ASN: crea los lotes (en CUARENTENA) y sus movimientos
+        de ENTRADA en una sola transacción. Acepta un CSV en `archivo` (más los campos del
+        remito como form-data) o JSON {proveedor, numero_factura, fecha_recepcion,
+        ubicacion, referencia_documento, lineas: [...]}. Cada línea: insumo (código),
+        codigo_lote_proveedor, fecha_vencimiento, cantidad y opcionalmente ubicacion (código),
+        fecha_fabricacion, unidad, precio_unitario, proveedor, numero_factura.
+        Si alguna línea tiene error no se crea nada y se informan los errores por línea.
+        """
+        archivo = request.FILES.get('archivo')
+        if archivo:
+            filas = _filas_csv(archivo)
+        else:
+            filas = request.data.get('lineas')
+            if not isinstance(filas, list) or not filas:
+                return Response(
+                    {'error': 'Enviar un archivo CSV en `archivo` o `lineas` como lista JSON'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        cabecera = {
+            campo: request.data.get(campo)
+            for campo in ('proveedor', 'numero_factura', 'ubicacion', 'referencia_documento')
+        }
+        if request.data.get('fecha_recepcion'):
+            try:
+                cabecera['fecha_recepcion'] = datetime.strptime(request.data['fecha_recepcion'], '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'fecha_recepcion inválida (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # ValueError: CSV que no es UTF-8 (se detecta al leer las filas)
+        try:
+            lotes, errores = recibir_lotes(filas, request.user, cabecera)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if errores:
+            return Response({
+                'error': 'Recepción rechazada: corregir las líneas con error y volver a enviar',
+                'errores': errores
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': f'{len(lotes)} lotes recibidos en cuarentena',
+            'lotes_creados': len(lotes),
+            'lotes': [
+                {'id': lote.pk, 'insumo': lote.insumo_id, 'codigo_lote_proveedor': lote.codigo_lote_proveedor}
+                for lote in lotes
+            ]
+        }, status=status.HTTP_201_CREATED)
 
 
 class RepuestoViewSet(viewsets.ModelViewSet):
@@ -1244,7 +1436,11 @@ class RepuestoViewSet(viewsets.ModelViewSet):
             critico = critico.lower() == 'true'
             queryset = queryset.filter(critico=critico)
         
-        return queryset
+        # Pronóstico publicado: ?cobertura_max=<días>
+        queryset = _anotar_pronostico(queryset, self.request, 'REPUESTO')
+        
+        # Stock histórico: ?as_of=YYYY-MM-DD[&ubicacion=<id>]
+        return _anotar_stock_a_fecha(queryset, self.request, 'REPUESTO')
     
     def get_permissions(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -1252,6 +1448,15 @@ class RepuestoViewSet(viewsets.ModelViewSet):
         else:
             perm_classes = [IsAdmin]
         return [p() for p in perm_classes]
+    
+    @action(detail=False, methods=['get'])
+    def pronostico(self, request):
+        """
+        Endpoint: /api/repuestos/pronostico/?cobertura_max=30
+        Pronóstico de consumo publicado, días de cobertura y punto de reorden sugerido
+        según tiempo_reposicion_dias, de menor a mayor cobertura.
+        """
+        return Response(listar_pronosticos('REPUESTO', _cobertura_max(request)))
 
 
 class ProductoTerminadoViewSet(viewsets.ModelViewSet):
@@ -1282,6 +1487,107 @@ class ProductoTerminadoViewSet(viewsets.ModelViewSet):
         return [p() for p in perm_classes]
 
 
+class ConteoFisicoViewSet(viewsets.ModelViewSet):
+    """ViewSet para gestionar Conteos Físicos: carga masiva de líneas, conciliación y aprobación"""
+    queryset = ConteoFisico.objects.select_related(
+        'ubicacion', 'responsable'
+    ).annotate(total_lineas=Count('lineas')).order_by('-fecha_planificada')
+    serializer_class = ConteoFisicoSerializer
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ['codigo']
+    ordering_fields = ['fecha_planificada', 'codigo']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        
+        # Filtro por estado
+        estado = self.request.query_params.get('estado', None)
+        if estado:
+            queryset = queryset.filter(estado=estado.upper())
+        
+        # Filtro por tipo
+        tipo = self.request.query_params.get('tipo', None)
+        if tipo:
+            queryset = queryset.filter(tipo=tipo.upper())
+        
+        return queryset
+    
+    def get_permissions(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            perm_classes = [permissions.IsAuthenticated]
+        elif self.action == 'lineas':
+            # Las líneas las cargan los operarios de depósito
+            perm_classes = [IsAdminOrOperario]
+        else:
+            perm_classes = [IsAdminOrSupervisor]
+        return [p() for p in perm_classes]
+    
+    @action(detail=True, methods=['post'])
+    def lineas(self, request, pk=None):
+        """
+        Endpoint: /api/conteos-fisicos/{id}/lineas/
+        Carga masiva de líneas: archivo CSV (campo `archivo`, separador , o ;) o JSON
+        (lista o {"lineas": [...]}) con tipo_item, item_id, lote_item_id, posicion, cantidad.
+        El CSV se procesa en tandas sin cargarlo completo en memoria. Todo o nada.
+        """
+        conteo = self.get_object()
+        
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            filas = request.data.get('lineas') if isinstance(request.data, dict) else request.data
+            if not isinstance(filas, list):
+                return Response(
+                    {'error': 'Enviar un archivo CSV en `archivo` o una lista JSON de líneas'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # ValueError: conteo cerrado o CSV que no es UTF-8 (se detecta al leer)
+        try:
+            if archivo:
+                filas = _filas_csv(archivo)
+            cargadas, errores = cargar_lineas(conteo, filas, request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if errores:
+            return Response({
+                'error': 'Carga rechazada: corregir las líneas con error y volver a enviar',
+                'errores': errores
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': f'{cargadas} líneas cargadas',
+            'lineas_cargadas': cargadas
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'])
+    def conciliacion(self, request, pk=None):
+        """
+        Endpoint: /api/conteos-fisicos/{id}/conciliacion/?solo_diferencias=true
+        Reporte de diferencias contra el stock en libros por lote de insumo y repuesto
+        """
+        conteo = self.get_object()
+        solo_diferencias = request.query_params.get('solo_diferencias', 'false').lower() == 'true'
+        return Response(conciliar_conteo(conteo, solo_diferencias))
+    
+    @action(detail=True, methods=['post'])
+    def aprobar(self, request, pk=None):
+        """
+        Endpoint: /api/conteos-fisicos/{id}/aprobar/
+        Registra los ajustes (MovimientoInventario AJUSTE) de todas las diferencias y completa el conteo
+        """
+        conteo = self.get_object()
+        try:
+            ajustes = aprobar_conteo(conteo, request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': f'Conteo {conteo.codigo} aprobado: {ajustes} ajustes registrados',
+            'ajustes': ajustes
+        })
+
+
 # ============================================
 # MANTENIMIENTO
 # ============================================
@@ -1299,7 +1605,7 @@ class TipoMantenimientoViewSet(viewsets.ModelViewSet):
         return [p() for p in perm_classes]
 
 
-class OrdenTrabajoViewSet(viewsets.ModelViewSet):
+class OrdenTrabajoViewSet(ControlVersionMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar �rdenes de Trabajo"""
     queryset = OrdenTrabajo.objects.select_related(
         'tipo', 'maquina', 'creada_por', 'asignada_a'
@@ -1361,7 +1667,7 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
         """Endpoint: /api/ordenes-trabajo/{id}/asignar/"""
         ot = self.get_object()
         
-        if ot.estado not in ['ABIERTA', 'ASIGNADA']:
+        if not transicion_permitida(ot, 'asignar'):
             return Response(
                 {'error': f'No se puede asignar una OT en estado {ot.get_estado_display()}'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -1382,9 +1688,8 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        ot.asignada_a = tecnico
-        ot.estado = 'ASIGNADA'
-        ot.save()
+        if not transicionar(ot, 'asignar', asignada_a=tecnico):
+            return _conflicto_transicion(ot, 'La OT cambió de estado y ya no puede asignarse')
         
         serializer = self.get_serializer(ot)
         return Response({
@@ -1404,16 +1709,15 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        if ot.estado not in ['ASIGNADA', 'PAUSADA']:
+        if not transicion_permitida(ot, 'iniciar'):
             return Response(
                 {'error': f'No se puede iniciar una OT en estado {ot.get_estado_display()}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        ot.estado = 'EN_PROCESO'
-        if not ot.fecha_inicio:
-            ot.fecha_inicio = timezone.now()
-        ot.save()
+        valores = {} if ot.fecha_inicio else {'fecha_inicio': timezone.now()}
+        if not transicionar(ot, 'iniciar', **valores):
+            return _conflicto_transicion(ot, 'La OT cambió de estado y ya no puede iniciarse')
         
         serializer = self.get_serializer(ot)
         return Response({
@@ -1426,7 +1730,7 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
         """Endpoint: /api/ordenes-trabajo/{id}/pausar/"""
         ot = self.get_object()
         
-        if ot.estado != 'EN_PROCESO':
+        if not transicion_permitida(ot, 'pausar'):
             return Response(
                 {'error': 'Solo se pueden pausar OT en proceso'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -1439,9 +1743,9 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        ot.estado = 'PAUSADA'
-        ot.observaciones = f"{ot.observaciones}\n\nPAUSADA: {motivo} ({timezone.now()})".strip()
-        ot.save()
+        observaciones = f"{ot.observaciones}\n\nPAUSADA: {motivo} ({timezone.now()})".strip()
+        if not transicionar(ot, 'pausar', observaciones=observaciones):
+            return _conflicto_transicion(ot, 'La OT cambió de estado y ya no puede pausarse')
         
         serializer = self.get_serializer(ot)
         return Response({
@@ -1454,7 +1758,7 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
         """Endpoint: /api/ordenes-trabajo/{id}/completar/"""
         ot = self.get_object()
         
-        if ot.estado not in ['EN_PROCESO', 'PAUSADA']:
+        if not transicion_permitida(ot, 'completar'):
             return Response(
                 {'error': f'No se puede completar una OT en estado {ot.get_estado_display()}'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -1469,15 +1773,16 @@ class OrdenTrabajoViewSet(viewsets.ModelViewSet):
         
         costo_real = request.data.get('costo_real')
         
-        ot.estado = 'COMPLETADA'
-        ot.fecha_fin = timezone.now()
-        ot.trabajo_realizado = trabajo_realizado
-        ot.completada_por = request.user
-        
+        valores = {
+            'fecha_fin': timezone.now(),
+            'trabajo_realizado': trabajo_realizado,
+            'completada_por': request.user,
+        }
         if costo_real:
-            ot.costo_real = costo_real
+            valores['costo_real'] = costo_real
         
-        ot.save()
+        if not transicionar(ot, 'completar', **valores):
+            return _conflicto_transicion(ot, 'La OT cambió de estado y ya no puede completarse')
         
         serializer = self.get_serializer(ot)
         return Response({
@@ -1647,6 +1952,9 @@ class ElectronicSignatureViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['timestamp']
+    # ?paginacion=cursor: paginación por clave sobre este orden
+    pagination_class = PaginacionListados
+    orden_cursor = ('-timestamp', '-id')
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1723,6 +2031,9 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['referencia_documento', 'observaciones']
     ordering_fields = ['fecha_movimiento', 'cantidad']
+    # ?paginacion=cursor: paginación por clave sobre este orden
+    pagination_class = PaginacionListados
+    orden_cursor = ('-fecha_movimiento', '-id')
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1747,6 +2058,9 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.request.method in permissions.SAFE_METHODS:
             perm_classes = [permissions.IsAuthenticated]
+        elif self.action == 'asignar_fefo':
+            # El dispensado lo realizan los operarios
+            perm_classes = [IsAdminOrOperario]
         else:
             perm_classes = [IsAdminOrSupervisor]
         return [p() for p in perm_classes]
@@ -1757,7 +2071,13 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
         if data['tipo_movimiento'] == 'SALIDA' and data['tipo_item'] == 'INSUMO':
             self._validar_fefo(data)
         
-        serializer.save(registrado_por=self.request.user)
+        # Registrar el movimiento y aplicarlo al lote de insumo en una sola transacción
+        with transaction.atomic():
+            movimiento = serializer.save(registrado_por=self.request.user)
+            try:
+                aplicar_movimiento(movimiento)
+            except ValueError as e:
+                raise serializers.ValidationError({'lote_item_id': str(e)})
     
     def _validar_fefo(self, data):
         """Validar que se respete FEFO (First Expired, First Out)"""
@@ -1783,23 +2103,55 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
                         'lote_item_id': 'FEFO violado: existen lotes con vencimiento anterior que deben usarse primero'
                     })
     
-    @action(detail=False, methods=['get'])
-    def resumen(self, request):
-        """Endpoint: /api/movimientos/resumen/ - Resumen de inventario"""
-        tipo_item = request.query_params.get('tipo_item', 'INSUMO')
-        
-        # Calcular stock actual por item
-        from django.db.models import Sum, Case, When, IntegerField
+    @action(detail=False, methods=['post'])
+    def asignar_fefo(self, request):
+        """
+        Endpoint: /api/movimientos/asignar_fefo/
+        Dispensa un insumo para un lote de producción: reparte la cantidad entre los
+        lotes aprobados en orden FEFO, descuenta el stock y registra movimientos y consumos.
+        Body: {insumo, cantidad, lote_produccion, lote_etapa?, referencia_documento?}
+        """
+        entrada = AsignacionFEFOSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        data = entrada.validated_data
+        lote_produccion = data['lote_produccion']
         
-        movimientos = MovimientoInventario.objects.filter(tipo_item=tipo_item)
+        try:
+            asignaciones = asignar_fefo(
+                insumo_id=data['insumo'].id,
+                cantidad=data['cantidad'],
+                lote_produccion_id=lote_produccion.id,
+                usuario=request.user,
+                lote_etapa_id=data['lote_etapa'].id if data.get('lote_etapa') else None,
+                referencia_documento=data.get('referencia_documento') or lote_produccion.codigo_lote,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         
-        # Aquí iría lógica más compleja para calcular stock actual
-        # Por ahora retornamos estructura básica
         return Response({
-            'tipo_item': tipo_item,
-            'total_movimientos': movimientos.count(),
-            'message': 'Endpoint en desarrollo - usar modelos específicos (Insumo, Repuesto) para stock actual'
-        })
+            'message': f'{data["cantidad"]} asignados en {len(asignaciones)} lote(s)',
+            'asignaciones': asignaciones
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        """
+        Endpoint: /api/movimientos/resumen/?tipo_item=INSUMO&desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+        Resumen de inventario por ítem: saldo inicial/final, entradas y salidas por motivo
+        (parte del último cierre de inventario anterior a `desde`). Por defecto, últimos 30 días.
+        """
+        tipo_item = request.query_params.get('tipo_item', 'INSUMO').upper()
+        
+        try:
+            hasta = request.query_params.get('hasta')
+            hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else timezone.localdate()
+            desde = request.query_params.get('desde')
+            desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else hasta - timedelta(days=30)
+            if desde > hasta:
+                raise ValueError('desde debe ser anterior o igual a hasta')
+            return Response(resumen_movimientos(tipo_item, desde, hasta))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 # ============================================
@@ -1808,8 +2160,36 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
 
 from rest_framework.views import APIView
 from django.db.models import Avg, F, ExpressionWrapper, fields as django_fields
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 import csv
+import json
+
+from .kpis import calcular_oee_resumen, obtener_dashboard, filas_export_lotes, COLUMNAS_EXPORT_LOTES, serie_kpis
+from .intervalos import disponibilidad_maquinas
+from .estadisticas import estadisticas_agrupadas
+
+
+def _rango_fechas_kpi(request):
+    """
+    Obtiene el rango desde/hasta (YYYY-MM-DD) de los query params.
+    Por defecto, últimos 7 días.
+    """
+    desde = request.query_params.get('desde')
+    hasta = request.query_params.get('hasta')
+    
+    if not desde:
+        desde = (timezone.now() - timedelta(days=7)).date()
+    else:
+        desde = datetime.strptime(desde, '%Y-%m-%d').date()
+    
+    if not hasta:
+        hasta = timezone.now().date()
+    else:
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date()
+    
+    return desde, hasta
+
 
 class KpiOEEView(APIView):
     """
@@ -1820,229 +2200,126 @@ class KpiOEEView(APIView):
     
     def get(self, request):
         # Parámetros
-        desde = request.query_params.get('desde')
-        hasta = request.query_params.get('hasta')
+        desde, hasta = _rango_fechas_kpi(request)
         turno = request.query_params.get('turno')
         
-        # Por defecto, últimos 7 días
-        if not desde:
-            desde = (timezone.now() - timedelta(days=7)).date()
-        else:
-            desde = datetime.strptime(desde, '%Y-%m-%d').date()
-        
-        if not hasta:
-            hasta = timezone.now().date()
-        else:
-            hasta = datetime.strptime(hasta, '%Y-%m-%d').date()
-        
-        # Filtrar lotes en el rango
-        lotes = Lote.objects.filter(
-            fecha_real_inicio__date__gte=desde,
-            fecha_real_inicio__date__lte=hasta,
-            estado__in=['FINALIZADO', 'LIBERADO']
-        )
-        
-        if turno:
-            lotes = lotes.filter(turno__codigo=turno)
-        
-        # Calcular métricas
-        total_lotes = lotes.count()
+        return Response(calcular_oee_resumen(desde, hasta, turno))
+
+
+class KpiSeriesView(APIView):
+    """
+    Series de KPIs por intervalo de tiempo, agrupadas opcionalmente
+    GET /api/kpis/series/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&granularity=hour|turno|day|week|month&group_by=producto|maquina|turno&turno=M
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        desde, hasta = _rango_fechas_kpi(request)
         
-        if total_lotes == 0:
-            return Response({
-                'desde': desde,
-                'hasta': hasta,
-                'turno': turno,
-                'total_lotes': 0,
-                'oee': 0,
-                'disponibilidad': 0,
-                'rendimiento': 0,
-                'calidad': 0,
-                'message': 'No hay lotes finalizados en el período seleccionado'
-            })
+        try:
+            data = serie_kpis(
+                desde, hasta,
+                granularidad=request.query_params.get('granularity', 'day'),
+                agrupar=request.query_params.get('group_by'),
+                turno=request.query_params.get('turno')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 1. DISPONIBILIDAD: Tiempo operativo / Tiempo planificado
-        # Calcular tiempo planificado y tiempo real
-        tiempo_planificado_total = 0
-        tiempo_real_total = 0
-        tiempo_paradas_total = 0
+        return Response(data)
+
+
+class KpiEstadisticasView(APIView):
+    """
+    Estadísticas de distribución (p50/p90/p99, desviación, atípicos) por grupo
+    GET /api/kpis/estadisticas/?metrica=duracion_minutos&group_by=maquina&desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    metrica: rendimiento_lote | rendimiento_etapa | duracion_minutos | cantidad_merma
+    group_by: producto | etapa | maquina
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        desde, hasta = _rango_fechas_kpi(request)
+        metrica = request.query_params.get('metrica', 'duracion_minutos')
+        agrupar = request.query_params.get('group_by', 'producto')
         
-        for lote in lotes:
-            if lote.fecha_planificada_inicio and lote.fecha_planificada_fin:
-                tiempo_planificado = (lote.fecha_planificada_fin - lote.fecha_planificada_inicio).total_seconds() / 3600
-                tiempo_planificado_total += tiempo_planificado
-            
-            if lote.fecha_real_inicio and lote.fecha_real_fin:
-                tiempo_real = (lote.fecha_real_fin - lote.fecha_real_inicio).total_seconds() / 3600
-                tiempo_real_total += tiempo_real
-            
-            # Sumar tiempo de paradas de todas las etapas del lote
-            paradas = Parada.objects.filter(
-                lote_etapa__lote=lote,
-                fecha_fin__isnull=False
-            )
-            for parada in paradas:
-                if parada.duracion_minutos:
-                    tiempo_paradas_total += parada.duracion_minutos / 60
-        
-        tiempo_operativo = tiempo_real_total - tiempo_paradas_total
-        disponibilidad = (tiempo_operativo / tiempo_planificado_total * 100) if tiempo_planificado_total > 0 else 0
-        
-        # 2. RENDIMIENTO: Cantidad producida / Cantidad planificada
-        cantidad_planificada_total = lotes.aggregate(Sum('cantidad_planificada'))['cantidad_planificada__sum'] or 0
-        cantidad_producida_total = lotes.aggregate(Sum('cantidad_producida'))['cantidad_producida__sum'] or 0
-        rendimiento = (cantidad_producida_total / cantidad_planificada_total * 100) if cantidad_planificada_total > 0 else 0
-        
-        # 3. CALIDAD: Buenos / Total producido
-        cantidad_rechazada_total = lotes.aggregate(Sum('cantidad_rechazada'))['cantidad_rechazada__sum'] or 0
-        cantidad_buena = cantidad_producida_total - cantidad_rechazada_total
-        calidad = (cantidad_buena / cantidad_producida_total * 100) if cantidad_producida_total > 0 else 0
-        
-        # OEE = Disponibilidad × Rendimiento × Calidad
-        oee = (disponibilidad / 100) * (rendimiento / 100) * (calidad / 100) * 100
-        
-        # Datos para series de tiempo (opcional, por día)
-        series = []
-        current_date = desde
-        while current_date <= hasta:
-            lotes_dia = lotes.filter(fecha_real_inicio__date=current_date)
-            if lotes_dia.exists():
-                series.append({
-                    'fecha': current_date.isoformat(),
-                    'lotes': lotes_dia.count(),
-                    'cantidad_producida': lotes_dia.aggregate(Sum('cantidad_producida'))['cantidad_producida__sum'] or 0
-                })
-            current_date += timedelta(days=1)
+        try:
+            grupos = estadisticas_agrupadas(metrica, agrupar, desde, hasta)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'desde': desde,
             'hasta': hasta,
-            'turno': turno,
-            'total_lotes': total_lotes,
-            'oee': round(oee, 2),
-            'disponibilidad': round(disponibilidad, 2),
-            'rendimiento': round(rendimiento, 2),
-            'calidad': round(calidad, 2),
-            'metricas': {
-                'tiempo_planificado_horas': round(tiempo_planificado_total, 2),
-                'tiempo_real_horas': round(tiempo_real_total, 2),
-                'tiempo_paradas_horas': round(tiempo_paradas_total, 2),
-                'tiempo_operativo_horas': round(tiempo_operativo, 2),
-                'cantidad_planificada': cantidad_planificada_total,
-                'cantidad_producida': cantidad_producida_total,
-                'cantidad_rechazada': cantidad_rechazada_total,
-                'cantidad_buena': cantidad_buena
-            },
-            'series': series
+            'metrica': metrica,
+            'group_by': agrupar,
+            'grupos': grupos
         })
 
 
-class KpiDashboardView(APIView):
+class KpiMaquinasView(APIView):
     """
-    Vista para resumen del dashboard
-    GET /api/kpis/resumen_dashboard/
+    Vista de disponibilidad por máquina (intervalos de marcha/parada fusionados)
+    GET /api/kpis/maquinas/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&maquina=COD&tipo=COMPRESION
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        # Calcular métricas del dashboard
-        hoy = timezone.now().date()
-        
-        # Lotes activos
-        lotes_activos = Lote.objects.filter(
-            estado__in=['EN_PROCESO', 'PAUSADO']
-        ).count()
+        desde, hasta = _rango_fechas_kpi(request)
         
-        # Lotes de hoy
-        lotes_hoy = Lote.objects.filter(
-            fecha_real_inicio__date=hoy
-        ).count()
-        
-        # Incidentes abiertos
-        incidentes_abiertos = Incidente.objects.exclude(
-            estado='CERRADO'
-        ).count()
-        
-        # Incidentes críticos
-        incidentes_criticos = Incidente.objects.filter(
-            severidad='CRITICA',
-            estado__in=['ABIERTO', 'EN_INVESTIGACION']
-        ).count()
-        
-        # OT abiertas
-        ot_abiertas = OrdenTrabajo.objects.exclude(
-            estado__in=['COMPLETADA', 'CANCELADA']
-        ).count()
-        
-        # OT urgentes
-        ot_urgentes = OrdenTrabajo.objects.filter(
-            prioridad='URGENTE',
-            estado__in=['ABIERTA', 'ASIGNADA', 'EN_PROCESO']
-        ).count()
-        
-        # OEE de los últimos 7 días (llamar a la función de OEE)
-        desde = hoy - timedelta(days=7)
-        lotes_semana = Lote.objects.filter(
-            fecha_real_inicio__date__gte=desde,
-            estado__in=['FINALIZADO', 'LIBERADO']
-        )
+        maquinas = Maquina.objects.filter(activa=True)
+        maquina = request.query_params.get('maquina')
+        if maquina:
+            maquinas = maquinas.filter(codigo=maquina)
+        tipo = request.query_params.get('tipo')
+        if tipo:
+            maquinas = maquinas.filter(tipo=tipo)
         
-        if lotes_semana.exists():
-            cantidad_planificada = lotes_semana.aggregate(Sum('cantidad_planificada'))['cantidad_planificada__sum'] or 0
-            cantidad_producida = lotes_semana.aggregate(Sum('cantidad_producida'))['cantidad_producida__sum'] or 0
-            cantidad_rechazada = lotes_semana.aggregate(Sum('cantidad_rechazada'))['cantidad_rechazada__sum'] or 0
-            
-            rendimiento_semana = (cantidad_producida / cantidad_planificada * 100) if cantidad_planificada > 0 else 0
-            calidad_semana = ((cantidad_producida - cantidad_rechazada) / cantidad_producida * 100) if cantidad_producida > 0 else 0
-            
-            # Disponibilidad simplificada (sin paradas detalladas)
-            disponibilidad_semana = 85.0  # Valor por defecto si no calculamos con paradas
-            
-            oee_semana = (disponibilidad_semana / 100) * (rendimiento_semana / 100) * (calidad_semana / 100) * 100
-        else:
-            oee_semana = 0
-            disponibilidad_semana = 0
-            rendimiento_semana = 0
-            calidad_semana = 0
+        resultados = disponibilidad_maquinas(desde, hasta, maquinas)
         
         return Response({
-            'fecha': hoy,
-            'lotes': {
-                'activos': lotes_activos,
-                'hoy': lotes_hoy,
-                'total': Lote.objects.count()
-            },
-            'incidentes': {
-                'abiertos': incidentes_abiertos,
-                'criticos': incidentes_criticos,
-                'total': Incidente.objects.count()
-            },
-            'ordenes_trabajo': {
-                'abiertas': ot_abiertas,
-                'urgentes': ot_urgentes,
-                'total': OrdenTrabajo.objects.count()
-            },
-            'oee_7_dias': {
-                'oee': round(oee_semana, 2),
-                'disponibilidad': round(disponibilidad_semana, 2),
-                'rendimiento': round(rendimiento_semana, 2),
-                'calidad': round(calidad_semana, 2)
-            }
+            'desde': desde,
+            'hasta': hasta,
+            'total_maquinas': len(resultados),
+            'maquinas': resultados
         })
 
 
+class KpiDashboardView(APIView):
+    """
+    Vista para resumen del dashboard (snapshot en caché, invalidado por señales)
+    GET /api/kpis/resumen_dashboard/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        return Response(obtener_dashboard())
+
+
+class _EcoCSV:
+    """Pseudo-buffer para csv.writer: devuelve cada línea en vez de almacenarla"""
+    
+    def write(self, value):
+        return value
+
+
 class KpiExportCSVView(APIView):
     """
     Vista para exportar KPIs en CSV
     GET /api/kpis/export.csv?desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    
+    Detalle por lote (streaming, memoria constante):
+    GET /api/kpis/export.csv?detalle=lotes&formato=csv|ndjson&desde=...&hasta=...&turno=M
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
         # Obtener datos de OEE
-        kpi_view = KpiOEEView()
-        kpi_view.request = request
-        response_data = kpi_view.get(request).data
+        desde, hasta = _rango_fechas_kpi(request)
+        
+        if request.query_params.get('detalle') == 'lotes':
+            return self._export_lotes(request, desde, hasta)
+        response_data = calcular_oee_resumen(desde, hasta, request.query_params.get('turno'))
         
         # Crear respuesta CSV
         response = HttpResponse(content_type='text/csv')
@@ -2077,6 +2354,72 @@ class KpiExportCSVView(APIView):
                 writer.writerow([item['fecha'], item['lotes'], item['cantidad_producida']])
         
         return response
+    
+    def _export_lotes(self, request, desde, hasta):
+        """Exporta una fila por lote con StreamingHttpResponse (CSV o NDJSON)"""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in ('csv', 'ndjson'):
+            return Response(
+                {'error': 'formato debe ser csv o ndjson'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filas = filas_export_lotes(desde, hasta, request.query_params.get('turno'))
+        nombre = f'kpis_lotes_{desde:%Y%m%d}_{hasta:%Y%m%d}'
+        
+        if formato == 'ndjson':
+            contenido = (json.dumps(fila, cls=DjangoJSONEncoder) + '\n' for fila in filas)
+            response = StreamingHttpResponse(contenido, content_type='application/x-ndjson')
+            response['Content-Disposition'] = f'attachment; filename="{nombre}.ndjson"'
+            return response
+        
+        writer = csv.writer(_EcoCSV())
+        
+        def contenido_csv():
+            yield writer.writerow(COLUMNAS_EXPORT_LOTES)
+            for fila in filas:
+                yield writer.writerow([fila[columna] for columna in COLUMNAS_EXPORT_LOTES])
+        
+        response = StreamingHttpResponse(contenido_csv(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+        return response
+
+
+# ============================================
+# TRAZABILIDAD DE LOTES
+# ============================================
+
+from .trazabilidad import traza_adelante, traza_atras
+
+
+class TrazabilidadLoteInsumoView(APIView):
+    """
+    Traza hacia adelante de un lote de insumo (recall): lotes de producción y productos
+    terminados que lo consumieron, con cantidades y ubicaciones
+    GET /api/trazabilidad/lote-insumo/<id>/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            return Response(traza_adelante(pk))
+        except LoteInsumo.DoesNotExist:
+            return Response({'error': 'Lote de insumo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class TrazabilidadLoteView(APIView):
+    """
+    Traza hacia atrás de un lote de producción: lotes de insumo consumidos,
+    con proveedor, ubicación y cantidades
+    GET /api/trazabilidad/lote/<id>/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            return Response(traza_atras(pk))
+        except Lote.DoesNotExist:
+            return Response({'error': 'Lote no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
 
 # ============================================
@@ -2193,8 +2536,10 @@ class AuditoriaGenericaView(APIView):
     """
     Vista para consultar logs de auditoría de cualquier modelo
     GET /api/auditoria?modelo=Lote&objeto_id=123&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&usuario=1
+    Con &paginacion=cursor recorre todos los logs por páginas (en lugar de los últimos 100)
     """
     permission_classes = [permissions.IsAuthenticated]
+    orden_cursor = ('-fecha', '-id')
     
     def get(self, request):
         # Parámetros de filtro
@@ -2230,8 +2575,15 @@ class AuditoriaGenericaView(APIView):
         if accion:
             logs = logs.filter(accion=accion.upper())
         
+        logs = logs.select_related('usuario')
+        
+        paginador = PaginacionListados()
+        if request.query_params.get('paginacion') == 'cursor' or paginador.cursor_query_param in request.query_params:
+            pagina = paginador.paginate_queryset(logs, request, self)
+            return paginador.get_paginated_response(LogAuditoriaSerializer(pagina, many=True).data)
+        
         # Limitar y ordenar
-        logs = logs.select_related('usuario').order_by('-fecha')[:100]
+        logs = logs.order_by('-fecha')[:100]
         
         # Serializar
         serializer = LogAuditoriaSerializer(logs, many=True)